@@ -1,21 +1,41 @@
-from flask import Flask, request, jsonify
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from flask import Blueprint, Flask, g, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import json
 import uuid
 from typing import List, Dict, Any, Optional, Tuple
 import os
 import logging
 import re
-from flasgger import Swagger
+import queue
+import threading
+import atexit
+import bisect
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from functools import lru_cache
 import hashlib
+import hmac
+import itertools
+import gzip
+import io
+import sqlite3
+import tempfile
+import base64
+import secrets
 
-# Neo4j imports
-from neo4j import GraphDatabase
+from metrics import MetricsRegistry
+from migrations import LATEST_VERSION, ensure_schema
+import rate_limit_storage  # registers the sqlite:// rate-limit storage scheme
+from nlu_engine import EntityExtractor, KeywordAutomaton, LinearIntentModel, ResponseTemplate, load_domain_responses, load_keyword_table
 
 # Load environment variables
 load_dotenv()
@@ -34,8 +54,68 @@ class Config:
     CONFIDENCE_THRESHOLD = 0.5
     CONTEXT_WINDOW_SIZE = 6
     MAX_RESPONSE_LENGTH = 200
-    SESSION_TIMEOUT_HOURS = 24
+    SESSION_TIMEOUT_HOURS = float(os.getenv('SESSION_TIMEOUT_HOURS', '24'))
     TOPIC_OVERLAP_THRESHOLD = 0.5
+    # Session storage backend: neo4j, sqlite (one WAL file shared by the host's workers) or memory (per process)
+    SESSION_STORE = os.getenv('SESSION_STORE', 'neo4j').lower()
+    SESSION_STORE_PATH = os.getenv('SESSION_STORE_PATH', 'chatbot.db')
+    # Session lifecycle: seconds between in-process passes that expire sessions idle for SESSION_TIMEOUT_HOURS. Off by
+    # default: every worker would run its own pass, so deployments run archive_sessions.py from cron on one host instead.
+    SESSION_LIFECYCLE_INTERVAL = float(os.getenv('SESSION_LIFECYCLE_INTERVAL', '0'))
+    SESSION_LIFECYCLE_BATCH_SIZE = int(os.getenv('SESSION_LIFECYCLE_BATCH_SIZE', '100'))
+    # Cold storage for expired sessions' messages (unset: sessions are only marked expired); gzip, or zstd with the zstandard package
+    SESSION_ARCHIVE_DIR = os.getenv('SESSION_ARCHIVE_DIR') or None
+    SESSION_ARCHIVE_COMPRESSION = os.getenv('SESSION_ARCHIVE_COMPRESSION', 'gzip').lower()
+    # Write-behind message persistence (opt-in)
+    WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'false').lower() == 'true'
+    WRITE_BEHIND_QUEUE_SIZE = int(os.getenv('WRITE_BEHIND_QUEUE_SIZE', '10000'))
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '500'))
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '0.05'))
+    WRITE_BEHIND_PUT_TIMEOUT = float(os.getenv('WRITE_BEHIND_PUT_TIMEOUT', '5.0'))
+    WRITE_BEHIND_MAX_RETRIES = 3
+    # In-process session context cache (0 disables)
+    CONTEXT_CACHE_SIZE = int(os.getenv('CONTEXT_CACHE_SIZE', '10000'))
+    # Rasa NLU training data; its keywords_<intent> lookup tables feed the keyword classifier
+    NLU_DATA_PATH = os.getenv('NLU_DATA_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nlu.yml'))
+    # Rasa domain whose utter_<intent>_<variant> responses are the bot's replies; re-read when it changes (0 disables)
+    DOMAIN_PATH = os.getenv('DOMAIN_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'domain.yaml'))
+    RESPONSES_RELOAD_INTERVAL = float(os.getenv('RESPONSES_RELOAD_INTERVAL', '2.0'))
+    # Intent backend: 'keyword' or 'linear' (TF-IDF model built by train_intent_model.py)
+    INTENT_CLASSIFIER = os.getenv('INTENT_CLASSIFIER', 'keyword').lower()
+    INTENT_MODEL_PATH = os.getenv('INTENT_MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'intent_model.npz'))
+    # Seconds between flushes of in-process analytics counter deltas to the Stats node
+    ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '1.0'))
+    # Records per fetch when streaming grouped analytics results out of Neo4j
+    ANALYTICS_FETCH_SIZE = int(os.getenv('ANALYTICS_FETCH_SIZE', '1000'))
+    # History pages and streamed exports
+    MAX_HISTORY_PAGE_SIZE = 500
+    # Largest count /api/session/bulk-create hands out per request
+    MAX_BULK_SESSIONS = int(os.getenv('MAX_BULK_SESSIONS', '1000'))
+    # Signs issued session ids, so /context can tell an id it handed out from a made-up one before either is stored.
+    # Unset, each process picks its own (gunicorn.conf.py shares one across its workers); set it for several hosts,
+    # several ASGI workers, or issued ids that should stay valid across a restart.
+    SESSION_ID_SECRET = os.getenv('SESSION_ID_SECRET') or secrets.token_hex(32)
+    EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '500'))
+    # Rollup compaction (compact_rollups.py): minute buckets older than this become hourly, hourly ones daily
+    ROLLUP_MINUTE_RETENTION_HOURS = int(os.getenv('ROLLUP_MINUTE_RETENTION_HOURS', '48'))
+    ROLLUP_HOUR_RETENTION_DAYS = int(os.getenv('ROLLUP_HOUR_RETENTION_DAYS', '30'))
+    # Startup only reads the schema version; when it is behind, apply migrations under the lock (false: just warn)
+    AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', 'true').lower() == 'true'
+    # Build the classifier and generator in create_app() so forked workers (gunicorn --preload) share them
+    PRELOAD_COMPONENTS = os.getenv('PRELOAD_COMPONENTS', 'false').lower() == 'true'
+    SWAGGER_ENABLED = os.getenv('SWAGGER_ENABLED', 'true').lower() == 'true'
+    # Development server only (python app.py); production runs under gunicorn (gunicorn.conf.py)
+    DEBUG = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
+    # Rate-limit counters: sqlite:// is shared by every worker on the host (rate_limit_storage.py), redis:// across hosts, memory:// per process
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', f"sqlite:///{os.path.join(tempfile.gettempdir(), 'chatbot-ratelimits.db')}")
+    RATELIMIT_STRATEGY = os.getenv('RATELIMIT_STRATEGY', 'sliding-window-counter')
+    # Key for the per-message limits: remote_addr, session (session_id, else address) or user (user_id, then session_id, else address)
+    RATELIMIT_KEY = os.getenv('RATELIMIT_KEY', 'remote_addr')
+    # Per-address cap stacked on the message limits when they are keyed on client-sent ids, which a client can rotate
+    RATELIMIT_ADDRESS_LIMIT = os.getenv('RATELIMIT_ADDRESS_LIMIT', '120 per minute')
+    # Shared directory for per-process metric snapshots, so /metrics covers every gunicorn worker (unset: this process only)
+    METRICS_DIR = os.getenv('METRICS_DIR') or None
+    METRICS_SNAPSHOT_INTERVAL = float(os.getenv('METRICS_SNAPSHOT_INTERVAL', '5.0'))
 
 # ==================== INPUT VALIDATION ====================
 class MessageValidator:
@@ -57,65 +137,870 @@ class MessageValidator:
         text = re.sub(r'\s+', ' ', text)
         return text
 
+# ==================== METRICS ====================
+metrics_registry = MetricsRegistry(Config.METRICS_DIR, Config.METRICS_SNAPSHOT_INTERVAL)
+TURN_STAGE_SECONDS = metrics_registry.histogram('chatbot_turn_stage_seconds', 'Time spent in each stage of a dialogue turn', ('stage',))
+HTTP_REQUEST_SECONDS = metrics_registry.histogram('chatbot_http_request_duration_seconds', 'Time to produce a response (first byte for streams), by endpoint', ('endpoint', 'method', 'status'))
+
+# ==================== WRITE-BEHIND MESSAGE QUEUE ====================
+class WriteBehindQueue:
+    def __init__(self, flush_fn, max_size: int = None, batch_size: int = None, flush_interval: float = None, put_timeout: float = None, on_drop=None):
+        self.flush_fn = flush_fn
+        # Called with the batch's items when a flush gives up on them, so callers can undo what they did at submit()
+        self.on_drop = on_drop
+        self.batch_size = batch_size or Config.WRITE_BEHIND_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else Config.WRITE_BEHIND_FLUSH_INTERVAL
+        self.put_timeout = put_timeout if put_timeout is not None else Config.WRITE_BEHIND_PUT_TIMEOUT
+        self._queue = queue.Queue(maxsize=max_size or Config.WRITE_BEHIND_QUEUE_SIZE)
+        self._pending: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+        # Readers that combine a Neo4j read with pending() vs. a flush committing a batch (see reading())
+        self._gate = threading.Condition(self._lock)
+        self._readers = 0
+        self._committing = False
+        self.dropped_messages = 0
+        self._stop = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='neo4j-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        logger.info(f"Write-behind queue started (batch_size={self.batch_size}, flush_interval={self.flush_interval}s)")
+
+    def submit(self, session_id: str, messages: List[Dict], session_update: Dict = None):
+        if self._closed:
+            raise RuntimeError("Write-behind queue is closed")
+        item = {'session_id': session_id, 'messages': messages, 'session_update': session_update}
+        # Register before enqueueing so the next read on this session already sees the write
+        with self._lock:
+            self._pending.setdefault(session_id, []).append(item)
+        try:
+            self._queue.put(item, timeout=self.put_timeout)
+        except queue.Full:
+            self._forget([item])
+            raise RuntimeError(f"Write-behind queue full for {self.put_timeout}s")
+
+    def pending(self, session_id: str) -> List[Dict]:
+        with self._lock:
+            return list(self._pending.get(session_id, []))
+
+    @contextmanager
+    def reading(self):
+        # A read that overlays pending() on Neo4j data must not straddle a commit: seeing the batch in Neo4j and
+        # still in pending() would count it twice. Commits wait for such reads, and new reads wait for a commit.
+        with self._gate:
+            self._gate.wait_for(lambda: not self._committing)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._gate:
+                self._readers -= 1
+                if not self._readers:
+                    self._gate.notify_all()
+
+    def _forget(self, items: List[Dict]):
+        with self._lock:
+            self._drop_pending(items)
+
+    def _drop_pending(self, items: List[Dict]):
+        # Caller holds the lock
+        for item in items:
+            remaining = [i for i in self._pending.get(item['session_id'], []) if i is not item]
+            if remaining:
+                self._pending[item['session_id']] = remaining
+            else:
+                self._pending.pop(item['session_id'], None)
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            batch, rows = [first], len(first['messages'])
+            deadline = time.monotonic() + self.flush_interval
+            while rows < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 and not self._stop.is_set() else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += len(item['messages'])
+            self._flush(batch)
+
+    def _flush(self, batch: List[Dict]):
+        messages = [row for item in batch for row in item['messages']]
+        session_updates = [item['session_update'] for item in batch if item['session_update']]
+        for attempt in range(1, Config.WRITE_BEHIND_MAX_RETRIES + 1):
+            try:
+                self._commit(batch, messages, session_updates)
+                break
+            except Exception as e:
+                logger.warning(f"Write-behind flush attempt {attempt} failed: {e}")
+                if attempt < Config.WRITE_BEHIND_MAX_RETRIES:
+                    time.sleep(min(0.1 * 2 ** attempt, 2.0))
+        else:
+            with self._lock:
+                self.dropped_messages += len(messages)
+                self._drop_pending(batch)
+            logger.error(f"Dropping {len(messages)} queued messages after {Config.WRITE_BEHIND_MAX_RETRIES} failed flushes")
+            if self.on_drop is not None:
+                try:
+                    self.on_drop(batch)
+                except Exception as e:
+                    logger.error(f"Write-behind drop handler failed: {e}")
+        for _ in batch:
+            self._queue.task_done()
+
+    def _commit(self, batch: List[Dict], messages: List[Dict], session_updates: List[Dict]):
+        with self._gate:
+            self._committing = True
+            self._gate.wait_for(lambda: not self._readers)
+        committed = False
+        try:
+            self.flush_fn(messages, session_updates)
+            committed = True
+        finally:
+            # The batch leaves pending() in the same critical section that lets readers back in
+            with self._gate:
+                if committed:
+                    self._drop_pending(batch)
+                self._committing = False
+                self._gate.notify_all()
+
+    def close(self, timeout: float = 30.0):
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"Write-behind queue did not drain within {timeout}s ({self._queue.qsize()} batches left)")
+        else:
+            logger.info("Write-behind queue drained")
+
+    def discard(self):
+        # Inherited across fork: the flusher thread did not survive, and the queued writes are the parent's to flush
+        self._closed = True
+        self._stop.set()
+
+# ==================== ANALYTICS ROLLUPS ====================
+class AnalyticsRollups:
+    GRANULARITIES = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+    # Upper bounds (ms) of the latency histogram bins; the last bin is open-ended
+    LATENCY_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+    MAX_POINTS = 10000
+
+    @staticmethod
+    def empty_bucket() -> Dict:
+        return {'sessions': 0, 'messages': 0, 'positive': 0, 'negative': 0, 'intents': {}, 'latency': [0] * (len(AnalyticsRollups.LATENCY_BOUNDS_MS) + 1)}
+
+    @staticmethod
+    def floor(ts: datetime, granularity: str) -> datetime:
+        ts = ts.astimezone(timezone.utc).replace(second=0, microsecond=0)
+        if granularity in ('hour', 'day'):
+            ts = ts.replace(minute=0)
+        if granularity == 'day':
+            ts = ts.replace(hour=0)
+        return ts
+
+    @staticmethod
+    def coarser(a: str, b: str) -> str:
+        return a if AnalyticsRollups.GRANULARITIES[a] >= AnalyticsRollups.GRANULARITIES[b] else b
+
+    @staticmethod
+    def merge(into: Dict, bucket: Dict, sign: int = 1) -> Dict:
+        for key in ('sessions', 'messages', 'positive', 'negative'):
+            into[key] += sign * bucket[key]
+        for intent, count in bucket['intents'].items():
+            into['intents'][intent] = into['intents'].get(intent, 0) + sign * count
+        into['latency'] = [a + sign * b for a, b in zip(into['latency'], bucket['latency'])]
+        return into
+
+    @staticmethod
+    def latency_bin(seconds: float) -> int:
+        return bisect.bisect_left(AnalyticsRollups.LATENCY_BOUNDS_MS, seconds * 1000.0)
+
+    @staticmethod
+    def percentile(histogram: List[int], q: float) -> Optional[float]:
+        total = sum(histogram)
+        if not total:
+            return None
+        bounds = (0,) + AnalyticsRollups.LATENCY_BOUNDS_MS
+        target, seen = q * total, 0
+        for index, count in enumerate(histogram):
+            if count and seen + count >= target:
+                if index >= len(AnalyticsRollups.LATENCY_BOUNDS_MS):
+                    return float(bounds[-1])
+                # Interpolate linearly inside the bin
+                return round(bounds[index] + (bounds[index + 1] - bounds[index]) * (target - seen) / count, 2)
+            seen += count
+        return float(bounds[-1])
+
+    @staticmethod
+    def to_row(granularity: str, start: datetime, bucket: Dict) -> Dict:
+        return {'granularity': granularity, 'start': start, 'sessions': bucket['sessions'], 'messages': bucket['messages'], 'positive': bucket['positive'], 'negative': bucket['negative'], 'intent_names': list(bucket['intents']), 'intent_counts': list(bucket['intents'].values()), 'latency': bucket['latency']}
+
+    @staticmethod
+    def from_node(node) -> Tuple[str, datetime, Dict]:
+        bucket = AnalyticsRollups.empty_bucket()
+        bucket.update(sessions=node.get('sessions') or 0, messages=node.get('messages') or 0, positive=node.get('positive_feedback_count') or 0, negative=node.get('negative_feedback_count') or 0)
+        bucket['intents'] = dict(zip(node.get('intent_names') or [], node.get('intent_counts') or []))
+        histogram = list(node.get('latency_histogram') or [])
+        bucket['latency'] = [a + b for a, b in zip(bucket['latency'], histogram + [0] * (len(bucket['latency']) - len(histogram)))]
+        start = node['start']
+        return node['granularity'], start.to_native() if hasattr(start, 'to_native') else start, bucket
+
+    @staticmethod
+    def series(buckets, granularity: str) -> List[Dict]:
+        points: Dict[Tuple[datetime, str], Dict] = {}
+        for bucket_granularity, start, bucket in buckets:
+            # Compacted buckets coarser than the request are reported at their own granularity
+            point_granularity = AnalyticsRollups.coarser(granularity, bucket_granularity)
+            key = (AnalyticsRollups.floor(start, point_granularity), point_granularity)
+            AnalyticsRollups.merge(points.setdefault(key, AnalyticsRollups.empty_bucket()), bucket)
+        return [AnalyticsRollups.to_point(start, point_granularity, points[(start, point_granularity)]) for start, point_granularity in sorted(points)]
+
+    @staticmethod
+    def to_point(start: datetime, granularity: str, bucket: Dict) -> Dict:
+        feedback = bucket['positive'] + bucket['negative']
+        return {
+            'start': start.isoformat(),
+            'granularity': granularity,
+            'sessions': bucket['sessions'],
+            'messages': bucket['messages'],
+            'intent_distribution': {intent: count for intent, count in bucket['intents'].items() if count > 0},
+            'positive_feedback_count': bucket['positive'],
+            'negative_feedback_count': bucket['negative'],
+            'feedback_ratio': round(bucket['positive'] / feedback, 4) if feedback else None,
+            'latency_ms': {'p50': AnalyticsRollups.percentile(bucket['latency'], 0.5), 'p95': AnalyticsRollups.percentile(bucket['latency'], 0.95), 'p99': AnalyticsRollups.percentile(bucket['latency'], 0.99)}
+        }
+
+    @staticmethod
+    def parse_range(start: Optional[str], end: Optional[str], granularity: Optional[str]) -> Tuple[datetime, datetime, str]:
+        granularity = granularity or 'hour'
+        if granularity not in AnalyticsRollups.GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(AnalyticsRollups.GRANULARITIES)}")
+        end_ts = AnalyticsRollups._parse_ts(end) if end else datetime.now(timezone.utc)
+        try:
+            start_ts = AnalyticsRollups._parse_ts(start) if start else end_ts - timedelta(days=1)
+        except OverflowError as e:
+            raise ValueError(f"'to' is too early for the default one-day range: {end!r}") from e
+        if start_ts >= end_ts:
+            raise ValueError("'from' must be before 'to'")
+        if (end_ts - start_ts) / AnalyticsRollups.GRANULARITIES[granularity] > AnalyticsRollups.MAX_POINTS:
+            raise ValueError(f"Range too large for {granularity} granularity (max {AnalyticsRollups.MAX_POINTS} points)")
+        return AnalyticsRollups.floor(start_ts, granularity), end_ts, granularity
+
+    @staticmethod
+    def _parse_ts(value: str) -> datetime:
+        try:
+            seconds = float(value)
+        except ValueError:
+            ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        else:
+            try:
+                ts = datetime.fromtimestamp(seconds, timezone.utc)
+            except (OverflowError, OSError, ValueError) as e:
+                # Epoch seconds outside what datetime (or the platform's C library) can represent
+                raise ValueError(f"Timestamp out of range: {value!r}") from e
+        return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+# ==================== ANALYTICS COUNTERS ====================
+class AnalyticsCounters:
+    FEEDBACK_TYPES = ('positive', 'negative')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas = self._empty()
+        self._stop = threading.Event()
+        self._thread = None
+        self._flush_fn = None
+
+    @staticmethod
+    def _empty() -> Dict:
+        return {'sessions': 0, 'messages': 0, 'positive': 0, 'negative': 0, 'intents': {}, 'buckets': {}}
+
+    def _bucket(self, at: datetime = None) -> Dict:
+        # Caller holds the lock; deltas are also rolled up per minute for the timeseries
+        start = AnalyticsRollups.floor(at or datetime.now(timezone.utc), 'minute')
+        bucket = self._deltas['buckets'].get(start)
+        if bucket is None:
+            bucket = self._deltas['buckets'][start] = AnalyticsRollups.empty_bucket()
+        return bucket
+
+    def record_session(self, count: int = 1):
+        with self._lock:
+            self._deltas['sessions'] += count
+            self._bucket()['sessions'] += count
+
+    def record_messages(self, intents: List[Optional[str]]):
+        self._count_messages(intents, 1)
+
+    def forget_messages(self, intents: List[Optional[str]], at: datetime):
+        # Takes back messages counted when they were queued but never written (a dropped write-behind batch); the
+        # deltas go negative if the counts were already flushed, and the next flush subtracts them
+        self._count_messages(intents, -1, at)
+
+    def _count_messages(self, intents: List[Optional[str]], sign: int, at: datetime = None):
+        with self._lock:
+            bucket = self._bucket(at)
+            self._deltas['messages'] += sign * len(intents)
+            bucket['messages'] += sign * len(intents)
+            for intent in intents:
+                if intent:
+                    for counts in (self._deltas['intents'], bucket['intents']):
+                        counts[intent] = counts.get(intent, 0) + sign
+                        if not counts[intent]:
+                            del counts[intent]
+
+    def record_feedback(self, feedback: str, previous: str = None):
+        if feedback == previous:
+            return
+        with self._lock:
+            bucket = self._bucket()
+            if previous in self.FEEDBACK_TYPES:
+                self._deltas[previous] -= 1
+                bucket[previous] -= 1
+            if feedback in self.FEEDBACK_TYPES:
+                self._deltas[feedback] += 1
+                bucket[feedback] += 1
+
+    def record_latency(self, seconds: float):
+        with self._lock:
+            self._bucket()['latency'][AnalyticsRollups.latency_bin(seconds)] += 1
+
+    def pending(self) -> Dict:
+        with self._lock:
+            return dict(self._deltas, intents=dict(self._deltas['intents']), buckets={start: AnalyticsRollups.merge(AnalyticsRollups.empty_bucket(), bucket) for start, bucket in self._deltas['buckets'].items()})
+
+    def drain(self) -> Optional[Dict]:
+        with self._lock:
+            deltas, self._deltas = self._deltas, self._empty()
+        if not any((deltas['sessions'], deltas['messages'], deltas['positive'], deltas['negative'], deltas['intents'], deltas['buckets'])):
+            return None
+        return deltas
+
+    def restore(self, deltas: Dict):
+        with self._lock:
+            for key in ('sessions', 'messages', 'positive', 'negative'):
+                self._deltas[key] += deltas[key]
+            for intent, count in deltas['intents'].items():
+                self._deltas['intents'][intent] = self._deltas['intents'].get(intent, 0) + count
+            for start, bucket in deltas['buckets'].items():
+                AnalyticsRollups.merge(self._deltas['buckets'].setdefault(start, AnalyticsRollups.empty_bucket()), bucket)
+
+    @staticmethod
+    def flush_params(deltas: Dict) -> Dict:
+        return {'sessions': deltas['sessions'], 'messages': deltas['messages'], 'positive': deltas['positive'], 'negative': deltas['negative'], 'intents': [{'intent': intent, 'count': count} for intent, count in deltas['intents'].items()]}
+
+    @staticmethod
+    def bucket_rows(deltas: Dict) -> List[Dict]:
+        return [AnalyticsRollups.to_row('minute', start, bucket) for start, bucket in deltas['buckets'].items()]
+
+    def start(self, flush_fn, interval: float = None):
+        self._flush_fn = flush_fn
+        interval = interval if interval is not None else Config.ANALYTICS_FLUSH_INTERVAL
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='analytics-counters', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def flush(self):
+        deltas = self.drain()
+        if deltas is None or self._flush_fn is None:
+            return
+        try:
+            self._flush_fn(deltas)
+        except Exception as e:
+            # Keep the deltas for the next attempt rather than losing counts
+            self.restore(deltas)
+            logger.warning(f"Analytics counter flush failed: {e}")
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5.0)
+        self.flush()
+
+    def discard(self):
+        # Inherited across fork: the parent flushes these deltas, so the child must not count them again
+        self._stop.set()
+        self._flush_fn = None
+
+# ==================== SESSION CONTEXT CACHE ====================
+class SessionContextCache:
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None, window_size: int = None):
+        self.max_entries = max_entries if max_entries is not None else Config.CONTEXT_CACHE_SIZE
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else Config.SESSION_TIMEOUT_HOURS * 3600
+        self.window_size = window_size or Config.CONTEXT_WINDOW_SIZE
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, session_id: str) -> Optional[Dict]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if entry['expires_at'] < time.monotonic():
+            del self._entries[session_id]
+            return None
+        self._entries.move_to_end(session_id)
+        return entry
+
+    def get_messages(self, session_id: str, num_messages: int) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._entry(session_id)
+            messages = entry['messages'] if entry else None
+            # The window answers the request if it holds enough messages, or holds the whole history
+            if messages is not None and (num_messages <= len(messages) or (entry['metadata'] and entry['metadata']['interaction_count'] == len(messages))):
+                self.hits += 1
+                return messages[-num_messages:] if num_messages else []
+            self.misses += 1
+            return None
+
+    def get_metadata(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entry(session_id)
+            if entry and entry['metadata'] is not None:
+                self.hits += 1
+                return dict(entry['metadata'], topics_discussed=list(entry['metadata']['topics_discussed']))
+            self.misses += 1
+            return None
+
+    def put(self, session_id: str, messages: Optional[List[Dict]] = None, metadata: Optional[Dict] = None):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            entry = self._entry(session_id) or {'messages': None, 'metadata': None}
+            if messages is not None:
+                entry['messages'] = list(messages[-self.window_size:])
+            if metadata is not None:
+                entry['metadata'] = dict(metadata, topics_discussed=list(metadata.get('topics_discussed') or []))
+            entry['expires_at'] = time.monotonic() + self.ttl_seconds
+            self._entries[session_id] = entry
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_messages(self, session_id: str, messages: List[Dict]):
+        with self._lock:
+            entry = self._entry(session_id)
+            if not entry:
+                return
+            if entry['messages'] is not None:
+                entry['messages'] = (entry['messages'] + messages)[-self.window_size:]
+            if entry['metadata'] is not None:
+                entry['metadata']['interaction_count'] = (entry['metadata']['interaction_count'] or 0) + len(messages)
+                entry['metadata']['last_interaction'] = messages[-1]['timestamp']
+                entry['metadata']['status'] = 'active'
+            entry['expires_at'] = time.monotonic() + self.ttl_seconds
+
+    def record_intent(self, session_id: str, intent: str, topic: str = None):
+        with self._lock:
+            entry = self._entry(session_id)
+            if not entry or entry['metadata'] is None:
+                return
+            metadata = entry['metadata']
+            metadata['user_intent'] = intent
+            if topic is not None:
+                metadata['topic'] = topic
+                if topic not in metadata['topics_discussed']:
+                    metadata['topics_discussed'].append(topic)
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+# ==================== SESSION STORE INTERFACE ====================
+class SessionStore(ABC):
+    # What DialogueEngine and the API routes need from storage; Neo4j, in-memory and SQLite implement it.
+    # Neo4j-only maintenance (rollup compaction, relabelling, recomputing counters) stays on Neo4jSessionManager.
+    
+    # Ids issued by create_sessions() (a token and its signature; older ids are the token alone). Message routes
+    # reject anything else, since a first turn creates the session.
+    SESSION_ID_PATTERN = re.compile(r'session_[0-9a-f]{16}(?:[0-9a-f]{16})?')
+    TIMESTAMP_PATTERN = re.compile(r'(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d{1,9}))?(Z|[+-]\d\d:\d\d(?::\d\d)?)?(?:\[[^\]]+\])?')
+    
+    def create_session(self, user_id: str = None) -> str:
+        return self.create_sessions(1, user_id)[0]
+    
+    def create_sessions(self, count: int, user_id: str = None) -> List[str]:
+        # Handing out an id needs no write: a session is created (MERGE) by its first turn, so widgets that mount
+        # and never send a message cost nothing. Only a user_id has to be stored up front.
+        session_ids = [self.new_session_id() for _ in range(count)]
+        if user_id is not None:
+            self._materialize_sessions(session_ids, user_id)
+        return session_ids
+    
+    # Stores the sessions now (keeping any that already exist) and counts the new ones in analytics
+    @abstractmethod
+    def _materialize_sessions(self, session_ids: List[str], user_id: str): ...
+    
+    @classmethod
+    def valid_session_id(cls, session_id) -> bool:
+        return isinstance(session_id, str) and cls.SESSION_ID_PATTERN.fullmatch(session_id) is not None
+    
+    @classmethod
+    def new_session_id(cls) -> str:
+        token = uuid.uuid4().hex[:16]
+        return f"session_{token}{cls._sign_session_token(token)}"
+    
+    @classmethod
+    def issued_session_id(cls, session_id) -> bool:
+        # True only for ids this deployment handed out (see Config.SESSION_ID_SECRET), stored or not
+        if not cls.valid_session_id(session_id) or len(session_id) != len('session_') + 32:
+            return False
+        token, signature = session_id[8:24], session_id[24:]
+        return hmac.compare_digest(signature, cls._sign_session_token(token))
+    
+    @staticmethod
+    def _sign_session_token(token: str) -> str:
+        return hmac.new(Config.SESSION_ID_SECRET.encode(), token.encode(), hashlib.sha256).hexdigest()[:16]
+    
+    @abstractmethod
+    def get_session_metadata(self, session_id: str) -> Optional[Dict]: ...
+    
+    @abstractmethod
+    def get_turn_context(self, session_id: str, num_messages: int = 5) -> Tuple[List[Dict], Optional[Dict]]: ...
+    
+    @abstractmethod
+    def save_turn(self, session_id: str, user_text: str, bot_text: str, intent: str = None, entities: Dict = None, confidence: float = None, bot_intent: str = None, bot_confidence: float = None, topic: str = None) -> Dict: ...
+    
+    @abstractmethod
+    def get_message_page(self, session_id: str, limit: int = 50, cursor: str = None) -> Tuple[List[Dict], Optional[str]]: ...
+    
+    @abstractmethod
+    def iter_session_messages(self, session_id: str): ...
+    
+    @abstractmethod
+    def add_feedback(self, message_id: str, feedback: str): ...
+    
+    @abstractmethod
+    def get_analytics(self, exact: bool = False) -> Dict: ...
+    
+    @abstractmethod
+    def get_timeseries(self, start: datetime, end: datetime, granularity: str) -> List[Dict]: ...
+    
+    # ---- Session lifecycle (SessionLifecycleManager) ----
+    # Marks up to `limit` active sessions last used before `before` as expired; returns how many
+    @abstractmethod
+    def expire_sessions(self, before: datetime, limit: int) -> int: ...
+    
+    # Metadata of up to `limit` expired sessions whose messages are still in the store
+    @abstractmethod
+    def expired_sessions(self, before: datetime, limit: int) -> List[Dict]: ...
+    
+    # Deletes an expired session's messages and leaves it as an 'archived' stub; returns the number deleted,
+    # or None when a new turn made the session active again and it was left alone
+    @abstractmethod
+    def archive_session(self, session_id: str, before: datetime) -> Optional[int]: ...
+    
+    # Cold storage that history and export fall back to (set by AppComponents when SESSION_ARCHIVE_DIR is configured)
+    archive: Optional['SessionArchive'] = None
+    
+    def get_history_page(self, session_id: str, limit: int = 50, cursor: str = None) -> Tuple[List[Dict], Optional[str]]:
+        messages, next_cursor = self.get_message_page(session_id, limit, cursor)
+        if len(messages) >= limit:
+            return messages, next_cursor
+        return self._continue_into_archive(messages, next_cursor, self._archived_messages(session_id), limit, cursor)
+    
+    def iter_history(self, session_id: str):
+        # Oldest first: the archive (if any), then what is still in the hot store
+        archived = self._archived_messages(session_id)
+        seen = {message['message_id'] for message in archived}
+        yield from archived
+        for message in self.iter_session_messages(session_id):
+            if message['message_id'] not in seen:
+                yield message
+    
+    def _archived_messages(self, session_id: str) -> List[Dict]:
+        return self._read_archive(self.archive, session_id, self.get_session_metadata(session_id)) if self.archive is not None else []
+    
+    def record_latency(self, seconds: float):
+        self.analytics.record_latency(seconds)
+    
+    def close(self):
+        pass
+    
+    def discard(self):
+        pass
+    
+    # ---- Row, cursor and archive helpers shared by every backend (and the ASGI app's async Neo4j manager) ----
+    @staticmethod
+    def _read_archive(archive: Optional['SessionArchive'], session_id: str, metadata: Optional[Dict]) -> List[Dict]:
+        # The file can overlap the hot store (a pass interrupted before its delete); callers skip what is still hot
+        return archive.read(session_id, metadata['created_at']) if archive is not None and metadata else []
+    
+    @classmethod
+    def _continue_into_archive(cls, messages: List[Dict], next_cursor: Optional[str], archived: List[Dict], limit: int, cursor: Optional[str]) -> Tuple[List[Dict], Optional[str]]:
+        # Archived messages are all older than the hot ones, so a short hot page continues into the archive
+        if not archived:
+            return messages, next_cursor
+        if messages:
+            before = cls._position(messages[0]['timestamp'], messages[0]['message_id'])
+        else:
+            before = cls._position(*cls.decode_cursor(cursor)) if cursor is not None else None
+        older = [message for message in archived if before is None or cls._position(message['timestamp'], message['message_id']) < before]
+        page = older[max(0, len(older) - (limit - len(messages))):] + messages
+        return page, cls._next_cursor(page, limit)
+    
+    @classmethod
+    def _next_cursor(cls, messages: List[Dict], limit: int) -> Optional[str]:
+        # A full page may have older messages behind it; the next request just comes back empty if not
+        return cls.encode_cursor(messages[0]) if messages and len(messages) >= limit else None
+    
+    @classmethod
+    def _turn_rows(cls, session_id: str, user_text: str, bot_text: str, intent: str, entities: Dict, confidence: float, bot_intent: str, bot_confidence: float) -> List[Dict]:
+        # A turn's user message and bot reply, stamped by the app. The reply is 1µs later, which keeps ORDER BY timestamp in turn order.
+        now = datetime.now(timezone.utc)
+        return [cls._message_row(session_id, f"msg_{uuid.uuid4().hex[:12]}", 'user', user_text, intent, entities, confidence, now),
+                cls._message_row(session_id, f"msg_{uuid.uuid4().hex[:12]}", 'bot', bot_text, bot_intent, None, bot_confidence, now + timedelta(microseconds=1))]
+    
+    @staticmethod
+    def _turn_result(rows: List[Dict], status: str) -> Dict:
+        return {"user_message_id": rows[0]['message_id'], "bot_message_id": rows[1]['message_id'], "status": status}
+    
+    @staticmethod
+    def _new_session_metadata(session_id: str) -> Dict:
+        now = datetime.now(timezone.utc).isoformat()
+        return {'session_id': session_id, 'created_at': now, 'last_interaction': now, 'interaction_count': 0, 'user_intent': None, 'topic': None, 'status': 'active', 'topics_discussed': []}
+    
+    @staticmethod
+    def _message_row(session_id: str, message_id: str, sender: str, text: str, intent: str, entities: Dict, confidence: float, timestamp: datetime) -> Dict:
+        return {'session_id': session_id, 'message_id': message_id, 'sender': sender, 'text': text, 'intent': intent, 'entities': json.dumps(entities) if entities else None, 'confidence': confidence, 'timestamp': timestamp, 'token_count': len(text.split())}
+    
+    @staticmethod
+    def _row_to_message(row: Dict) -> Dict:
+        return SessionStore._message_to_dict(dict(row, timestamp=row['timestamp'].isoformat()))
+    
+    @staticmethod
+    def encode_cursor(message: Dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps([message['timestamp'], message['message_id']]).encode()).decode().rstrip('=')
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[str, str]:
+        try:
+            before_ts, before_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            SessionStore._instant(before_ts)
+            return str(before_ts), str(before_id)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    
+    @staticmethod
+    def _instant(timestamp: str) -> Tuple[datetime, int]:
+        # Timestamps arrive as Python isoformat() text (microseconds, dropped when zero) or, from Neo4j rows and the
+        # archives written from them, DateTime text (nanoseconds, maybe a 'Z' or [zone] suffix). They are ordered as
+        # (UTC second, nanoseconds), never as strings.
+        match = SessionStore.TIMESTAMP_PATTERN.fullmatch(str(timestamp))
+        if match is None:
+            raise ValueError(f"Invalid timestamp: {timestamp!r}")
+        seconds, fraction, offset = match.groups()
+        moment = datetime.fromisoformat(seconds + (offset if offset not in (None, 'Z') else '+00:00'))
+        return moment.astimezone(timezone.utc), int((fraction or '').ljust(9, '0'))
+    
+    @staticmethod
+    def _position(timestamp: str, message_id: str) -> Tuple[Tuple[datetime, int], str]:
+        # Where a message sits in ORDER BY timestamp, message_id
+        return SessionStore._instant(timestamp), message_id
+    
+    @staticmethod
+    def _parse_timestamp(timestamp: str) -> datetime:
+        moment, nanoseconds = SessionStore._instant(timestamp)
+        return moment + timedelta(microseconds=nanoseconds // 1000)
+    
+    @staticmethod
+    def _message_to_dict(msg) -> Dict:
+        try:
+            entities = json.loads(msg.get('entities', '{}') or '{}')
+        except (json.JSONDecodeError, TypeError):
+            entities = {}
+        return {'message_id': msg['message_id'], 'sender': msg['sender'], 'text': msg['text'], 'intent': msg.get('intent'), 'entities': entities, 'confidence': msg.get('confidence'), 'timestamp': str(msg['timestamp'])}
+    
+    @staticmethod
+    def _counts_to_stats(counts: Dict) -> Tuple[Dict, List]:
+        return {'total_sessions': counts['sessions'], 'total_messages': counts['messages'], 'positive_feedback_count': counts['positive'], 'negative_feedback_count': counts['negative']}, counts['intents']
+    
+    @staticmethod
+    def _stats_to_dict(stats, intents: List, pending: Dict) -> Dict:
+        stats = stats or {}
+        total_sessions = (stats.get('total_sessions') or 0) + pending['sessions']
+        total_messages = (stats.get('total_messages') or 0) + pending['messages']
+        intent_counts = {intent['intent']: intent['count'] for intent in intents}
+        for intent, count in pending['intents'].items():
+            intent_counts[intent] = intent_counts.get(intent, 0) + count
+        return {
+            'total_sessions': total_sessions,
+            'total_messages': total_messages,
+            'avg_messages_per_session': round(total_messages / total_sessions, 2) if total_sessions else 0,
+            'intent_distribution': {intent: count for intent, count in intent_counts.items() if count > 0},
+            'positive_feedback_count': (stats.get('positive_feedback_count') or 0) + pending['positive'],
+            'negative_feedback_count': (stats.get('negative_feedback_count') or 0) + pending['negative']
+        }
+    
+    @staticmethod
+    def _timestamp(ts: datetime) -> str:
+        # Fixed-width UTC ISO strings sort like the datetimes they encode (isoformat() drops zero microseconds)
+        return ts.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+    
+    @staticmethod
+    def _topics_after(topics: List[str], topic: Optional[str]) -> List[str]:
+        return topics + [topic] if topic is not None and topic not in topics else topics
+
 # ==================== NEO4J SESSION MANAGER ====================
-class Neo4jSessionManager:
-    def __init__(self, uri: str, user: str, password: str, max_connections: int = 50):
+class Neo4jSessionManager(SessionStore):
+    # ---- Cypher shared by the sync and async (asgi_app.py) managers ----
+    # Sessions are created lazily: message writes MERGE the Session node (the unique constraint makes racing first turns safe)
+    CREATE_SESSIONS_QUERY = """UNWIND $session_ids AS session_id MERGE (s:Session {session_id: session_id}) ON CREATE SET s.user_id = $user_id, s.created_at = datetime(), s.last_interaction = datetime(), s.interaction_count = 0, s.status = 'active', s.topics_discussed = []"""
+    # Message timestamps come from the app ($timestamp), so what the context cache holds (and history cursors point at)
+    # is exactly what is stored, whatever the skew between the app and database clocks
+    ADD_MESSAGE_QUERY = """MERGE (s:Session {session_id: $session_id}) ON CREATE SET s.created_at = $timestamp, s.interaction_count = 0, s.topics_discussed = [] CREATE (m:Message {message_id: $message_id, session_id: $session_id, sender: $sender, text: $text, intent: $intent, entities: $entities, confidence: $confidence, timestamp: $timestamp, token_count: $token_count, feedback: null}) CREATE (s)-[:HAS_MESSAGE]->(m) SET s.last_interaction = $timestamp, s.interaction_count = s.interaction_count + 1, s.status = 'active' RETURN m"""
+    # Per-session message reads seek the (session_id, timestamp) index (migration 3) and stop after $limit entries.
+    # TURN_CONTEXT_QUERY's COLLECT {} subquery needs Neo4j 5.6+ (migrations.check_server_version enforces it at startup).
+    RECENT_MESSAGES_QUERY = """MATCH (m:Message {session_id: $session_id}) WHERE m.timestamp IS NOT NULL RETURN m ORDER BY m.timestamp DESC, m.message_id DESC LIMIT $limit"""
+    # Keyset pagination on (timestamp, message_id); timestamps round-trip as ISO strings so nanoseconds survive
+    HISTORY_PAGE_QUERY = """MATCH (m:Message {session_id: $session_id}) WHERE m.timestamp <= datetime($before_ts) AND (m.timestamp < datetime($before_ts) OR m.message_id < $before_id) RETURN m ORDER BY m.timestamp DESC, m.message_id DESC LIMIT $limit"""
+    EXPORT_MESSAGES_QUERY = """MATCH (m:Message {session_id: $session_id}) WHERE m.timestamp IS NOT NULL RETURN m ORDER BY m.timestamp, m.message_id"""
+    SESSION_METADATA_QUERY = """MATCH (s:Session {session_id: $session_id}) RETURN s"""
+    UPDATE_INTENT_QUERY = """MATCH (s:Session {session_id: $session_id}) SET s.user_intent = $intent, s.topic = coalesce($topic, s.topic), s.topics_discussed = CASE WHEN $topic IS NOT NULL AND NOT $topic IN s.topics_discussed THEN s.topics_discussed + [$topic] ELSE s.topics_discussed END RETURN s"""
+    TURN_CONTEXT_QUERY = """MATCH (s:Session {session_id: $session_id}) RETURN s, COLLECT { MATCH (m:Message {session_id: $session_id}) WHERE m.timestamp IS NOT NULL RETURN m ORDER BY m.timestamp DESC, m.message_id DESC LIMIT $limit } AS messages"""
+    # The bot reply's $bot_timestamp is 1µs after $timestamp to keep ORDER BY m.timestamp stable (see SessionStore._turn_rows)
+    SAVE_TURN_QUERY = """MERGE (s:Session {session_id: $session_id}) ON CREATE SET s.created_at = $timestamp, s.interaction_count = 0, s.topics_discussed = []
+        CREATE (u:Message {message_id: $user_message_id, session_id: $session_id, sender: 'user', text: $user_text, intent: $intent, entities: $entities, confidence: $confidence, timestamp: $timestamp, token_count: $user_token_count, feedback: null})
+        CREATE (b:Message {message_id: $bot_message_id, session_id: $session_id, sender: 'bot', text: $bot_text, intent: $bot_intent, entities: null, confidence: $bot_confidence, timestamp: $bot_timestamp, token_count: $bot_token_count, feedback: null})
+        CREATE (s)-[:HAS_MESSAGE]->(u) CREATE (s)-[:HAS_MESSAGE]->(b)
+        SET s.last_interaction = $timestamp, s.interaction_count = s.interaction_count + 2, s.status = 'active', s.user_intent = $intent, s.topic = coalesce($topic, s.topic), s.topics_discussed = CASE WHEN $topic IS NOT NULL AND NOT $topic IN s.topics_discussed THEN s.topics_discussed + [$topic] ELSE s.topics_discussed END"""
+    WRITE_BEHIND_MESSAGES_QUERY = """UNWIND $rows AS row MERGE (s:Session {session_id: row.session_id}) ON CREATE SET s.created_at = row.timestamp, s.interaction_count = 0, s.topics_discussed = [] CREATE (m:Message {message_id: row.message_id, session_id: row.session_id, sender: row.sender, text: row.text, intent: row.intent, entities: row.entities, confidence: row.confidence, timestamp: row.timestamp, token_count: row.token_count, feedback: null}) CREATE (s)-[:HAS_MESSAGE]->(m) SET s.last_interaction = row.timestamp, s.interaction_count = s.interaction_count + 1, s.status = 'active'"""
+    WRITE_BEHIND_UPDATES_QUERY = """UNWIND $rows AS row MATCH (s:Session {session_id: row.session_id}) SET s.user_intent = row.intent, s.topic = coalesce(row.topic, s.topic), s.topics_discussed = CASE WHEN row.topic IS NOT NULL AND NOT row.topic IN s.topics_discussed THEN s.topics_discussed + [row.topic] ELSE s.topics_discussed END"""
+    # Session lifecycle: expiry and archival seek the (status, last_interaction) index (migration 5)
+    EXPIRE_SESSIONS_QUERY = """MATCH (s:Session {status: 'active'}) WHERE s.last_interaction < $before WITH s LIMIT $limit SET s.status = 'expired', s.expired_at = datetime() RETURN count(s) AS count"""
+    EXPIRED_SESSIONS_QUERY = """MATCH (s:Session {status: 'expired'}) WHERE s.last_interaction < $before RETURN s ORDER BY s.last_interaction LIMIT $limit"""
+    # Re-checks the status in the deleting transaction, so a turn that arrived after the archive file was written keeps its messages
+    ARCHIVE_SESSION_QUERY = """MATCH (s:Session {session_id: $session_id, status: 'expired'}) WHERE s.last_interaction < $before SET s.status = 'archived', s.archived_at = datetime()
+        WITH s OPTIONAL MATCH (m:Message {session_id: $session_id}) DETACH DELETE m RETURN count(DISTINCT s) AS archived, count(m) AS deleted"""
+    RELABEL_PAGE_QUERY = """MATCH (m:Message) WHERE m.message_id > $after AND m.sender = 'user' RETURN m.message_id AS message_id, coalesce(m.text, '') AS text ORDER BY m.message_id LIMIT $limit"""
+    RELABEL_WRITE_QUERY = """UNWIND $rows AS row MATCH (m:Message {message_id: row.message_id}) SET m.intent = row.intent, m.confidence = row.confidence"""
+    FEEDBACK_QUERY = """MATCH (m:Message {message_id: $message_id}) WITH m, m.feedback AS previous SET m.feedback = $feedback, m.feedback_timestamp = datetime() RETURN m, previous"""
+    # Pre-aggregated analytics: one (:Stats {name: 'global'}) node plus one (:IntentStat) node per intent
+    STATS_QUERY = """OPTIONAL MATCH (st:Stats {name: 'global'}) OPTIONAL MATCH (i:IntentStat) RETURN st, collect(i) AS intents"""
+    STATS_FLUSH_QUERY = """MERGE (st:Stats {name: 'global'}) SET st.total_sessions = coalesce(st.total_sessions, 0) + $sessions, st.total_messages = coalesce(st.total_messages, 0) + $messages, st.positive_feedback_count = coalesce(st.positive_feedback_count, 0) + $positive, st.negative_feedback_count = coalesce(st.negative_feedback_count, 0) + $negative WITH st UNWIND $intents AS row MERGE (i:IntentStat {intent: row.intent}) SET i.count = coalesce(i.count, 0) + row.count"""
+    # Exact aggregates, independent of each other so they run concurrently; grouping happens in Cypher
+    EXACT_ANALYTICS_QUERIES = {
+        'sessions': "MATCH (s:Session) RETURN count(s) AS count",
+        'messages': "MATCH (m:Message) RETURN count(m) AS count",
+        'feedback': "MATCH (m:Message) WHERE m.feedback IS NOT NULL RETURN m.feedback AS key, count(*) AS count",
+        'intents': "MATCH (m:Message) WHERE m.intent IS NOT NULL RETURN m.intent AS key, count(*) AS count"
+    }
+    # These return (key, count) rows folded into a dict; the others a single count
+    GROUPED_EXACT_ANALYTICS = frozenset({'feedback', 'intents'})
+    RECOMPUTE_STATS_QUERIES = ["MERGE (st:Stats {name: 'global'}) SET st.total_sessions = $sessions, st.total_messages = $messages, st.positive_feedback_count = $positive, st.negative_feedback_count = $negative, st.recomputed_at = datetime()", "MATCH (i:IntentStat) DELETE i", "UNWIND $intents AS row CREATE (:IntentStat {intent: row.intent, count: row.count})"]
+    # Time-bucketed rollups: (:AnalyticsBucket {granularity, start}) with intents as parallel name/count lists
+    # The first SET takes the node's write lock so the merges below read committed values
+    ROLLUP_FLUSH_QUERY = """UNWIND $buckets AS row MERGE (b:AnalyticsBucket {granularity: row.granularity, start: row.start}) SET b.updated_at = datetime()
+        WITH b, row, coalesce(b.intent_names, []) AS names, coalesce(b.intent_counts, []) AS counts, coalesce(b.latency_histogram, []) AS histogram
+        WITH b, row, names + [name IN row.intent_names WHERE NOT name IN names] AS merged, counts, histogram
+        SET b.sessions = coalesce(b.sessions, 0) + row.sessions, b.messages = coalesce(b.messages, 0) + row.messages, b.positive_feedback_count = coalesce(b.positive_feedback_count, 0) + row.positive, b.negative_feedback_count = coalesce(b.negative_feedback_count, 0) + row.negative,
+            b.latency_histogram = [i IN range(0, size(row.latency) - 1) | coalesce(histogram[i], 0) + row.latency[i]],
+            b.intent_names = merged, b.intent_counts = [i IN range(0, size(merged) - 1) | coalesce(counts[i], 0) + coalesce(head([j IN range(0, size(row.intent_names) - 1) WHERE row.intent_names[j] = merged[i] | row.intent_counts[j]]), 0)]"""
+    ROLLUP_RANGE_QUERY = """UNWIND $granularities AS granularity MATCH (b:AnalyticsBucket {granularity: granularity}) WHERE b.start >= $start AND b.start < $end RETURN b ORDER BY b.start"""
+    ROLLUP_EXPIRED_QUERY = """MATCH (b:AnalyticsBucket {granularity: $granularity}) WHERE b.start < $before RETURN b ORDER BY b.start LIMIT $limit"""
+    ROLLUP_DELETE_QUERY = """UNWIND $starts AS start MATCH (b:AnalyticsBucket {granularity: $granularity, start: start}) DELETE b"""
+    
+    def __init__(self, uri: str, user: str, password: str, max_connections: int = 50, write_behind: bool = None, context_cache: SessionContextCache = None):
         try:
+            # Imported here: the driver package is the largest import, and only processes that talk to Neo4j need it
+            from neo4j import GraphDatabase
             self.driver = GraphDatabase.driver(uri, auth=(user, password), max_connection_pool_size=max_connections, connection_acquisition_timeout=30.0)
-            with self.driver.session() as session:
-                session.run("RETURN 1")
-            logger.info(f"Connected to Neo4j at {uri}")
-            self._create_constraints()
+            # A single version read doubles as the connectivity check; DDL only runs when the schema is behind,
+            # and a schema left behind fails here, so the store is retried on the next request instead of serving
+            try:
+                self.schema_version = ensure_schema(self.driver, Config.AUTO_MIGRATE)
+            except Exception:
+                self.driver.close()
+                raise
+            logger.info(f"Connected to Neo4j at {uri} (schema version {self.schema_version}/{LATEST_VERSION})")
         except Exception as e:
             logger.error(f"Failed to connect to Neo4j: {e}")
             raise
-    
-    def _create_constraints(self):
-        try:
-            with self.driver.session() as session:
-                session.execute_write(lambda tx: tx.run("CREATE CONSTRAINT session_id_unique IF NOT EXISTS FOR (s:Session) REQUIRE s.session_id IS UNIQUE"))
-                session.execute_write(lambda tx: tx.run("CREATE CONSTRAINT message_id_unique IF NOT EXISTS FOR (m:Message) REQUIRE m.message_id IS UNIQUE"))
-            logger.info("Database constraints created successfully")
-        except Exception as e:
-            logger.warning(f"Constraint creation warning: {e}")
+        self.write_behind = None
+        if Config.WRITE_BEHIND_ENABLED if write_behind is None else write_behind:
+            self.write_behind = WriteBehindQueue(self._flush_queued_writes, on_drop=self._forget_dropped_writes)
+        self.context_cache = context_cache if context_cache is not None else SessionContextCache()
+        self.analytics = AnalyticsCounters()
+        self.analytics.start(self._flush_analytics)
     
     def create_session(self, user_id: str = None) -> str:
-        session_id = f"session_{uuid.uuid4().hex[:16]}"
+        session_id = super().create_session(user_id)
+        # The first turn then reads its (empty) context from the cache instead of Neo4j
+        self.context_cache.put(session_id, [], self._new_session_metadata(session_id))
+        return session_id
+    
+    def _materialize_sessions(self, session_ids: List[str], user_id: str):
         try:
             with self.driver.session() as session:
-                session.execute_write(self._create_session_node, session_id, user_id)
-            logger.info(f"Created session: {session_id}")
-            return session_id
+                created = session.execute_write(self._create_session_nodes, session_ids, user_id)
+            if created:
+                self.analytics.record_session(created)
+            logger.info(f"Created {created} session(s) for user {user_id}")
         except Exception as e:
-            logger.error(f"Failed to create session: {e}")
+            logger.error(f"Failed to create sessions: {e}")
             raise
     
     @staticmethod
-    def _create_session_node(tx, session_id: str, user_id: str = None):
-        query = """CREATE (s:Session {session_id: $session_id, user_id: $user_id, created_at: datetime(), last_interaction: datetime(), interaction_count: 0, user_intent: null, topic: null, status: 'active', topics_discussed: []}) RETURN s"""
-        tx.run(query, session_id=session_id, user_id=user_id)
+    def _create_session_nodes(tx, session_ids: List[str], user_id: str) -> int:
+        query = Neo4jSessionManager.CREATE_SESSIONS_QUERY
+        return Neo4jSessionManager._sessions_created(tx.run(query, session_ids=session_ids, user_id=user_id).consume(), 0)
+    
+    @staticmethod
+    def _sessions_created(summary, messages: int) -> int:
+        # Every other node a message write creates is a Session its MERGE did not find
+        return summary.counters.nodes_created - messages
     
     def add_message(self, session_id: str, sender: str, text: str, intent: str = None, entities: Dict = None, confidence: float = None) -> Dict:
         message_id = f"msg_{uuid.uuid4().hex[:12]}"
         try:
-            with self.driver.session() as session:
-                result = session.execute_write(self._add_message_node, session_id, message_id, sender, text, intent, entities, confidence)
+            row = self._message_row(session_id, message_id, sender, text, intent, entities, confidence, datetime.now(timezone.utc))
+            if self.write_behind:
+                self.write_behind.submit(session_id, [row])
+                result = {"message_id": message_id, "status": "queued"}
+            else:
+                with self.driver.session() as session:
+                    if session.execute_write(self._add_message_node, row):
+                        self.analytics.record_session()
+                result = {"message_id": message_id, "status": "added"}
+            self._record_written(self.context_cache, self.analytics, session_id, [row])
             return result
         except Exception as e:
             logger.error(f"Failed to add message: {e}")
             raise
     
     @staticmethod
-    def _add_message_node(tx, session_id: str, message_id: str, sender: str, text: str, intent: str = None, entities: Dict = None, confidence: float = None) -> Dict:
-        query = """MATCH (s:Session {session_id: $session_id}) CREATE (m:Message {message_id: $message_id, sender: $sender, text: $text, intent: $intent, entities: $entities, confidence: $confidence, timestamp: datetime(), token_count: $token_count, feedback: null}) CREATE (s)-[:HAS_MESSAGE]->(m) SET s.last_interaction = datetime(), s.interaction_count = s.interaction_count + 1 RETURN m"""
-        token_count = len(text.split())
-        tx.run(query, session_id=session_id, message_id=message_id, sender=sender, text=text, intent=intent, entities=json.dumps(entities) if entities else None, confidence=confidence, token_count=token_count)
-        return {"message_id": message_id, "status": "added"}
+    def _add_message_node(tx, row: Dict) -> int:
+        query = Neo4jSessionManager.ADD_MESSAGE_QUERY
+        summary = tx.run(query, **row).consume()
+        return Neo4jSessionManager._sessions_created(summary, 1)
     
     def get_conversation_context(self, session_id: str, num_messages: int = 5) -> List[Dict]:
+        cached = self.context_cache.get_messages(session_id, num_messages)
+        if cached is not None:
+            return cached
         try:
-            with self.driver.session() as session:
-                result = session.execute_read(self._fetch_recent_messages, session_id, num_messages)
+            with self._pending_consistent():
+                with self.driver.session() as session:
+                    result = session.execute_read(self._fetch_recent_messages, session_id, num_messages)
+                if self.write_behind:
+                    result, _ = self._apply_pending_writes(session_id, result, None, num_messages)
+            if num_messages >= self.context_cache.window_size:
+                self.context_cache.put(session_id, messages=result)
             return result
         except Exception as e:
             logger.error(f"Failed to get conversation context: {e}")
@@ -123,131 +1008,1008 @@ class Neo4jSessionManager:
     
     @staticmethod
     def _fetch_recent_messages(tx, session_id: str, num_messages: int) -> List[Dict]:
-        query = """MATCH (s:Session {session_id: $session_id})-[:HAS_MESSAGE]->(m:Message) RETURN m ORDER BY m.timestamp DESC LIMIT $limit"""
+        query = Neo4jSessionManager.RECENT_MESSAGES_QUERY
         result = tx.run(query, session_id=session_id, limit=num_messages)
-        messages = []
-        for record in result:
-            msg = record["m"]
+        return Neo4jSessionManager._oldest_first([record["m"] for record in result])
+    
+    @staticmethod
+    def _oldest_first(nodes: List) -> List[Dict]:
+        # Message reads walk the index newest first (so LIMIT stops early); callers get them in conversation order
+        return list(reversed([Neo4jSessionManager._message_to_dict(node) for node in nodes]))
+    
+    def get_message_page(self, session_id: str, limit: int = 50, cursor: str = None) -> Tuple[List[Dict], Optional[str]]:
+        if cursor is None:
+            messages = self.get_conversation_context(session_id, limit)
+        else:
+            before_ts, before_id = self.decode_cursor(cursor)
             try:
-                entities = json.loads(msg.get('entities', '{}') or '{}')
-            except (json.JSONDecodeError, TypeError):
-                entities = {}
-            message_data = {'message_id': msg['message_id'], 'sender': msg['sender'], 'text': msg['text'], 'intent': msg.get('intent'), 'entities': entities, 'confidence': msg.get('confidence'), 'timestamp': str(msg['timestamp'])}
-            messages.append(message_data)
-        return list(reversed(messages))
+                with self.driver.session() as session:
+                    messages = session.execute_read(self._fetch_message_page, session_id, before_ts, before_id, limit)
+            except Exception as e:
+                logger.error(f"Failed to get message page: {e}")
+                raise
+        return messages, self._next_cursor(messages, limit)
+    
+    @staticmethod
+    def _fetch_message_page(tx, session_id: str, before_ts: str, before_id: str, limit: int) -> List[Dict]:
+        result = tx.run(Neo4jSessionManager.HISTORY_PAGE_QUERY, session_id=session_id, before_ts=before_ts, before_id=before_id, limit=limit)
+        return Neo4jSessionManager._oldest_first([record["m"] for record in result])
+    
+    def iter_session_messages(self, session_id: str):
+        # Streams oldest-first straight off the driver's result cursor, fetch_size records at a time
+        pending = {}
+        if self.write_behind:
+            pending = {row['message_id']: row for item in self.write_behind.pending(session_id) for row in item['messages']}
+        with self.driver.session(fetch_size=Config.EXPORT_FETCH_SIZE) as session:
+            for record in session.run(self.EXPORT_MESSAGES_QUERY, session_id=session_id):
+                pending.pop(record["m"]["message_id"], None)
+                yield self._message_to_dict(record["m"])
+        for row in pending.values():
+            yield self._row_to_message(row)
     
     def get_session_metadata(self, session_id: str) -> Optional[Dict]:
+        cached = self.context_cache.get_metadata(session_id)
+        if cached is not None:
+            return cached
         try:
-            with self.driver.session() as session:
-                result = session.execute_read(self._fetch_session_metadata, session_id)
+            with self._pending_consistent():
+                with self.driver.session() as session:
+                    result = session.execute_read(self._fetch_session_metadata, session_id)
+                if self.write_behind:
+                    _, result = self._apply_pending_writes(session_id, None, result)
+            if result is not None:
+                self.context_cache.put(session_id, metadata=result)
             return result
         except Exception as e:
             logger.error(f"Failed to get session metadata: {e}")
-            return None
+            raise
     
     @staticmethod
     def _fetch_session_metadata(tx, session_id: str) -> Optional[Dict]:
-        query = """MATCH (s:Session {session_id: $session_id}) RETURN s"""
+        query = Neo4jSessionManager.SESSION_METADATA_QUERY
         result = tx.run(query, session_id=session_id)
         record = result.single()
         if not record:
             return None
-        session_node = record["s"]
+        return Neo4jSessionManager._session_to_dict(record["s"])
+    
+    @staticmethod
+    def _session_to_dict(session_node) -> Dict:
         return {'session_id': session_node['session_id'], 'created_at': str(session_node['created_at']), 'last_interaction': str(session_node['last_interaction']), 'interaction_count': session_node['interaction_count'], 'user_intent': session_node.get('user_intent'), 'topic': session_node.get('topic'), 'status': session_node.get('status', 'active'), 'topics_discussed': session_node.get('topics_discussed', [])}
     
     def update_session_intent(self, session_id: str, intent: str, topic: str = None):
         try:
-            with self.driver.session() as session:
-                session.execute_write(self._update_intent, session_id, intent, topic)
+            if self.write_behind:
+                self.write_behind.submit(session_id, [], {'session_id': session_id, 'intent': intent, 'topic': topic})
+            else:
+                with self.driver.session() as session:
+                    session.execute_write(self._update_intent, session_id, intent, topic)
+            self.context_cache.record_intent(session_id, intent, topic)
         except Exception as e:
             logger.error(f"Failed to update session intent: {e}")
     
     @staticmethod
     def _update_intent(tx, session_id: str, intent: str, topic: str = None):
-        query = """MATCH (s:Session {session_id: $session_id}) SET s.user_intent = $intent, s.topic = coalesce($topic, s.topic), s.topics_discussed = CASE WHEN $topic IS NOT NULL AND NOT $topic IN s.topics_discussed THEN s.topics_discussed + [$topic] ELSE s.topics_discussed END RETURN s"""
+        query = Neo4jSessionManager.UPDATE_INTENT_QUERY
         tx.run(query, session_id=session_id, intent=intent, topic=topic)
     
+    # ---- Single-turn path: one read transaction + one write transaction per user message ----
+    def get_turn_context(self, session_id: str, num_messages: int = 5) -> Tuple[List[Dict], Optional[Dict]]:
+        messages = self.context_cache.get_messages(session_id, num_messages)
+        metadata = self.context_cache.get_metadata(session_id) if messages is not None else None
+        if metadata is not None:
+            return messages, metadata
+        try:
+            with self._pending_consistent():
+                with self.driver.session() as session:
+                    messages, metadata = session.execute_read(self._fetch_turn_context, session_id, num_messages)
+                if self.write_behind:
+                    messages, metadata = self._apply_pending_writes(session_id, messages, metadata, num_messages)
+            if metadata is not None:
+                self.context_cache.put(session_id, messages, metadata)
+            return messages, metadata
+        except Exception as e:
+            logger.error(f"Failed to get turn context: {e}")
+            return [], None
+    
+    @staticmethod
+    def _fetch_turn_context(tx, session_id: str, num_messages: int) -> Tuple[List[Dict], Optional[Dict]]:
+        query = Neo4jSessionManager.TURN_CONTEXT_QUERY
+        record = tx.run(query, session_id=session_id, limit=num_messages).single()
+        if not record:
+            return [], None
+        return Neo4jSessionManager._oldest_first(record["messages"]), Neo4jSessionManager._session_to_dict(record["s"])
+    
+    def save_turn(self, session_id: str, user_text: str, bot_text: str, intent: str = None, entities: Dict = None, confidence: float = None, bot_intent: str = None, bot_confidence: float = None, topic: str = None) -> Dict:
+        try:
+            rows = self._turn_rows(session_id, user_text, bot_text, intent, entities, confidence, bot_intent, bot_confidence)
+            update = {'session_id': session_id, 'intent': intent, 'topic': topic}
+            if self.write_behind:
+                self.write_behind.submit(session_id, rows, update)
+                status = "queued"
+            else:
+                with self.driver.session() as session:
+                    if session.execute_write(self._save_turn_nodes, self._save_turn_params(rows, topic)):
+                        self.analytics.record_session()
+                status = "added"
+            self._record_written(self.context_cache, self.analytics, session_id, rows, update)
+            return self._turn_result(rows, status)
+        except Exception as e:
+            logger.error(f"Failed to save turn: {e}")
+            raise
+    
+    @staticmethod
+    def _save_turn_nodes(tx, params: Dict) -> int:
+        query = Neo4jSessionManager.SAVE_TURN_QUERY
+        summary = tx.run(query, **params).consume()
+        return Neo4jSessionManager._sessions_created(summary, 2)
+    
+    @staticmethod
+    def _save_turn_params(rows: List[Dict], topic: Optional[str]) -> Dict:
+        user, bot = rows
+        return {'session_id': user['session_id'], 'timestamp': user['timestamp'], 'bot_timestamp': bot['timestamp'], 'user_message_id': user['message_id'], 'user_text': user['text'], 'intent': user['intent'], 'entities': user['entities'], 'confidence': user['confidence'], 'user_token_count': user['token_count'], 'bot_message_id': bot['message_id'], 'bot_text': bot['text'], 'bot_intent': bot['intent'], 'bot_confidence': bot['confidence'], 'bot_token_count': bot['token_count'], 'topic': topic}
+    
+    @staticmethod
+    def _record_written(context_cache: SessionContextCache, analytics: 'AnalyticsCounters', session_id: str, rows: List[Dict], update: Optional[Dict] = None):
+        # Once messages are written (or queued), the context cache and the analytics counters see them
+        context_cache.record_messages(session_id, [SessionStore._row_to_message(row) for row in rows])
+        if update is not None:
+            context_cache.record_intent(session_id, update['intent'], update['topic'])
+        analytics.record_messages([row['intent'] for row in rows])
+    
+    # ---- Write-behind support: batched flushes and read-your-writes overlay ----
+    def _flush_queued_writes(self, messages: List[Dict], session_updates: List[Dict]):
+        with self.driver.session() as session:
+            created = session.execute_write(self._write_batch, messages, session_updates)
+        if created:
+            self.analytics.record_session(created)
+    
+    @staticmethod
+    def _write_batch(tx, messages: List[Dict], session_updates: List[Dict]) -> int:
+        created = 0
+        if messages:
+            query = Neo4jSessionManager.WRITE_BEHIND_MESSAGES_QUERY
+            created = Neo4jSessionManager._sessions_created(tx.run(query, rows=messages).consume(), len(messages))
+        if session_updates:
+            query = Neo4jSessionManager.WRITE_BEHIND_UPDATES_QUERY
+            tx.run(query, rows=session_updates)
+        return created
+    
+    def _pending_consistent(self):
+        # Exports skip this: they de-duplicate queued rows on message_id and must not hold off flushes for a whole stream
+        return self.write_behind.reading() if self.write_behind else nullcontext()
+    
+    def _forget_dropped_writes(self, items: List[Dict]):
+        # add_message and save_turn counted these messages and put them in the context cache when they were queued
+        for item in items:
+            for row in item['messages']:
+                self.analytics.forget_messages([row['intent']], row['timestamp'])
+            self.context_cache.invalidate(item['session_id'])
+    
+    def _apply_pending_writes(self, session_id: str, messages: Optional[List[Dict]], metadata: Optional[Dict], num_messages: int = 0) -> Tuple[Optional[List[Dict]], Optional[Dict]]:
+        items = self.write_behind.pending(session_id)
+        if not items:
+            return messages, metadata
+        # Rows of a batch that is mid-flush may already be in Neo4j, so de-duplicate on message_id
+        seen = {m['message_id'] for m in messages} if messages is not None else set()
+        queued = [row for item in items for row in item['messages'] if row['message_id'] not in seen]
+        if metadata is None and queued:
+            # The session's first turn is still queued, and with it the MERGE that creates the node
+            metadata = dict(self._new_session_metadata(session_id), created_at=queued[0]['timestamp'].isoformat())
+        if messages is not None:
+            messages = (messages + [self._row_to_message(row) for row in queued])[-num_messages:]
+        if metadata is not None:
+            metadata = dict(metadata, topics_discussed=list(metadata.get('topics_discussed') or []))
+            if queued:
+                metadata['interaction_count'] = (metadata['interaction_count'] or 0) + len(queued)
+                metadata['last_interaction'] = queued[-1]['timestamp'].isoformat()
+            for update in (item['session_update'] for item in items if item['session_update']):
+                metadata['user_intent'] = update['intent']
+                if update['topic'] is not None:
+                    metadata['topic'] = update['topic']
+                    if update['topic'] not in metadata['topics_discussed']:
+                        metadata['topics_discussed'].append(update['topic'])
+        return messages, metadata
+    
+    def fetch_user_messages_page(self, after: str = '', limit: int = 10000) -> List[Dict]:
+        try:
+            with self.driver.session() as session:
+                return session.execute_read(self._fetch_user_messages_page, after, limit)
+        except Exception as e:
+            logger.error(f"Failed to page messages after {after!r}: {e}")
+            raise
+    
+    @staticmethod
+    def _fetch_user_messages_page(tx, after: str, limit: int) -> List[Dict]:
+        result = tx.run(Neo4jSessionManager.RELABEL_PAGE_QUERY, after=after, limit=limit)
+        return [record.data() for record in result]
+    
+    def write_message_labels(self, rows: List[Dict]):
+        try:
+            with self.driver.session() as session:
+                session.execute_write(self._write_message_labels, rows)
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} message labels: {e}")
+            raise
+    
+    @staticmethod
+    def _write_message_labels(tx, rows: List[Dict]):
+        tx.run(Neo4jSessionManager.RELABEL_WRITE_QUERY, rows=rows)
+    
     def add_feedback(self, message_id: str, feedback: str):
         try:
             with self.driver.session() as session:
-                session.execute_write(lambda tx: tx.run("""MATCH (m:Message {message_id: $message_id}) SET m.feedback = $feedback, m.feedback_timestamp = datetime() RETURN m""", message_id=message_id, feedback=feedback))
+                record = session.execute_write(lambda tx: tx.run(self.FEEDBACK_QUERY, message_id=message_id, feedback=feedback).single())
+            if record:
+                self.analytics.record_feedback(feedback, record['previous'])
             logger.info(f"Feedback added for message {message_id}: {feedback}")
         except Exception as e:
             logger.error(f"Failed to add feedback: {e}")
 
-
-    def get_analytics(self) -> Dict:
+    def get_analytics(self, exact: bool = False) -> Dict:
         try:
+            if exact:
+                return self._stats_to_dict(*self._counts_to_stats(self.compute_exact_analytics()), AnalyticsCounters._empty())
             with self.driver.session() as session:
-                result = session.execute_read(self._fetch_analytics)
-            return result
+                stats, intents = session.execute_read(self._fetch_stats)
+            if stats is None:
+                # No Stats node yet (fresh deployment over existing data): seed it exactly once
+                return self.recompute_analytics()
+            return self._stats_to_dict(stats, intents, self.analytics.pending())
         except Exception as e:
             logger.error(f"Failed to get analytics: {e}")
             return {}
     
     @staticmethod
-    def _fetch_analytics(tx) -> Dict:
-        query = """
-        MATCH (s:Session)-[:HAS_MESSAGE]->(m:Message)
-        WITH s, collect(m) as messages
-        RETURN 
-            count(DISTINCT s) as total_sessions,
-            sum(size(messages)) as total_messages,
-            avg(toFloat(size(messages))) as avg_messages_per_session,
-            [msg IN messages WHERE msg.intent IS NOT NULL | msg.intent] as all_intents,
-            size([msg IN messages WHERE msg.feedback = 'positive']) as positive_feedback_count,
-            size([msg IN messages WHERE msg.feedback = 'negative']) as negative_feedback_count
-        """
-        result = tx.run(query)
-        data = result.single()
-        
-        if not data:
-            return {
-                'total_sessions': 0,
-                'total_messages': 0,
-                'avg_messages_per_session': 0,
-                'intent_distribution': {},
-                'positive_feedback_count': 0,
-                'negative_feedback_count': 0
-            }
-        
-        # Process intent counts
-        intent_counts = {}
-        for intent in data['all_intents']:
-            intent_counts[intent] = intent_counts.get(intent, 0) + 1
-        
-        return {
-            'total_sessions': data['total_sessions'],
-            'total_messages': data['total_messages'],
-            'avg_messages_per_session': round(data['avg_messages_per_session'], 2) if data['avg_messages_per_session'] else 0,
-            'intent_distribution': intent_counts,
-            'positive_feedback_count': data['positive_feedback_count'],
-            'negative_feedback_count': data['negative_feedback_count']
-        }
-
+    def _fetch_stats(tx) -> Tuple[Optional[Any], List]:
+        record = tx.run(Neo4jSessionManager.STATS_QUERY).single()
+        return (record['st'], record['intents']) if record else (None, [])
+    
+    def _flush_analytics(self, deltas: Dict):
+        with self.driver.session() as session:
+            session.execute_write(self._write_analytics, deltas)
+    
+    @staticmethod
+    def _write_analytics(tx, deltas: Dict):
+        tx.run(Neo4jSessionManager.STATS_FLUSH_QUERY, **AnalyticsCounters.flush_params(deltas)).consume()
+        tx.run(Neo4jSessionManager.ROLLUP_FLUSH_QUERY, buckets=AnalyticsCounters.bucket_rows(deltas)).consume()
+    
+    # Set once the driver's pool internals stop matching what best_effort_pool_stats expects, so it only warns once
+    _pool_stats_unsupported = False
+    
+    @staticmethod
+    def best_effort_pool_stats(driver) -> Dict[Tuple[str, str], int]:
+        # Best effort only: the driver exposes no public pool metrics, so this reads private internals
+        # (driver._pool.connections: address -> connections with a bool in_use, pool.pool_config.max_connection_pool_size)
+        # as laid out in neo4j 5.15 for both the sync and async drivers. Any patch release may change them; when the
+        # shape no longer matches, return nothing so the gauge series drop out instead of exporting made-up zeros.
+        if Neo4jSessionManager._pool_stats_unsupported:
+            return {}
+        try:
+            pool = driver._pool
+            max_size = pool.pool_config.max_connection_pool_size
+            if not isinstance(max_size, int) or isinstance(max_size, bool):
+                raise TypeError(f"max_connection_pool_size is {type(max_size).__name__}")
+            stats = {}
+            for address, connections in list(pool.connections.items()):
+                flags = [connection.in_use for connection in list(connections)]
+                if not all(isinstance(flag, bool) for flag in flags):
+                    raise TypeError("connection.in_use is not a bool")
+                stats[(str(address), 'in_use')] = sum(flags)
+                stats[(str(address), 'idle')] = len(flags) - sum(flags)
+            stats[('all', 'max')] = max_size
+            return stats
+        except Exception as e:
+            Neo4jSessionManager._pool_stats_unsupported = True
+            logger.warning(f"Neo4j driver pool internals not recognised ({type(e).__name__}: {e}); chatbot_neo4j_pool_connections disabled")
+            return {}
+    
+    def get_timeseries(self, start: datetime, end: datetime, granularity: str) -> List[Dict]:
+        try:
+            with self.driver.session() as session:
+                nodes = session.execute_read(lambda tx: [record['b'] for record in tx.run(self.ROLLUP_RANGE_QUERY, granularities=list(AnalyticsRollups.GRANULARITIES), start=start, end=end)])
+            return self._timeseries(nodes, self.analytics.pending(), start, end, granularity)
+        except Exception as e:
+            logger.error(f"Failed to get analytics timeseries: {e}")
+            raise
+    
+    @staticmethod
+    def _timeseries(nodes: List, pending: Dict, start: datetime, end: datetime, granularity: str) -> List[Dict]:
+        buckets = [AnalyticsRollups.from_node(node) for node in nodes]
+        buckets += [('minute', bucket_start, bucket) for bucket_start, bucket in pending['buckets'].items() if start <= bucket_start < end]
+        return AnalyticsRollups.series(buckets, granularity)
+    
+    def compact_rollups(self, now: datetime = None, page_size: int = 1000) -> Dict[str, int]:
+        now = now or datetime.now(timezone.utc)
+        plan = [('minute', 'hour', now - timedelta(hours=Config.ROLLUP_MINUTE_RETENTION_HOURS)), ('hour', 'day', now - timedelta(days=Config.ROLLUP_HOUR_RETENTION_DAYS))]
+        compacted = {}
+        try:
+            for granularity, into, before in plan:
+                # Never fold into a coarse bucket that is still receiving finer ones
+                before = AnalyticsRollups.floor(before, into)
+                compacted[granularity] = 0
+                while True:
+                    with self.driver.session() as session:
+                        count = session.execute_write(self._compact_page, granularity, into, before, page_size)
+                    compacted[granularity] += count
+                    if count < page_size:
+                        break
+            logger.info(f"Compacted analytics rollups: {compacted}")
+            return compacted
+        except Exception as e:
+            logger.error(f"Failed to compact analytics rollups: {e}")
+            raise
+    
+    @staticmethod
+    def _compact_page(tx, granularity: str, into: str, before: datetime, page_size: int) -> int:
+        nodes = [record['b'] for record in tx.run(Neo4jSessionManager.ROLLUP_EXPIRED_QUERY, granularity=granularity, before=before, limit=page_size)]
+        merged: Dict[datetime, Dict] = {}
+        for _, start, bucket in (AnalyticsRollups.from_node(node) for node in nodes):
+            AnalyticsRollups.merge(merged.setdefault(AnalyticsRollups.floor(start, into), AnalyticsRollups.empty_bucket()), bucket)
+        # Merge and delete in one transaction so a failed page is simply retried
+        tx.run(Neo4jSessionManager.ROLLUP_FLUSH_QUERY, buckets=[AnalyticsRollups.to_row(into, start, bucket) for start, bucket in merged.items()]).consume()
+        tx.run(Neo4jSessionManager.ROLLUP_DELETE_QUERY, granularity=granularity, starts=[node['start'] for node in nodes]).consume()
+        return len(nodes)
+    
+    def expire_sessions(self, before: datetime, limit: int) -> int:
+        try:
+            with self.driver.session() as session:
+                return session.execute_write(lambda tx: tx.run(self.EXPIRE_SESSIONS_QUERY, before=before, limit=limit).single()['count'])
+        except Exception as e:
+            logger.error(f"Failed to expire sessions: {e}")
+            raise
+    
+    def expired_sessions(self, before: datetime, limit: int) -> List[Dict]:
+        try:
+            with self.driver.session() as session:
+                nodes = session.execute_read(lambda tx: [record['s'] for record in tx.run(self.EXPIRED_SESSIONS_QUERY, before=before, limit=limit)])
+            return [self._session_to_dict(node) for node in nodes]
+        except Exception as e:
+            logger.error(f"Failed to list expired sessions: {e}")
+            raise
+    
+    def archive_session(self, session_id: str, before: datetime) -> Optional[int]:
+        try:
+            with self.driver.session() as session:
+                record = session.execute_write(lambda tx: tx.run(self.ARCHIVE_SESSION_QUERY, session_id=session_id, before=before).single())
+            self.context_cache.invalidate(session_id)
+            return record['deleted'] if record['archived'] else None
+        except Exception as e:
+            logger.error(f"Failed to archive session {session_id}: {e}")
+            raise
+    
+    def compute_exact_analytics(self) -> Dict:
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.EXACT_ANALYTICS_QUERIES), thread_name_prefix='analytics') as pool:
+                futures = {name: pool.submit(self._run_aggregate, query, name in self.GROUPED_EXACT_ANALYTICS) for name, query in self.EXACT_ANALYTICS_QUERIES.items()}
+                return self._exact_to_counts({name: future.result() for name, future in futures.items()})
+        except Exception as e:
+            logger.error(f"Failed to compute exact analytics: {e}")
+            raise
+    
+    def _run_aggregate(self, query: str, grouped: bool):
+        # fetch_size makes the driver pull grouped rows in pages; they are folded as they stream in
+        with self.driver.session(fetch_size=Config.ANALYTICS_FETCH_SIZE) as session:
+            return session.execute_read(self._fold_aggregate, query, grouped)
+    
+    @staticmethod
+    def _fold_aggregate(tx, query: str, grouped: bool):
+        groups, total = {}, 0
+        for record in tx.run(query):
+            if grouped:
+                groups[record['key']] = groups.get(record['key'], 0) + record['count']
+            else:
+                total += record['count']
+        return groups if grouped else total
+    
+    @staticmethod
+    def _exact_to_counts(results: Dict) -> Dict:
+        feedback = results['feedback']
+        return {'sessions': results['sessions'], 'messages': results['messages'], 'positive': feedback.get('positive', 0), 'negative': feedback.get('negative', 0), 'intents': [{'intent': intent, 'count': count} for intent, count in results['intents'].items()]}
+    
+    def recompute_analytics(self) -> Dict:
+        try:
+            self.analytics.flush()
+            counts = self.compute_exact_analytics()
+            with self.driver.session() as session:
+                session.execute_write(self._recompute_stats, counts)
+            logger.info("Analytics counters recomputed from the graph")
+            return self._stats_to_dict(*self._counts_to_stats(counts), self.analytics.pending())
+        except Exception as e:
+            logger.error(f"Failed to recompute analytics: {e}")
+            raise
+    
+    @staticmethod
+    def _recompute_stats(tx, counts: Dict):
+        for query in Neo4jSessionManager.RECOMPUTE_STATS_QUERIES:
+            tx.run(query, **counts).consume()
+    
     def close(self):
         try:
+            if self.write_behind:
+                self.write_behind.close()
+            self.analytics.close()
             self.driver.close()
             logger.info("Neo4j connection closed")
         except Exception as e:
             logger.error(f"Error closing Neo4j connection: {e}")
 
+    def discard(self):
+        # Drop a manager inherited across fork without closing the parent's sockets or flushing its pending writes
+        if self.write_behind:
+            self.write_behind.discard()
+        self.analytics.discard()
+
+# ==================== IN-MEMORY SESSION STORE ====================
+class InMemorySessionStore(SessionStore):
+    # Per-process dicts: for tests, benchmarks and single-process demos. Everything is lost on restart, and
+    # gunicorn workers do not see each other's sessions (use SESSION_STORE=sqlite for several workers on one host)
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict] = {}
+        self._messages: Dict[str, List[Dict]] = {}
+        # message_id -> current feedback (None until some is given)
+        self._feedback: Dict[str, Optional[str]] = {}
+        # Never flushed: the pending deltas are the totals
+        self.analytics = AnalyticsCounters()
+    
+    def _materialize_sessions(self, session_ids: List[str], user_id: str):
+        with self._lock:
+            created = [session_id for session_id in session_ids if session_id not in self._sessions]
+            for session_id in created:
+                self._sessions[session_id] = dict(self._new_session_metadata(session_id), user_id=user_id)
+                self._messages[session_id] = []
+        if created:
+            self.analytics.record_session(len(created))
+    
+    def _metadata(self, session_id: str) -> Optional[Dict]:
+        # Caller holds the lock
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        metadata = {key: value for key, value in session.items() if key != 'user_id'}
+        metadata['topics_discussed'] = list(session['topics_discussed'])
+        return metadata
+    
+    def get_session_metadata(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._metadata(session_id)
+    
+    def get_turn_context(self, session_id: str, num_messages: int = 5) -> Tuple[List[Dict], Optional[Dict]]:
+        with self._lock:
+            metadata = self._metadata(session_id)
+            if metadata is None:
+                return [], None
+            return (self._messages[session_id][-num_messages:] if num_messages else []), metadata
+    
+    def save_turn(self, session_id: str, user_text: str, bot_text: str, intent: str = None, entities: Dict = None, confidence: float = None, bot_intent: str = None, bot_confidence: float = None, topic: str = None) -> Dict:
+        rows = self._turn_rows(session_id, user_text, bot_text, intent, entities, confidence, bot_intent, bot_confidence)
+        messages = [self._message_to_dict(dict(row, timestamp=self._timestamp(row['timestamp']))) for row in rows]
+        with self._lock:
+            session = self._sessions.get(session_id)
+            # Like the Cypher MERGE, the first turn of a session creates it
+            created = session is None
+            if created:
+                session = self._sessions[session_id] = dict(self._new_session_metadata(session_id), created_at=messages[0]['timestamp'], user_id=None)
+                self._messages[session_id] = []
+            self._messages[session_id].extend(messages)
+            session.update(last_interaction=messages[0]['timestamp'], interaction_count=session['interaction_count'] + 2, status='active', user_intent=intent, topic=topic if topic is not None else session['topic'], topics_discussed=self._topics_after(session['topics_discussed'], topic))
+            for message in messages:
+                self._feedback[message['message_id']] = None
+        if created:
+            self.analytics.record_session()
+        self.analytics.record_messages([intent, bot_intent])
+        return self._turn_result(rows, "added")
+    
+    def get_message_page(self, session_id: str, limit: int = 50, cursor: str = None) -> Tuple[List[Dict], Optional[str]]:
+        before = self.decode_cursor(cursor) if cursor is not None else None
+        with self._lock:
+            messages = self._messages.get(session_id, [])
+            if before is not None:
+                position = self._position(*before)
+                messages = [message for message in messages if self._position(message['timestamp'], message['message_id']) < position]
+            messages = messages[-limit:] if limit else []
+        return messages, self._next_cursor(messages, limit)
+    
+    def iter_session_messages(self, session_id: str):
+        with self._lock:
+            messages = list(self._messages.get(session_id, []))
+        yield from messages
+    
+    def add_feedback(self, message_id: str, feedback: str):
+        with self._lock:
+            known = message_id in self._feedback
+            if known:
+                previous, self._feedback[message_id] = self._feedback[message_id], feedback
+        if known:
+            self.analytics.record_feedback(feedback, previous)
+    
+    def get_analytics(self, exact: bool = False) -> Dict:
+        if not exact:
+            return self._stats_to_dict({}, [], self.analytics.pending())
+        with self._lock:
+            intents, feedback = {}, list(self._feedback.values())
+            for messages in self._messages.values():
+                for message in messages:
+                    if message['intent']:
+                        intents[message['intent']] = intents.get(message['intent'], 0) + 1
+            counts = {'sessions': len(self._sessions), 'messages': sum(len(messages) for messages in self._messages.values()), 'positive': feedback.count('positive'), 'negative': feedback.count('negative'), 'intents': [{'intent': intent, 'count': count} for intent, count in intents.items()]}
+        return self._stats_to_dict(*self._counts_to_stats(counts), AnalyticsCounters._empty())
+    
+    def get_timeseries(self, start: datetime, end: datetime, granularity: str) -> List[Dict]:
+        pending = self.analytics.pending()
+        return AnalyticsRollups.series([('minute', bucket_start, bucket) for bucket_start, bucket in pending['buckets'].items() if start <= bucket_start < end], granularity)
+    
+    @staticmethod
+    def _idle(session: Dict, status: str, before: datetime) -> bool:
+        return session['status'] == status and datetime.fromisoformat(session['last_interaction']) < before
+    
+    def expire_sessions(self, before: datetime, limit: int) -> int:
+        with self._lock:
+            idle = [session for session in self._sessions.values() if self._idle(session, 'active', before)][:limit]
+            for session in idle:
+                session['status'] = 'expired'
+        return len(idle)
+    
+    def expired_sessions(self, before: datetime, limit: int) -> List[Dict]:
+        with self._lock:
+            return [self._metadata(session_id) for session_id, session in self._sessions.items() if self._idle(session, 'expired', before)][:limit]
+    
+    def archive_session(self, session_id: str, before: datetime) -> Optional[int]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or not self._idle(session, 'expired', before):
+                return None
+            session['status'] = 'archived'
+            messages, self._messages[session_id] = self._messages[session_id], []
+            for message in messages:
+                self._feedback.pop(message['message_id'], None)
+        return len(messages)
+
+# ==================== SQLITE SESSION STORE ====================
+class SQLiteSessionStore(SessionStore):
+    # An embedded WAL-mode file: no server, and every worker on the host shares it (readers never block the writer).
+    # Analytics use the same counters-plus-rollups scheme as Neo4j, flushed into their own tables.
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, user_id TEXT, created_at TEXT NOT NULL, last_interaction TEXT NOT NULL, interaction_count INTEGER NOT NULL DEFAULT 0, user_intent TEXT, topic TEXT, status TEXT NOT NULL DEFAULT 'active', topics_discussed TEXT NOT NULL DEFAULT '[]')",
+        "CREATE TABLE IF NOT EXISTS messages (message_id TEXT PRIMARY KEY, session_id TEXT NOT NULL, sender TEXT NOT NULL, text TEXT NOT NULL, intent TEXT, entities TEXT, confidence REAL, timestamp TEXT NOT NULL, token_count INTEGER, feedback TEXT, feedback_timestamp TEXT)",
+        "CREATE INDEX IF NOT EXISTS messages_session_timestamp ON messages (session_id, timestamp, message_id)",
+        "CREATE INDEX IF NOT EXISTS sessions_status_last_interaction ON sessions (status, last_interaction)",
+        "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, total_sessions INTEGER NOT NULL DEFAULT 0, total_messages INTEGER NOT NULL DEFAULT 0, positive_feedback_count INTEGER NOT NULL DEFAULT 0, negative_feedback_count INTEGER NOT NULL DEFAULT 0)",
+        "INSERT OR IGNORE INTO stats (name) VALUES ('global')",
+        "CREATE TABLE IF NOT EXISTS intent_stats (intent TEXT PRIMARY KEY, count INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS analytics_buckets (granularity TEXT NOT NULL, start TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (granularity, start))",
+    ]
+    SESSION_COLUMNS = "session_id, created_at, last_interaction, interaction_count, user_intent, topic, status, topics_discussed"
+    MESSAGE_COLUMNS = "message_id, sender, text, intent, entities, confidence, timestamp"
+    RECENT_MESSAGES_QUERY = f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id = ? ORDER BY timestamp DESC, message_id DESC LIMIT ?"
+    HISTORY_PAGE_QUERY = f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE session_id = ? AND (timestamp, message_id) < (?, ?) ORDER BY timestamp DESC, message_id DESC LIMIT ?"
+    INSERT_MESSAGE_QUERY = "INSERT INTO messages (message_id, session_id, sender, text, intent, entities, confidence, timestamp, token_count) VALUES (:message_id, :session_id, :sender, :text, :intent, :entities, :confidence, :timestamp, :token_count)"
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        try:
+            connection = self._connection()
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            logger.info(f"Opened SQLite session store at {path}")
+        except Exception as e:
+            logger.error(f"Failed to open SQLite session store {path}: {e}")
+            raise
+        self.analytics = AnalyticsCounters()
+        self.analytics.start(self._flush_analytics)
+    
+    def _connection(self):
+        # One connection per thread; keyed by pid too, since a connection must not be used across fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            # NORMAL is durable across application crashes in WAL mode; only an OS crash can lose the last commits
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+    
+    def _write(self, fn, *args):
+        # IMMEDIATE takes the write lock up front, so read-modify-write transactions never need an upgrade
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(connection, *args)
+            connection.execute('COMMIT')
+            return result
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+    
+    @staticmethod
+    def _session_to_dict(row) -> Dict:
+        return dict(row, topics_discussed=json.loads(row['topics_discussed'] or '[]'))
+    
+    def _materialize_sessions(self, session_ids: List[str], user_id: str):
+        try:
+            created = self._write(self._insert_sessions, session_ids, user_id)
+            if created:
+                self.analytics.record_session(created)
+            logger.info(f"Created {created} session(s) for user {user_id}")
+        except Exception as e:
+            logger.error(f"Failed to create sessions: {e}")
+            raise
+    
+    def _insert_sessions(self, connection, session_ids: List[str], user_id: str) -> int:
+        now = self._timestamp(datetime.now(timezone.utc))
+        # executemany's rowcount is the sum over all rows, so it counts only the sessions that were new
+        return connection.executemany("INSERT OR IGNORE INTO sessions (session_id, user_id, created_at, last_interaction) VALUES (?, ?, ?, ?)", [(session_id, user_id, now, now) for session_id in session_ids]).rowcount
+    
+    def get_session_metadata(self, session_id: str) -> Optional[Dict]:
+        try:
+            row = self._connection().execute(f"SELECT {self.SESSION_COLUMNS} FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            return self._session_to_dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Failed to get session metadata: {e}")
+            raise
+    
+    def get_turn_context(self, session_id: str, num_messages: int = 5) -> Tuple[List[Dict], Optional[Dict]]:
+        try:
+            connection = self._connection()
+            # One read transaction, so the messages and the metadata come from the same snapshot
+            connection.execute('BEGIN')
+            try:
+                row = connection.execute(f"SELECT {self.SESSION_COLUMNS} FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+                rows = connection.execute(self.RECENT_MESSAGES_QUERY, (session_id, num_messages)).fetchall() if row and num_messages else []
+            finally:
+                connection.execute('COMMIT')
+            if row is None:
+                return [], None
+            return [self._message_to_dict(dict(message)) for message in reversed(rows)], self._session_to_dict(row)
+        except Exception as e:
+            logger.error(f"Failed to get turn context: {e}")
+            return [], None
+    
+    def save_turn(self, session_id: str, user_text: str, bot_text: str, intent: str = None, entities: Dict = None, confidence: float = None, bot_intent: str = None, bot_confidence: float = None, topic: str = None) -> Dict:
+        try:
+            rows = self._turn_rows(session_id, user_text, bot_text, intent, entities, confidence, bot_intent, bot_confidence)
+            if self._write(self._save_turn_rows, session_id, [dict(row, timestamp=self._timestamp(row['timestamp'])) for row in rows], intent, topic):
+                self.analytics.record_session()
+            self.analytics.record_messages([intent, bot_intent])
+            return self._turn_result(rows, "added")
+        except Exception as e:
+            logger.error(f"Failed to save turn: {e}")
+            raise
+    
+    def _save_turn_rows(self, connection, session_id: str, rows: List[Dict], intent: Optional[str], topic: Optional[str]) -> bool:
+        # Returns whether the turn created the session: like the Cypher MERGE, the first turn stores it
+        session = connection.execute("SELECT topic, topics_discussed FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        created = session is None
+        if created:
+            connection.execute("INSERT INTO sessions (session_id, created_at, last_interaction) VALUES (?, ?, ?)", (session_id, rows[0]['timestamp'], rows[0]['timestamp']))
+            session = {'topic': None, 'topics_discussed': '[]'}
+        connection.executemany(self.INSERT_MESSAGE_QUERY, rows)
+        topics = self._topics_after(json.loads(session['topics_discussed'] or '[]'), topic)
+        connection.execute("UPDATE sessions SET last_interaction = ?, interaction_count = interaction_count + 2, status = 'active', user_intent = ?, topic = ?, topics_discussed = ? WHERE session_id = ?", (rows[0]['timestamp'], intent, topic if topic is not None else session['topic'], json.dumps(topics), session_id))
+        return created
+    
+    def get_message_page(self, session_id: str, limit: int = 50, cursor: str = None) -> Tuple[List[Dict], Optional[str]]:
+        before = self.decode_cursor(cursor) if cursor is not None else None
+        try:
+            if before is None:
+                rows = self._connection().execute(self.RECENT_MESSAGES_QUERY, (session_id, limit)).fetchall()
+            else:
+                # Stored timestamps are fixed-width text (_timestamp), so the cursor's is rewritten to match before comparing
+                rows = self._connection().execute(self.HISTORY_PAGE_QUERY, (session_id, self._timestamp(self._parse_timestamp(before[0])), before[1], limit)).fetchall()
+        except Exception as e:
+            logger.error(f"Failed to get message page: {e}")
+            raise
+        messages = [self._message_to_dict(dict(row)) for row in reversed(rows)]
+        return messages, self._next_cursor(messages, limit)
+    
+    def iter_session_messages(self, session_id: str):
+        # The cursor steps through the index, so an export never holds the whole session in memory
+        for row in self._connection().execute(f"SELECT {self.MESSAGE_COLUMNS} FROM messages WHERE session_id = ? ORDER BY timestamp, message_id", (session_id,)):
+            yield self._message_to_dict(dict(row))
+    
+    def add_feedback(self, message_id: str, feedback: str):
+        try:
+            previous = self._write(self._set_feedback, message_id, feedback)
+            if previous is not None:
+                self.analytics.record_feedback(feedback, previous[0])
+            logger.info(f"Feedback added for message {message_id}: {feedback}")
+        except Exception as e:
+            logger.error(f"Failed to add feedback: {e}")
+    
+    def _set_feedback(self, connection, message_id: str, feedback: str) -> Optional[Tuple[Optional[str]]]:
+        row = connection.execute("SELECT feedback FROM messages WHERE message_id = ?", (message_id,)).fetchone()
+        if row is None:
+            return None
+        connection.execute("UPDATE messages SET feedback = ?, feedback_timestamp = ? WHERE message_id = ?", (feedback, self._timestamp(datetime.now(timezone.utc)), message_id))
+        return (row['feedback'],)
+    
+    def get_analytics(self, exact: bool = False) -> Dict:
+        try:
+            connection = self._connection()
+            if exact:
+                feedback = dict(connection.execute("SELECT feedback, count(*) FROM messages WHERE feedback IS NOT NULL GROUP BY feedback").fetchall())
+                counts = {'sessions': connection.execute("SELECT count(*) FROM sessions").fetchone()[0], 'messages': connection.execute("SELECT count(*) FROM messages").fetchone()[0], 'positive': feedback.get('positive', 0), 'negative': feedback.get('negative', 0),
+                          'intents': [{'intent': intent, 'count': count} for intent, count in connection.execute("SELECT intent, count(*) FROM messages WHERE intent IS NOT NULL GROUP BY intent")]}
+                return self._stats_to_dict(*self._counts_to_stats(counts), AnalyticsCounters._empty())
+            stats = connection.execute("SELECT * FROM stats WHERE name = 'global'").fetchone()
+            intents = [{'intent': intent, 'count': count} for intent, count in connection.execute("SELECT intent, count FROM intent_stats")]
+            return self._stats_to_dict(dict(stats) if stats else {}, intents, self.analytics.pending())
+        except Exception as e:
+            logger.error(f"Failed to get analytics: {e}")
+            return {}
+    
+    def _flush_analytics(self, deltas: Dict):
+        self._write(self._write_analytics, deltas)
+    
+    @staticmethod
+    def _write_analytics(connection, deltas: Dict):
+        connection.execute("UPDATE stats SET total_sessions = total_sessions + ?, total_messages = total_messages + ?, positive_feedback_count = positive_feedback_count + ?, negative_feedback_count = negative_feedback_count + ? WHERE name = 'global'", (deltas['sessions'], deltas['messages'], deltas['positive'], deltas['negative']))
+        connection.executemany("INSERT INTO intent_stats (intent, count) VALUES (?, ?) ON CONFLICT (intent) DO UPDATE SET count = count + excluded.count", list(deltas['intents'].items()))
+        for bucket_start, bucket in deltas['buckets'].items():
+            key = ('minute', bucket_start.isoformat())
+            row = connection.execute("SELECT data FROM analytics_buckets WHERE granularity = ? AND start = ?", key).fetchone()
+            merged = AnalyticsRollups.merge(SQLiteSessionStore._bucket_from_json(row['data']), bucket) if row else bucket
+            connection.execute("INSERT OR REPLACE INTO analytics_buckets (granularity, start, data) VALUES (?, ?, ?)", key + (json.dumps(merged),))
+    
+    @staticmethod
+    def _bucket_from_json(data: str) -> Dict:
+        bucket = AnalyticsRollups.empty_bucket()
+        stored = json.loads(data)
+        latency = stored.get('latency') or []
+        # Pad histograms written before a latency bound was added
+        return AnalyticsRollups.merge(bucket, dict(stored, latency=latency + [0] * (len(bucket['latency']) - len(latency))))
+    
+    def get_timeseries(self, start: datetime, end: datetime, granularity: str) -> List[Dict]:
+        try:
+            # Bucket starts are whole minutes in UTC, stored with isoformat(), so the range compares as text
+            rows = self._connection().execute("SELECT granularity, start, data FROM analytics_buckets WHERE start >= ? AND start < ? ORDER BY start", (start.astimezone(timezone.utc).isoformat(), end.astimezone(timezone.utc).isoformat())).fetchall()
+            buckets = [(row['granularity'], datetime.fromisoformat(row['start']), self._bucket_from_json(row['data'])) for row in rows]
+            buckets += [('minute', bucket_start, bucket) for bucket_start, bucket in self.analytics.pending()['buckets'].items() if start <= bucket_start < end]
+            return AnalyticsRollups.series(buckets, granularity)
+        except Exception as e:
+            logger.error(f"Failed to get analytics timeseries: {e}")
+            raise
+    
+    def expire_sessions(self, before: datetime, limit: int) -> int:
+        try:
+            return self._connection().execute("UPDATE sessions SET status = 'expired' WHERE session_id IN (SELECT session_id FROM sessions WHERE status = 'active' AND last_interaction < ? LIMIT ?)", (self._timestamp(before), limit)).rowcount
+        except Exception as e:
+            logger.error(f"Failed to expire sessions: {e}")
+            raise
+    
+    def expired_sessions(self, before: datetime, limit: int) -> List[Dict]:
+        try:
+            rows = self._connection().execute(f"SELECT {self.SESSION_COLUMNS} FROM sessions WHERE status = 'expired' AND last_interaction < ? ORDER BY last_interaction LIMIT ?", (self._timestamp(before), limit)).fetchall()
+            return [self._session_to_dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Failed to list expired sessions: {e}")
+            raise
+    
+    def archive_session(self, session_id: str, before: datetime) -> Optional[int]:
+        try:
+            return self._write(self._archive_rows, session_id, self._timestamp(before))
+        except Exception as e:
+            logger.error(f"Failed to archive session {session_id}: {e}")
+            raise
+    
+    @staticmethod
+    def _archive_rows(connection, session_id: str, before: str) -> Optional[int]:
+        # The status check and the delete share the write lock, so a concurrent turn either lands first (and wins) or after
+        if not connection.execute("UPDATE sessions SET status = 'archived' WHERE session_id = ? AND status = 'expired' AND last_interaction < ?", (session_id, before)).rowcount:
+            return None
+        return connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,)).rowcount
+    
+    def close(self):
+        self.analytics.close()
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            connection.close()
+            self._local.connection = None
+        logger.info(f"SQLite session store {self.path} closed")
+    
+    def discard(self):
+        # Inherited across fork: the parent flushes its own analytics deltas; connections are reopened per pid
+        self.analytics.discard()
+
+# ==================== SESSION ARCHIVE ====================
+class SessionArchive:
+    # Cold storage for expired sessions: one compressed NDJSON file per session, partitioned by the session's
+    # creation date (<directory>/YYYY/MM/DD/<session_id>.ndjson.gz). Files are replaced whole, never appended to.
+    EXTENSIONS = {'gzip': '.ndjson.gz', 'zstd': '.ndjson.zst'}
+    # Stands in for flock where fcntl is missing (Windows), which only serializes passes within one process
+    _PROCESS_LOCK = threading.Lock()
+
+    def __init__(self, directory: str, compression: str = None):
+        self.directory = directory
+        self.compression = compression or Config.SESSION_ARCHIVE_COMPRESSION
+        if self.compression not in self.EXTENSIONS:
+            raise RuntimeError(f"Unknown SESSION_ARCHIVE_COMPRESSION {self.compression!r} (use gzip or zstd)")
+        if self.compression == 'zstd':
+            # Fail at startup rather than at the first archival
+            self._zstd()
+
+    @staticmethod
+    def _zstd():
+        try:
+            import zstandard
+            return zstandard
+        except ImportError as e:
+            raise RuntimeError("SESSION_ARCHIVE_COMPRESSION=zstd needs the zstandard package") from e
+
+    def path(self, session_id: str, created_at: str, compression: str = None) -> str:
+        year, month, day = str(created_at)[:10].split('-')
+        return os.path.join(self.directory, year, month, day, session_id + self.EXTENSIONS[compression or self.compression])
+
+    def _open(self, path: str, mode: str, compression: str):
+        if compression == 'gzip':
+            return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+        zstandard = self._zstd()
+        raw = open(path, mode + 'b')
+        stream = zstandard.ZstdCompressor().stream_writer(raw) if mode == 'w' else zstandard.ZstdDecompressor().stream_reader(raw)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+
+    def _find(self, session_id: str, created_at: str) -> Optional[Tuple[str, str]]:
+        # Files written before a change of SESSION_ARCHIVE_COMPRESSION stay readable
+        for compression in sorted(self.EXTENSIONS, key=lambda name: name != self.compression):
+            path = self.path(session_id, created_at, compression)
+            if os.path.exists(path):
+                return path, compression
+        return None
+
+    def read(self, session_id: str, created_at: str) -> List[Dict]:
+        found = self._find(session_id, created_at)
+        if found is None:
+            return []
+        path, compression = found
+        with self._open(path, 'r', compression) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def write(self, session_id: str, created_at: str, messages: List[Dict]):
+        path = self.path(session_id, created_at)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name and renamed, so readers only ever see a complete file
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with self._open(temporary, 'w', self.compression) as f:
+                for message in messages:
+                    f.write(json.dumps(message) + '\n')
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        for compression in self.EXTENSIONS:
+            if compression != self.compression and os.path.exists(self.path(session_id, created_at, compression)):
+                os.remove(self.path(session_id, created_at, compression))
+
+    def remove(self, session_id: str, created_at: str):
+        for compression in self.EXTENSIONS:
+            path = self.path(session_id, created_at, compression)
+            if os.path.exists(path):
+                os.remove(path)
+    
+    @contextmanager
+    def lock(self, session_id: str, created_at: str):
+        # An exclusive flock on the partition's .lock file, held by one lifecycle pass (thread or process) at a time
+        # while it rewrites a session's file. Locking the day rather than the session keeps it to one lock file per directory.
+        directory = os.path.dirname(self.path(session_id, created_at))
+        os.makedirs(directory, exist_ok=True)
+        try:
+            import fcntl
+        except ImportError:
+            with self._PROCESS_LOCK:
+                yield
+            return
+        with open(os.path.join(directory, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+# ==================== SESSION LIFECYCLE ====================
+class SessionLifecycleManager:
+    # Enforces SESSION_TIMEOUT_HOURS: each pass marks idle sessions expired and, with an archive, moves their messages
+    # into it and leaves a stub. Run it from one place (archive_sessions.py, or SESSION_LIFECYCLE_INTERVAL in a single
+    # process); a pass that does overlap another is still safe, since each session is archived under the archive's lock.
+    def __init__(self, store: SessionStore, archive: Optional[SessionArchive] = None, timeout_hours: float = None, batch_size: int = None):
+        self.store = store
+        self.archive = archive
+        self.timeout = timedelta(hours=timeout_hours if timeout_hours is not None else Config.SESSION_TIMEOUT_HOURS)
+        self.batch_size = batch_size or Config.SESSION_LIFECYCLE_BATCH_SIZE
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, now: datetime = None) -> Dict[str, int]:
+        before = (now or datetime.now(timezone.utc)) - self.timeout
+        counts = {'expired': 0, 'archived': 0, 'messages': 0}
+        while True:
+            expired = self.store.expire_sessions(before, self.batch_size)
+            counts['expired'] += expired
+            if expired < self.batch_size:
+                break
+        while self.archive is not None:
+            sessions = self.store.expired_sessions(before, self.batch_size)
+            archived = 0
+            for metadata in sessions:
+                moved = self._archive(metadata, before)
+                if moved is not None:
+                    archived += 1
+                    counts['messages'] += moved
+            counts['archived'] += archived
+            # A page with no progress would only be listed again
+            if len(sessions) < self.batch_size or not archived:
+                break
+        if any(counts.values()):
+            logger.info(f"Session lifecycle pass: {counts}")
+        return counts
+
+    def _archive(self, metadata: Dict, before: datetime) -> Optional[int]:
+        session_id, created_at = metadata['session_id'], metadata['created_at']
+        with self.archive.lock(session_id, created_at):
+            # A session can be archived more than once (a user came back after it expired), so the file keeps what it had
+            previous = self.archive.read(session_id, created_at)
+            seen = {message['message_id'] for message in previous}
+            added = [message for message in self.store.iter_session_messages(session_id) if message['message_id'] not in seen]
+            if added:
+                self.archive.write(session_id, created_at, previous + added)
+            deleted = self.store.archive_session(session_id, before)
+            if deleted is None and added:
+                # A new turn made the session active again, so it keeps its messages in the hot store and the file goes
+                # back to what this pass found
+                if previous:
+                    self.archive.write(session_id, created_at, previous)
+                else:
+                    self.archive.remove(session_id, created_at)
+            return deleted
+
+    def start(self, interval: float = None) -> 'SessionLifecycleManager':
+        interval = interval if interval is not None else Config.SESSION_LIFECYCLE_INTERVAL
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='session-lifecycle', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning(f"Session lifecycle pass failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5.0)
+
 # ==================== ENHANCED INTENT CLASSIFIER ====================
 class EnhancedIntentClassifier:
-    def __init__(self):
+    # Fallback when nlu.yml has no keywords_<intent> lookup tables
+    DEFAULT_INTENT_KEYWORDS = {'order_status': ['order', 'status', 'track', 'where', 'deliver', 'shipped', 'tracking'], 'product_info': ['product', 'price', 'specs', 'available', 'feature', 'cost', 'sell', 'buy'], 'return_refund': ['return', 'refund', 'exchange', 'back', 'money', 'cancel'], 'troubleshooting': ['broken', 'not work', 'issue', 'problem', 'error', 'help', 'fix', 'repair'], 'shipping': ['shipping', 'delivery', 'address', 'destination', 'transport', 'ship']}
+    
+    def __init__(self, intent_keywords: Dict[str, List[str]] = None):
         self.confidence_threshold = Config.CONFIDENCE_THRESHOLD
+        self.intent_keywords = intent_keywords or load_keyword_table(Config.NLU_DATA_PATH) or dict(self.DEFAULT_INTENT_KEYWORDS)
+        self.keyword_automaton = KeywordAutomaton(self.intent_keywords)
         self.entity_patterns = {'order_number': r'(?:order\s+|#|number\s+)(\d{4,})', 'product_name': r'\b(laptop|phone|tablet|headphones|keyboard|mouse|monitor|charger|camera|printer)\b', 'amount': r'\$(\d+(?:\.\d{2})?)', 'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', 'date': r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\b'}
-        logger.info("EnhancedIntentClassifier initialized")
+        self.entity_extractor = EntityExtractor(self.entity_patterns)
+        logger.info(f"EnhancedIntentClassifier initialized ({len(self.keyword_automaton)} keywords, {len(self.intent_keywords)} intents)")
+    
+    def register_entity_type(self, entity_type: str, pattern: str):
+        self.entity_extractor.register(entity_type, pattern)
+        self.entity_patterns[entity_type] = pattern
     
     def classify_intent(self, text: str) -> Dict[str, Any]:
-        text_lower = text.lower()
-        entities = self._extract_entities(text)
-        intent_keywords = {'order_status': ['order', 'status', 'track', 'where', 'deliver', 'shipped', 'tracking'], 'product_info': ['product', 'price', 'specs', 'available', 'feature', 'cost', 'sell', 'buy'], 'return_refund': ['return', 'refund', 'exchange', 'back', 'money', 'cancel'], 'troubleshooting': ['broken', 'not work', 'issue', 'problem', 'error', 'help', 'fix', 'repair'], 'shipping': ['shipping', 'delivery', 'address', 'destination', 'transport', 'ship']}
-        intent_scores = {}
-        for intent, keywords in intent_keywords.items():
-            score = sum(1 for kw in keywords if kw in text_lower)
-            if score > 0:
-                intent_scores[intent] = score
+        return self._keyword_intent(text, self._extract_entities(text))
+    
+    def classify_batch(self, texts) -> List[Dict[str, Any]]:
+        return [self.classify_intent(str(text)) for text in texts]
+    
+    def _keyword_intent(self, text: str, entities: List[Dict[str, Any]]) -> Dict[str, Any]:
+        intent_scores = self.keyword_automaton.scores(text)
         if intent_scores:
             best_intent = max(intent_scores, key=intent_scores.get)
             confidence = min(0.85 + (intent_scores[best_intent] * 0.05), 0.95)
@@ -255,13 +2017,38 @@ class EnhancedIntentClassifier:
         return {'intent': 'general_inquiry', 'confidence': 0.6, 'entities': entities, 'text': text, 'source': 'fallback'}
     
     def _extract_entities(self, text: str) -> List[Dict[str, Any]]:
-        entities = []
-        text_lower = text.lower()
-        for entity_type, pattern in self.entity_patterns.items():
-            matches = re.finditer(pattern, text_lower, re.IGNORECASE)
-            for match in matches:
-                entities.append({'entity': entity_type, 'value': match.group(1) if match.groups() else match.group(0), 'start': match.start(), 'end': match.end(), 'confidence': 0.9})
-        return entities
+        return self.entity_extractor.extract(text)
+
+class LinearIntentClassifier(EnhancedIntentClassifier):
+    # nlu.yml intents that the response generator knows under another name
+    INTENT_ALIASES = {'shipping_inquiry': 'shipping', 'pricing_question': 'product_info'}
+    
+    def __init__(self, model: LinearIntentModel, intent_keywords: Dict[str, List[str]] = None):
+        super().__init__(intent_keywords)
+        self.model = model
+        logger.info(f"LinearIntentClassifier initialized ({len(model.labels)} intents)")
+    
+    def classify_intent(self, text: str) -> Dict[str, Any]:
+        intent, confidence = self.model.predict(text)
+        return self._model_intent(text, self._extract_entities(text), intent, confidence)
+    
+    def classify_batch(self, texts) -> List[Dict[str, Any]]:
+        texts = [str(text) for text in texts]
+        intents, confidences = self.model.predict_batch(texts)
+        return [self._model_intent(text, self._extract_entities(text), intent, float(confidence)) for text, intent, confidence in zip(texts, intents, confidences)]
+    
+    def _model_intent(self, text: str, entities: List[Dict[str, Any]], intent: Optional[str], confidence: float) -> Dict[str, Any]:
+        if intent is None or confidence < self.confidence_threshold:
+            return self._keyword_intent(text, entities)
+        return {'intent': self.INTENT_ALIASES.get(intent, intent), 'confidence': confidence, 'entities': entities, 'text': text, 'source': 'linear_model'}
+
+def build_intent_classifier() -> EnhancedIntentClassifier:
+    if Config.INTENT_CLASSIFIER == 'linear':
+        try:
+            return LinearIntentClassifier(LinearIntentModel.load(Config.INTENT_MODEL_PATH))
+        except Exception as e:
+            logger.error(f"Could not load intent model from {Config.INTENT_MODEL_PATH}, using keyword classifier: {e}")
+    return EnhancedIntentClassifier()
 
 # See next artifact for ResponseGenerator and remaining code...
 
@@ -271,54 +2058,66 @@ import random
 
 # ==================== ENHANCED RESPONSE GENERATOR ====================
 class EnhancedResponseGenerator:
-    def __init__(self):
-        self.intent_responses = {
-            'order_status': {
-                'first_ask': ["I'd be happy to help you track your order! Could you please provide your order number?", "Let me help you check the status of your order. What's your order number?"],
-                'with_order': ["Thank you! I found order #{order}. It's currently in transit and should arrive within 3-5 business days.", "Great! Order #{order} has been shipped and is on its way to you. Expected delivery: 3-5 business days.", "Order #{order} is out for delivery! You should receive it today or tomorrow."],
-                'followup': ["Your order is being processed and will ship within 24 hours. You'll receive tracking information via email.", "The tracking shows your order is currently at the local distribution center. It should be delivered soon!"],
-                'topic_shift': "I see you're asking about order status now. "
-            },
-            'product_info': {
-                'first_ask': ["I'd be happy to help! Which product would you like to learn more about?", "What product interests you? I can give you all the details."],
-                'with_product': ["The {product} is a popular choice! It's priced at $299 and currently in stock. Would you like to know more about its features?", "We have the {product} available for $299. It comes with a 1-year warranty and free shipping. Interested?"],
-                'followup': ["That product is in stock and ready to ship! Is there anything specific you'd like to know about it?", "We have several options available. Would you like pricing information or details about features?"],
-                'topic_shift': "Now let me help you with product information. "
-            },
-            'return_refund': {
-                'first_ask': ["I'm sorry you'd like to return something. I can definitely help with that. What's your order number?", "I can help process a return for you. Could you provide your order number?"],
-                'with_order': ["Thank you for order #{order}. You're within our 30-day return window. I'll send you a return label via email.", "I can process the return for order #{order}. You'll receive a prepaid return label within 24 hours."],
-                'followup': ["Your return request is approved. Once we receive the item back, your refund will be processed within 5-7 business days.", "After you ship the item back using the return label, you'll see the refund in your account within a week."],
-                'topic_shift': "I understand you want to process a return. "
-            },
-            'troubleshooting': {
-                'first_ask': ["I'm sorry you're experiencing an issue. What exactly is happening?", "I'd like to help fix this. Can you describe what's going wrong?"],
-                'with_product': ["Let's troubleshoot your {product}. First, have you tried restarting the device?", "For {product} issues, let's try a few things: 1) Check the power connection, 2) Restart the device, 3) Update firmware if needed."],
-                'followup': ["I understand. Let's try clearing your browser cache and restarting your device. That often resolves the issue.", "This might be a technical issue on our end. Let me escalate this to our support team. You'll hear back within 24 hours."],
-                'topic_shift': "Now let's troubleshoot your issue. "
-            },
-            'shipping': {
-                'first_ask': ["I can help with shipping questions! What would you like to know?", "Do you have a question about shipping? I'm here to help."],
-                'followup': ["We offer standard shipping (5-7 days, free on orders over $50) and express shipping (2-3 days, $15). Which works best for you?", "We typically ship within 1-2 business days. Standard delivery is 5-7 days, or you can choose express for 2-3 days.", "We offer free shipping on orders over $50! Standard shipping is 5-7 business days. Would you like express shipping instead?"],
-                'topic_shift': "Let me help with your shipping question. "
-            },
-            'general_inquiry': {
-                'first_ask': ["Hello! How can I assist you today?", "Welcome! What can I help you with?"],
-                'followup': ["I understand. Let me help you with that.", "That's a great question. Here's what I can tell you...", "Thanks for asking! Is there anything else I can help you with?"]
-            }
-        }
+    RESPONSE_VARIANTS = ('first_ask', 'with_order', 'with_product', 'followup', 'topic_shift')
+    # Served only when the domain file cannot be loaded at startup
+    FALLBACK_RESPONSES = {'general_inquiry': {'first_ask': ["Hello! How can I assist you today?", "Welcome! What can I help you with?"]}}
+
+    def __init__(self, domain_path: str = None, reload_interval: float = None):
+        self.domain_path = domain_path or Config.DOMAIN_PATH
+        self.reload_interval = reload_interval if reload_interval is not None else Config.RESPONSES_RELOAD_INTERVAL
+        self.intent_responses = {intent: {variant: [ResponseTemplate(text) for text in texts] for variant, texts in pool.items()} for intent, pool in self.FALLBACK_RESPONSES.items()}
+        self._domain_mtime = None
+        self._next_reload_check = 0.0
+        self._reload_lock = threading.Lock()
+        self.reload_responses()
         self.stopwords = {'the', 'a', 'an', 'is', 'are', 'was', 'were', 'my', 'i', 'you', 'me', 'it', 'of', 'to', 'in', 'on', 'for', 'with', 'at', 'by', 'from'}
     
+    def reload_responses(self) -> bool:
+        try:
+            mtime = os.stat(self.domain_path).st_mtime_ns
+        except OSError:
+            mtime = -1
+        if mtime == self._domain_mtime:
+            return False
+        # Recorded before parsing, so a broken or missing file is reported once rather than on every check
+        self._domain_mtime = mtime
+        try:
+            table = load_domain_responses(self.domain_path, self.RESPONSE_VARIANTS)
+            missing = [intent for intent, pool in table.items() if 'first_ask' not in pool]
+            if 'general_inquiry' not in table or missing:
+                raise ValueError(f"every intent needs a utter_<intent>_first_ask response (missing for: {', '.join(missing) or 'general_inquiry'})")
+            # Swapped in whole, so a request never sees a half-loaded table
+            self.intent_responses = table
+            logger.info(f"Loaded {sum(len(t) for pool in table.values() for t in pool.values())} response templates for {len(table)} intents from {self.domain_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Could not load responses from {self.domain_path}, keeping the current ones: {e}")
+            return False
+
+    def _maybe_reload(self):
+        if self.reload_interval <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next_reload_check or not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_reload_check = now + self.reload_interval
+            self.reload_responses()
+        finally:
+            self._reload_lock.release()
+
     def generate_response(self, user_input: str, context_history: List[Dict] = None, intent: str = None, session_metadata: Dict = None, entities: List[Dict] = None) -> str:
         if not intent:
             intent = 'general_inquiry'
-        response_pool = self.intent_responses.get(intent, self.intent_responses['general_inquiry'])
+        self._maybe_reload()
+        intent_responses = self.intent_responses
+        response_pool = intent_responses.get(intent, intent_responses['general_inquiry'])
         entity_dict = {}
         if entities:
             for entity in entities:
                 entity_dict[entity['entity']] = entity['value']
         topic_shift = self._detect_topic_shift(intent, session_metadata)
-        topic_shift_prefix = response_pool.get('topic_shift', '') if topic_shift else ''
+        topic_shift_prefix = random.choice(response_pool['topic_shift']).render(entity_dict) if topic_shift and 'topic_shift' in response_pool else ''
         is_followup = self._is_followup_question(user_input, context_history, intent, session_metadata)
         if entity_dict.get('order_number') and 'with_order' in response_pool:
             response = random.choice(response_pool['with_order'])
@@ -328,16 +2127,7 @@ class EnhancedResponseGenerator:
             response = random.choice(response_pool.get('followup', response_pool['first_ask']))
         else:
             response = random.choice(response_pool['first_ask'])
-        response = self._substitute_entities(response, entity_dict)
-        if topic_shift_prefix:
-            response = topic_shift_prefix + response
-        return response
-    
-    def _substitute_entities(self, response: str, entities: Dict[str, str]) -> str:
-        for entity_type, value in entities.items():
-            placeholder = f"{{{entity_type.split('_')[-1]}}}"
-            response = response.replace(placeholder, str(value))
-        return response
+        return response.render(entity_dict, topic_shift_prefix)
     
     def _extract_keywords(self, text: str) -> set:
         if isinstance(text, dict):
@@ -388,83 +2178,275 @@ class EnhancedResponseGenerator:
 
 # ==================== UNIFIED DIALOGUE ENGINE ====================
 class DialogueEngine:
-    def __init__(self, neo4j_manager, intent_classifier, response_generator):
-        self.neo4j = neo4j_manager
+    def __init__(self, session_store: SessionStore, intent_classifier, response_generator):
+        self.store = session_store
         self.classifier = intent_classifier
         self.response_generator = response_generator
         self.validator = MessageValidator()
         logger.info("DialogueEngine initialized")
     
     def process_message(self, session_id: str, user_message: str) -> Dict[str, Any]:
-        is_valid, error_msg = self.validator.validate_message(user_message)
+        started = time.perf_counter()
+        is_valid, error_msg, sanitized_message = self._validate(user_message)
         if not is_valid:
             return {'status': 'error', 'error': error_msg}
-        sanitized_message = self.validator.sanitize_message(user_message)
-        try:
-            intent_result = self.classifier.classify_intent(sanitized_message)
-            intent = intent_result['intent']
-            confidence = intent_result['confidence']
-            entities = intent_result['entities']
-            context_history = self.neo4j.get_conversation_context(session_id, num_messages=Config.CONTEXT_WINDOW_SIZE)
-            session_metadata = self.neo4j.get_session_metadata(session_id)
-            entity_dict = {e['entity']: e['value'] for e in entities}
-            self.neo4j.add_message(session_id=session_id, sender='user', text=sanitized_message, intent=intent, entities=entity_dict, confidence=confidence)
-            self.neo4j.update_session_intent(session_id, intent, topic=intent)
-            bot_response = self.response_generator.generate_response(user_input=sanitized_message, context_history=context_history, intent=intent, session_metadata=session_metadata, entities=entities)
-            self.neo4j.add_message(session_id=session_id, sender='bot', text=bot_response, intent=f"response_to_{intent}", confidence=0.95)
-            return {'status': 'success', 'session_id': session_id, 'bot_response': bot_response, 'intent': intent, 'confidence': float(confidence), 'entities': entity_dict, 'is_followup': len(context_history) > 0, 'context_messages': len(context_history)}
+        try:
+            with TURN_STAGE_SECONDS.time('classify'):
+                intent_result = self.classifier.classify_intent(sanitized_message)
+            with TURN_STAGE_SECONDS.time('context_fetch'):
+                context_history, session_metadata = self.store.get_turn_context(session_id, num_messages=Config.CONTEXT_WINDOW_SIZE)
+            with TURN_STAGE_SECONDS.time('generate'):
+                result = self._compose_reply(session_id, sanitized_message, intent_result, context_history, session_metadata)
+            with TURN_STAGE_SECONDS.time('save_turn'):
+                self.store.save_turn(**self._turn_record(sanitized_message, result))
+            self._record_turn(started)
+            return result
         except Exception as e:
             logger.error(f"Message processing error: {e}", exc_info=True)
             return {'status': 'error', 'error': 'Failed to process message', 'session_id': session_id}
+    
+    def stream_message(self, session_id: str, user_message: str):
+        started = time.perf_counter()
+        is_valid, error_msg, sanitized_message = self._validate(user_message)
+        if not is_valid:
+            yield 'error', {'status': 'error', 'error': error_msg}
+            return
+        try:
+            with TURN_STAGE_SECONDS.time('classify'):
+                intent_result = self.classifier.classify_intent(sanitized_message)
+            yield 'classification', self._classification_event(session_id, intent_result)
+            with TURN_STAGE_SECONDS.time('context_fetch'):
+                context_history, session_metadata = self.store.get_turn_context(session_id, num_messages=Config.CONTEXT_WINDOW_SIZE)
+            with TURN_STAGE_SECONDS.time('generate'):
+                result = self._compose_reply(session_id, sanitized_message, intent_result, context_history, session_metadata)
+            yield 'reply', result
+            with TURN_STAGE_SECONDS.time('save_turn'):
+                saved = self.store.save_turn(**self._turn_record(sanitized_message, result))
+            self._record_turn(started)
+            yield 'done', dict(saved, session_id=session_id)
+        except Exception as e:
+            logger.error(f"Message streaming error: {e}", exc_info=True)
+            yield 'error', {'status': 'error', 'error': 'Failed to process message', 'session_id': session_id}
+    
+    def _validate(self, user_message: str) -> Tuple[bool, str, Optional[str]]:
+        with TURN_STAGE_SECONDS.time('validate'):
+            is_valid, error_msg = self.validator.validate_message(user_message)
+            return is_valid, error_msg, self.validator.sanitize_message(user_message) if is_valid else None
+    
+    def _record_turn(self, started: float):
+        elapsed = time.perf_counter() - started
+        TURN_STAGE_SECONDS.observe(elapsed, 'total')
+        self.store.record_latency(elapsed)
+    
+    @staticmethod
+    def _classification_event(session_id: str, intent_result: Dict[str, Any]) -> Dict[str, Any]:
+        return {'session_id': session_id, 'intent': intent_result['intent'], 'confidence': float(intent_result['confidence']), 'entities': {e['entity']: e['value'] for e in intent_result['entities']}}
+    
+    def _compose_reply(self, session_id: str, sanitized_message: str, intent_result: Dict[str, Any], context_history: List[Dict], session_metadata: Optional[Dict]) -> Dict[str, Any]:
+        intent = intent_result['intent']
+        confidence = intent_result['confidence']
+        entities = intent_result['entities']
+        entity_dict = {e['entity']: e['value'] for e in entities}
+        bot_response = self.response_generator.generate_response(user_input=sanitized_message, context_history=context_history, intent=intent, session_metadata=session_metadata, entities=entities)
+        return {'status': 'success', 'session_id': session_id, 'bot_response': bot_response, 'intent': intent, 'confidence': float(confidence), 'entities': entity_dict, 'is_followup': len(context_history) > 0, 'context_messages': len(context_history)}
+    
+    @staticmethod
+    def _turn_record(sanitized_message: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        return {'session_id': result['session_id'], 'user_text': sanitized_message, 'bot_text': result['bot_response'], 'intent': result['intent'], 'entities': result['entities'], 'confidence': result['confidence'], 'bot_intent': f"response_to_{result['intent']}", 'bot_confidence': 0.95, 'topic': result['intent']}
 
-# ==================== INITIALIZE FLASK APP ====================
-app = Flask(__name__)
-CORS(app)
+# ==================== APPLICATION COMPONENTS ====================
+# Built on first use (double-checked under a lock), so importing app.py never touches Neo4j
+class AppComponents:
+    FORK_SAFE = ('intent_classifier', 'response_generator')
 
-# Rate limiting
-limiter = Limiter(app=app, key_func=get_remote_address, default_limits=["200 per day", "50 per hour"])
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._components = {}
+        self.timings_ms = {}
 
-swagger = Swagger(app, template={"swagger": "2.0", "info": {"title": "🤖 Conversational AI Chatbot", "version": "2.0.0"}})
+    def _get(self, name: str, factory):
+        component = self._components.get(name)
+        if component is None:
+            with self._lock:
+                component = self._components.get(name)
+                if component is None:
+                    started = time.perf_counter()
+                    component = factory()
+                    self.timings_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+                    logger.info(f"{name} initialized in {self.timings_ms[name]}ms")
+                    self._components[name] = component
+        return component
 
-logger.info("Initializing application components...")
+    def _open_store(self) -> SessionStore:
+        archive = SessionArchive(Config.SESSION_ARCHIVE_DIR) if Config.SESSION_ARCHIVE_DIR else None
+        store = self._build_store()
+        store.archive = archive
+        if Config.SESSION_LIFECYCLE_INTERVAL > 0:
+            self._components['session_lifecycle'] = SessionLifecycleManager(store, store.archive).start()
+        return store
 
-try:
-    neo4j_uri = os.getenv('NEO4J_URI')
-    neo4j_user = os.getenv('NEO4J_USER')
-    neo4j_password = os.getenv('NEO4J_PASSWORD')
-    if not neo4j_uri or not neo4j_user or not neo4j_password:
-        logger.critical("Missing Neo4j environment variables!")
-        exit(1)
-    neo4j_manager = Neo4jSessionManager(neo4j_uri, neo4j_user, neo4j_password)
-    intent_classifier = EnhancedIntentClassifier()
-    response_generator = EnhancedResponseGenerator()
-    dialogue_engine = DialogueEngine(neo4j_manager, intent_classifier, response_generator)
-    logger.info("✓ All components initialized successfully!")
-except Exception as e:
-    logger.critical(f"Failed to initialize: {e}")
-    exit(1)
+    @staticmethod
+    def _build_store() -> SessionStore:
+        if Config.SESSION_STORE == 'memory':
+            return InMemorySessionStore()
+        if Config.SESSION_STORE == 'sqlite':
+            return SQLiteSessionStore(Config.SESSION_STORE_PATH)
+        if Config.SESSION_STORE != 'neo4j':
+            raise RuntimeError(f"Unknown SESSION_STORE {Config.SESSION_STORE!r} (use neo4j, sqlite or memory)")
+        neo4j_uri = os.getenv('NEO4J_URI')
+        neo4j_user = os.getenv('NEO4J_USER')
+        neo4j_password = os.getenv('NEO4J_PASSWORD')
+        if not neo4j_uri or not neo4j_user or not neo4j_password:
+            raise RuntimeError("Missing Neo4j environment variables (NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)")
+        return Neo4jSessionManager(neo4j_uri, neo4j_user, neo4j_password)
+
+    @property
+    def session_store(self) -> SessionStore:
+        return self._get('session_store', self._open_store)
+
+    @property
+    def neo4j_manager(self) -> Neo4jSessionManager:
+        # For the Neo4j-only maintenance scripts (rollup compaction, relabelling, recomputing counters)
+        store = self.session_store
+        if not isinstance(store, Neo4jSessionManager):
+            raise RuntimeError(f"This needs SESSION_STORE=neo4j (configured: {Config.SESSION_STORE})")
+        return store
+
+    @property
+    def intent_classifier(self) -> EnhancedIntentClassifier:
+        return self._get('intent_classifier', build_intent_classifier)
+
+    @property
+    def response_generator(self) -> EnhancedResponseGenerator:
+        return self._get('response_generator', EnhancedResponseGenerator)
+
+    @property
+    def dialogue_engine(self) -> DialogueEngine:
+        return self._get('dialogue_engine', lambda: DialogueEngine(self.session_store, self.intent_classifier, self.response_generator))
+
+    def preload(self):
+        # Only CPU-side components: the session store owns sockets or files and flusher threads, which must not cross a fork
+        for name in self.FORK_SAFE:
+            getattr(self, name)
+
+    def peek(self, name: str):
+        return self._components.get(name)
+
+    def override(self, name: str, component):
+        # Benchmarks swap in stand-ins (e.g. an in-memory session manager); the engine is rebuilt around them
+        with self._lock:
+            self._components[name] = component
+            if name != 'dialogue_engine':
+                self._components.pop('dialogue_engine', None)
+
+    def status(self) -> Dict[str, str]:
+        return {'session_store': f"{Config.SESSION_STORE}: {'connected' if 'session_store' in self._components else 'not_initialized'}",
+                'classifier': 'loaded' if 'intent_classifier' in self._components else 'not_initialized',
+                'generator': 'loaded' if 'response_generator' in self._components else 'not_initialized'}
+
+    def close(self):
+        with self._lock:
+            lifecycle = self._components.pop('session_lifecycle', None)
+            store = self._components.pop('session_store', None)
+            self._components.pop('dialogue_engine', None)
+        if lifecycle is not None:
+            lifecycle.close()
+        if store is not None:
+            store.close()
+
+    def after_fork(self):
+        # Shared-nothing workers: each child opens its own session store (and flusher threads) on first use
+        self._lock = threading.RLock()
+        store = self._components.pop('session_store', None)
+        self._components.pop('session_lifecycle', None)
+        self._components.pop('dialogue_engine', None)
+        if store is not None:
+            store.discard()
+
+components = AppComponents()
+os.register_at_fork(after_in_child=components.after_fork)
+STARTUP_TIMINGS_MS = {}
+
+# Rate limiting: undecorated routes get the default limits, keyed on the client address; the message routes' limits follow RATELIMIT_KEY,
+# plus RATELIMIT_ADDRESS_LIMIT per address when that key is an id the client sends
+def rate_limit_key() -> str:
+    if Config.RATELIMIT_KEY in ('user', 'session'):
+        data = request.get_json(silent=True) or {}
+        for field in (('user_id', 'session_id') if Config.RATELIMIT_KEY == 'user' else ('session_id',)):
+            value = data.get(field) or request.args.get(field)
+            if value:
+                return f"{field}:{value}"
+    return get_remote_address()
+
+def address_limit_exempt() -> bool:
+    # Keyed on the address already, the 30/minute limit is the tighter of the two
+    return Config.RATELIMIT_KEY not in ('user', 'session')
+
+limiter = Limiter(key_func=get_remote_address, default_limits=["200 per day", "50 per hour"], storage_uri=Config.RATELIMIT_STORAGE_URI, strategy=Config.RATELIMIT_STRATEGY, in_memory_fallback_enabled=True)
+
+api = Blueprint('api', __name__)
+
+def neo4j_pool_gauge() -> Dict[Tuple[str, str], int]:
+    # Never connects: a worker that has not talked to Neo4j yet simply has no pool
+    store = components.peek('session_store')
+    return Neo4jSessionManager.best_effort_pool_stats(store.driver) if isinstance(store, Neo4jSessionManager) else {}
+
+def write_behind_dropped_gauge() -> Dict[Tuple, int]:
+    store = components.peek('session_store')
+    write_behind = getattr(store, 'write_behind', None)
+    return {(): write_behind.dropped_messages} if write_behind else {}
+
+metrics_registry.gauge('chatbot_write_behind_dropped_messages', 'Queued messages dropped after every write-behind flush retry failed, since the process started', (), write_behind_dropped_gauge)
+metrics_registry.gauge('chatbot_neo4j_pool_connections', 'Neo4j driver pool connections by state (max is the configured pool size)', ('address', 'state'), neo4j_pool_gauge)
+
+@api.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@api.after_app_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # The view name, not the path, keeps label cardinality bounded (session ids are in the path)
+        endpoint = (request.endpoint or 'unmatched').rsplit('.', 1)[-1]
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method, str(response.status_code))
+    return response
 
 # ==================== API ENDPOINTS ====================
 
-@app.route('/')
+@api.route('/')
 def index():
     return jsonify({'message': 'Conversational Chatbot API v2.0', 'docs': '/apidocs/'})
 
 
-@app.route('/api/session/create', methods=['POST'])
+@api.route('/api/session/create', methods=['POST'])
 def create_session():
     try:
         # Use get_json with silent=True to handle empty/malformed JSON gracefully
         data = request.get_json(silent=True) or {}
         user_id = data.get('user_id')
-        session_id = neo4j_manager.create_session(user_id)
+        session_id = components.session_store.create_session(user_id)
         return jsonify({'session_id': session_id, 'status': 'created', 'timestamp': datetime.now().isoformat()}), 201
     except Exception as e:
         logger.error(f"Session creation error: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/message/send', methods=['POST'])
-@limiter.limit("30 per minute")
+@api.route('/api/session/bulk-create', methods=['POST'])
+def bulk_create_sessions():
+    try:
+        data = request.get_json(silent=True) or {}
+        count = data.get('count')
+        if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= Config.MAX_BULK_SESSIONS:
+            return jsonify({'error': f"count must be an integer from 1 to {Config.MAX_BULK_SESSIONS}"}), 400
+        session_ids = components.session_store.create_sessions(count, data.get('user_id'))
+        return jsonify({'session_ids': session_ids, 'count': len(session_ids), 'status': 'created', 'timestamp': datetime.now().isoformat()}), 201
+    except Exception as e:
+        logger.error(f"Bulk session creation error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/message/send', methods=['POST'])
+@limiter.limit("30 per minute", key_func=rate_limit_key)
+@limiter.limit(Config.RATELIMIT_ADDRESS_LIMIT, key_func=get_remote_address, exempt_when=address_limit_exempt)
 def send_message():
     try:
         data = request.json
@@ -473,8 +2455,10 @@ def send_message():
         if not user_message:
             return jsonify({'error': 'Empty message'}), 400
         if not session_id:
-            session_id = neo4j_manager.create_session()
-        result = dialogue_engine.process_message(session_id, user_message)
+            session_id = components.session_store.create_session()
+        elif not SessionStore.valid_session_id(session_id):
+            return jsonify({'error': 'Invalid session_id'}), 400
+        result = components.dialogue_engine.process_message(session_id, user_message)
         if result.get('status') == 'error':
             return jsonify(result), 400
         return jsonify(result), 200
@@ -482,28 +2466,56 @@ def send_message():
         logger.error(f"Message processing error: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/conversation/history/<session_id>', methods=['GET'])
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@api.route('/api/message/stream', methods=['POST'])
+@limiter.limit("30 per minute", key_func=rate_limit_key)
+@limiter.limit(Config.RATELIMIT_ADDRESS_LIMIT, key_func=get_remote_address, exempt_when=address_limit_exempt)
+def stream_message():
+    try:
+        data = request.get_json(silent=True) or {}
+        session_id = data.get('session_id')
+        user_message = (data.get('message') or '').strip()
+        if not user_message:
+            return jsonify({'error': 'Empty message'}), 400
+        if not session_id:
+            session_id = components.session_store.create_session()
+        elif not SessionStore.valid_session_id(session_id):
+            return jsonify({'error': 'Invalid session_id'}), 400
+        events = components.dialogue_engine.stream_message(session_id, user_message)
+    except Exception as e:
+        logger.error(f"Message streaming error: {e}")
+        return jsonify({'error': str(e)}), 500
+    return Response(stream_with_context(sse_event(event, payload) for event, payload in events), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@api.route('/api/conversation/history/<session_id>', methods=['GET'])
 def get_history(session_id):
     try:
-        limit = request.args.get('limit', 50, type=int)
-        history = neo4j_manager.get_conversation_context(session_id, limit)
-        return jsonify({'session_id': session_id, 'messages': history, 'count': len(history)}), 200
+        limit = max(1, min(request.args.get('limit', 50, type=int), Config.MAX_HISTORY_PAGE_SIZE))
+        history, next_cursor = components.session_store.get_history_page(session_id, limit, request.args.get('cursor'))
+        return jsonify({'session_id': session_id, 'messages': history, 'count': len(history), 'next_cursor': next_cursor}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"History retrieval error: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/session/context/<session_id>', methods=['GET'])
+@api.route('/api/session/context/<session_id>', methods=['GET'])
 def get_context(session_id):
     try:
-        metadata = neo4j_manager.get_session_metadata(session_id)
-        if not metadata:
+        metadata = components.session_store.get_session_metadata(session_id)
+        if metadata is None and SessionStore.issued_session_id(session_id):
+            # Issued ids are only stored by their first message; until then they read as a new, empty session
+            metadata = SessionStore._new_session_metadata(session_id)
+        if metadata is None:
             return jsonify({'error': 'Session not found'}), 404
         return jsonify({'session_id': session_id, 'metadata': metadata, 'timestamp': datetime.now().isoformat()}), 200
     except Exception as e:
         logger.error(f"Context retrieval error: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/feedback', methods=['POST'])
+@api.route('/api/feedback', methods=['POST'])
 def submit_feedback():
     try:
         data = request.json
@@ -511,56 +2523,148 @@ def submit_feedback():
         feedback = data.get('feedback')
         if feedback not in ['positive', 'negative']:
             return jsonify({'error': 'Invalid feedback'}), 400
-        neo4j_manager.add_feedback(message_id, feedback)
+        components.session_store.add_feedback(message_id, feedback)
         return jsonify({'status': 'success', 'message_id': message_id, 'feedback': feedback}), 200
     except Exception as e:
         logger.error(f"Feedback error: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/analytics/summary', methods=['GET'])
+@api.route('/api/analytics/summary', methods=['GET'])
 def get_analytics():
     try:
-        analytics = neo4j_manager.get_analytics()
+        analytics = components.session_store.get_analytics(exact=request.args.get('exact', 'false').lower() == 'true')
         return jsonify(analytics), 200
     except Exception as e:
         logger.error(f"Analytics error: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/conversation/export/<session_id>', methods=['GET'])
+@api.route('/api/analytics/timeseries', methods=['GET'])
+def get_analytics_timeseries():
+    try:
+        start, end, granularity = AnalyticsRollups.parse_range(request.args.get('from'), request.args.get('to'), request.args.get('granularity'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        points = components.session_store.get_timeseries(start, end, granularity)
+        return jsonify({'from': start.isoformat(), 'to': end.isoformat(), 'granularity': granularity, 'points': points}), 200
+    except Exception as e:
+        logger.error(f"Analytics timeseries error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/conversation/export/<session_id>', methods=['GET'])
 def export_conversation(session_id):
+    export_format = request.args.get('format', 'json')
+    if export_format not in ('json', 'ndjson'):
+        return jsonify({'error': "format must be 'json' or 'ndjson'"}), 400
+    messages = components.session_store.iter_history(session_id)
     try:
-        history = neo4j_manager.get_conversation_context(session_id, limit=1000)
-        export_data = {'session_id': session_id, 'exported_at': datetime.now().isoformat(), 'messages': history}
-        return jsonify(export_data), 200, {'Content-Disposition': f'attachment; filename=conversation_{session_id}.json'}
+        # Read the first record before the 200 goes out, so connection and query errors still get a 500
+        first = next(messages, None)
     except Exception as e:
         logger.error(f"Export error: {e}")
         return jsonify({'error': str(e)}), 500
+    messages = itertools.chain([first], messages) if first is not None else iter(())
+    chunks = export_chunks(session_id, messages, export_format)
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'application/json'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename=conversation_{session_id}.{export_format}'})
+
+class ExportEncoder:
+    # The chunks of a streamed export, shared with the ASGI app: one JSON document or NDJSON lines. A failure after
+    # the headers are sent ends the body with an "error" member (JSON) or line (NDJSON).
+    def __init__(self, session_id: str, export_format: str):
+        self.session_id = session_id
+        self.ndjson = export_format == 'ndjson'
+        self.count = 0
+    
+    def opening(self) -> List[str]:
+        return [] if self.ndjson else [json.dumps({'session_id': self.session_id, 'exported_at': datetime.now().isoformat()})[:-1] + ', "messages": [']
+    
+    def message(self, message: Dict) -> str:
+        chunk = json.dumps(message) + '\n' if self.ndjson else (', ' if self.count else '') + json.dumps(message)
+        self.count += 1
+        return chunk
+    
+    def closing(self) -> List[str]:
+        return [] if self.ndjson else [']}']
+    
+    def error(self, e: Exception) -> str:
+        logger.error(f"Export error: {e}")
+        error = {'error': f"Export failed: {e}"}
+        return json.dumps(error) + '\n' if self.ndjson else '], ' + json.dumps(error)[1:]
 
-@app.route('/api/health', methods=['GET'])
+def export_chunks(session_id: str, messages, export_format: str):
+    encoder = ExportEncoder(session_id, export_format)
+    try:
+        yield from encoder.opening()
+        for message in messages:
+            yield encoder.message(message)
+        yield from encoder.closing()
+    except Exception as e:
+        yield encoder.error(e)
+
+@api.route('/metrics', methods=['GET'])
+@limiter.exempt
+def prometheus_metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/health', methods=['GET'])
+@limiter.exempt
 def health_check():
     try:
-        return jsonify({'status': 'healthy', 'version': '2.0', 'components': {'neo4j': 'connected', 'classifier': 'loaded', 'generator': 'loaded'}, 'timestamp': datetime.now().isoformat()}), 200
+        # Reports without initializing anything, so a readiness probe never waits on Neo4j
+        return jsonify({'status': 'healthy', 'version': '2.0', 'components': components.status(), 'startup_ms': {**STARTUP_TIMINGS_MS, **components.timings_ms}, 'timestamp': datetime.now().isoformat()}), 200
     except Exception as e:
         logger.error(f"Health check error: {e}")
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def server_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
+# ==================== APP FACTORY ====================
+def create_app() -> Flask:
+    started = time.perf_counter()
+    flask_app = Flask(__name__)
+    CORS(flask_app)
+    limiter.init_app(flask_app)
+    if Config.SWAGGER_ENABLED:
+        from flasgger import Swagger
+        Swagger(flask_app, template={"swagger": "2.0", "info": {"title": "🤖 Conversational AI Chatbot", "version": "2.0.0"}})
+    flask_app.register_blueprint(api)
+    if Config.SESSION_STORE == 'neo4j' and not (os.getenv('NEO4J_URI') and os.getenv('NEO4J_USER') and os.getenv('NEO4J_PASSWORD')):
+        logger.warning("Missing Neo4j environment variables; endpoints that need the database will fail")
+    if Config.PRELOAD_COMPONENTS:
+        components.preload()
+    STARTUP_TIMINGS_MS['create_app'] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"App created in {STARTUP_TIMINGS_MS['create_app']}ms (module import {STARTUP_TIMINGS_MS['import']}ms); components connect on first use")
+    return flask_app
+
+STARTUP_TIMINGS_MS['import'] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+_APP_LOCK = threading.Lock()
+
+def __getattr__(name: str):
+    # `app` (what gunicorn app:app and `from app import app` load) is created on first access, so importing this
+    # module for its pieces (asgi_app.py, the maintenance scripts, tests) never builds the Flask app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _APP_LOCK:
+        if 'app' not in globals():
+            globals()['app'] = create_app()
+    return globals()['app']
+
 if __name__ == '__main__':
     try:
         logger.info("Starting Enhanced Flask application...")
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        create_app().run(debug=Config.DEBUG, host='0.0.0.0', port=5000)
     except KeyboardInterrupt:
         logger.info("Shutting down application...")
-        neo4j_manager.close()
     except Exception as e:
         logger.critical(f"Application error: {e}")
-        neo4j_manager.close()
         exit(1)
+    finally:
+        components.close()
         
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""
+Run one session lifecycle pass: expire idle sessions and archive their messages.
+
+Sessions idle for longer than SESSION_TIMEOUT_HOURS are marked expired. When
+SESSION_ARCHIVE_DIR (or --archive-dir) is set, their messages are moved to
+compressed NDJSON files under <dir>/YYYY/MM/DD/ and the session is left as an
+'archived' stub; history and export still read them. Run it from cron on one
+host; SESSION_LIFECYCLE_INTERVAL, which runs the same pass inside each app
+process, is off by default. It works with any SESSION_STORE except memory.
+
+Usage: python archive_sessions.py [--archive-dir /var/lib/chatbot/archive] [--timeout-hours 24] [--batch-size 100]
+"""
+
+import argparse
+import json
+import os
+
+# This process runs the pass itself, so the store must not start its own background one
+os.environ['SESSION_LIFECYCLE_INTERVAL'] = '0'
+
+from app import Config, SessionArchive, SessionLifecycleManager, components
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--archive-dir', default=Config.SESSION_ARCHIVE_DIR, help='archive root (default SESSION_ARCHIVE_DIR; unset only expires sessions)')
+    parser.add_argument('--timeout-hours', type=float, default=Config.SESSION_TIMEOUT_HOURS)
+    parser.add_argument('--batch-size', type=int, default=Config.SESSION_LIFECYCLE_BATCH_SIZE, help='sessions per query')
+    args = parser.parse_args()
+    try:
+        archive = SessionArchive(args.archive_dir) if args.archive_dir else None
+        manager = SessionLifecycleManager(components.session_store, archive, timeout_hours=args.timeout_hours, batch_size=args.batch_size)
+        print(json.dumps(manager.run_once()))
+    finally:
+        components.close()
+
+
+if __name__ == '__main__':
+    main()
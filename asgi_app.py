@@ -0,0 +1,617 @@
+"""
+Async (ASGI) serving mode for the Conversational Chatbot API.
+
+Exposes the same endpoints as the Flask app in app.py, but every Neo4j call
+goes through the neo4j async driver, so an in-flight request waiting on the
+database holds a coroutine instead of a thread.
+
+Run with:  uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+      or:  ASGI_WORKERS=4 python asgi_app.py  (several worker processes, with the
+           per-process context cache off unless CONTEXT_CACHE_SIZE is set)
+"""
+
+import os
+import asyncio
+import uuid
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+
+from neo4j import AsyncGraphDatabase, GraphDatabase
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from migrations import LATEST_VERSION, check_server_version, ensure_schema, read_version_async
+from app import sse_event, ExportEncoder, Config, SessionStore, metrics_registry, TURN_STAGE_SECONDS, HTTP_REQUEST_SECONDS, AnalyticsCounters, AnalyticsRollups, SessionContextCache, Neo4jSessionManager, SessionArchive, build_intent_classifier, EnhancedResponseGenerator, DialogueEngine
+
+logger = logging.getLogger(__name__)
+
+# ==================== ASYNC NEO4J SESSION MANAGER ====================
+class AsyncNeo4jSessionManager:
+    def __init__(self, uri: str, user: str, password: str, max_connections: int = 100, context_cache: SessionContextCache = None, archive: SessionArchive = None):
+        self.uri = uri
+        self._auth = (user, password)
+        self.driver = AsyncGraphDatabase.driver(uri, auth=(user, password), max_connection_pool_size=max_connections, connection_acquisition_timeout=30.0)
+        self.context_cache = context_cache if context_cache is not None else SessionContextCache()
+        self.archive = archive
+        self.analytics = AnalyticsCounters()
+        self._analytics_task = None
+
+    async def connect(self):
+        try:
+            self.schema_version, agent = await read_version_async(self.driver)
+            check_server_version(agent)
+            if self.schema_version < LATEST_VERSION:
+                # Raises SchemaOutdatedError if the schema stays behind, which fails the lifespan startup
+                self.schema_version = await asyncio.to_thread(self._migrate)
+            logger.info(f"Connected to Neo4j at {self.uri} (async driver, schema version {self.schema_version}/{LATEST_VERSION})")
+        except Exception as e:
+            logger.error(f"Failed to connect to Neo4j: {e}")
+            raise
+        self._analytics_task = asyncio.create_task(self._flush_analytics_loop())
+
+    def _migrate(self) -> int:
+        # The runner is synchronous; it gets a short-lived driver and only runs when the schema is behind
+        driver = GraphDatabase.driver(self.uri, auth=self._auth)
+        try:
+            return ensure_schema(driver, Config.AUTO_MIGRATE)
+        finally:
+            driver.close()
+
+    @staticmethod
+    async def _write(tx, query: str, **params):
+        result = await tx.run(query, **params)
+        return await result.consume()
+
+    @staticmethod
+    async def _read(tx, query: str, **params) -> List:
+        result = await tx.run(query, **params)
+        return [record async for record in result]
+
+    async def create_session(self, user_id: str = None) -> str:
+        session_id = (await self.create_sessions(1, user_id))[0]
+        self.context_cache.put(session_id, [], Neo4jSessionManager._new_session_metadata(session_id))
+        return session_id
+
+    async def create_sessions(self, count: int, user_id: str = None) -> List[str]:
+        # Same as the sync store: only sessions with a user_id are written now, the rest by their first turn
+        session_ids = [SessionStore.new_session_id() for _ in range(count)]
+        if user_id is None:
+            return session_ids
+        try:
+            async with self.driver.session() as session:
+                summary = await session.execute_write(self._write, Neo4jSessionManager.CREATE_SESSIONS_QUERY, session_ids=session_ids, user_id=user_id)
+            created = Neo4jSessionManager._sessions_created(summary, 0)
+            if created:
+                self.analytics.record_session(created)
+            logger.info(f"Created {created} session(s) for user {user_id}")
+            return session_ids
+        except Exception as e:
+            logger.error(f"Failed to create sessions: {e}")
+            raise
+
+    async def add_message(self, session_id: str, sender: str, text: str, intent: str = None, entities: Dict = None, confidence: float = None) -> Dict:
+        message_id = f"msg_{uuid.uuid4().hex[:12]}"
+        try:
+            row = Neo4jSessionManager._message_row(session_id, message_id, sender, text, intent, entities, confidence, datetime.now(timezone.utc))
+            async with self.driver.session() as session:
+                summary = await session.execute_write(self._write, Neo4jSessionManager.ADD_MESSAGE_QUERY, **row)
+            if Neo4jSessionManager._sessions_created(summary, 1):
+                self.analytics.record_session()
+            Neo4jSessionManager._record_written(self.context_cache, self.analytics, session_id, [row])
+            return {"message_id": message_id, "status": "added"}
+        except Exception as e:
+            logger.error(f"Failed to add message: {e}")
+            raise
+
+    async def get_conversation_context(self, session_id: str, num_messages: int = 5) -> List[Dict]:
+        cached = self.context_cache.get_messages(session_id, num_messages)
+        if cached is not None:
+            return cached
+        try:
+            async with self.driver.session() as session:
+                records = await session.execute_read(self._read, Neo4jSessionManager.RECENT_MESSAGES_QUERY, session_id=session_id, limit=num_messages)
+            messages = Neo4jSessionManager._oldest_first([record["m"] for record in records])
+            if num_messages >= self.context_cache.window_size:
+                self.context_cache.put(session_id, messages=messages)
+            return messages
+        except Exception as e:
+            logger.error(f"Failed to get conversation context: {e}")
+            return []
+
+    async def get_message_page(self, session_id: str, limit: int = 50, cursor: str = None) -> Tuple[List[Dict], Optional[str]]:
+        if cursor is None:
+            messages = await self.get_conversation_context(session_id, limit)
+        else:
+            before_ts, before_id = Neo4jSessionManager.decode_cursor(cursor)
+            try:
+                async with self.driver.session() as session:
+                    records = await session.execute_read(self._read, Neo4jSessionManager.HISTORY_PAGE_QUERY, session_id=session_id, before_ts=before_ts, before_id=before_id, limit=limit)
+                messages = Neo4jSessionManager._oldest_first([record["m"] for record in records])
+            except Exception as e:
+                logger.error(f"Failed to get message page: {e}")
+                raise
+        return messages, Neo4jSessionManager._next_cursor(messages, limit)
+
+    async def iter_session_messages(self, session_id: str):
+        async with self.driver.session(fetch_size=Config.EXPORT_FETCH_SIZE) as session:
+            result = await session.run(Neo4jSessionManager.EXPORT_MESSAGES_QUERY, session_id=session_id)
+            async for record in result:
+                yield Neo4jSessionManager._message_to_dict(record["m"])
+
+    async def get_history_page(self, session_id: str, limit: int = 50, cursor: str = None) -> Tuple[List[Dict], Optional[str]]:
+        messages, next_cursor = await self.get_message_page(session_id, limit, cursor)
+        if len(messages) >= limit:
+            return messages, next_cursor
+        return SessionStore._continue_into_archive(messages, next_cursor, await self._archived_messages(session_id), limit, cursor)
+
+    async def iter_history(self, session_id: str):
+        archived = await self._archived_messages(session_id)
+        seen = {message['message_id'] for message in archived}
+        for message in archived:
+            yield message
+        async for message in self.iter_session_messages(session_id):
+            if message['message_id'] not in seen:
+                yield message
+
+    async def _archived_messages(self, session_id: str) -> List[Dict]:
+        if self.archive is None:
+            return []
+        metadata = await self.get_session_metadata(session_id)
+        # Decompressing is file I/O, so it runs off the event loop
+        return await asyncio.to_thread(SessionStore._read_archive, self.archive, session_id, metadata)
+
+    async def get_session_metadata(self, session_id: str) -> Optional[Dict]:
+        cached = self.context_cache.get_metadata(session_id)
+        if cached is not None:
+            return cached
+        try:
+            async with self.driver.session() as session:
+                records = await session.execute_read(self._read, Neo4jSessionManager.SESSION_METADATA_QUERY, session_id=session_id)
+            if not records:
+                return None
+            metadata = Neo4jSessionManager._session_to_dict(records[0]["s"])
+            self.context_cache.put(session_id, metadata=metadata)
+            return metadata
+        except Exception as e:
+            logger.error(f"Failed to get session metadata: {e}")
+            raise
+
+    async def update_session_intent(self, session_id: str, intent: str, topic: str = None):
+        try:
+            async with self.driver.session() as session:
+                await session.execute_write(self._write, Neo4jSessionManager.UPDATE_INTENT_QUERY, session_id=session_id, intent=intent, topic=topic)
+            self.context_cache.record_intent(session_id, intent, topic)
+        except Exception as e:
+            logger.error(f"Failed to update session intent: {e}")
+
+    async def get_turn_context(self, session_id: str, num_messages: int = 5) -> Tuple[List[Dict], Optional[Dict]]:
+        messages = self.context_cache.get_messages(session_id, num_messages)
+        metadata = self.context_cache.get_metadata(session_id) if messages is not None else None
+        if metadata is not None:
+            return messages, metadata
+        try:
+            async with self.driver.session() as session:
+                records = await session.execute_read(self._read, Neo4jSessionManager.TURN_CONTEXT_QUERY, session_id=session_id, limit=num_messages)
+            if not records:
+                return [], None
+            messages = Neo4jSessionManager._oldest_first(records[0]["messages"])
+            metadata = Neo4jSessionManager._session_to_dict(records[0]["s"])
+            self.context_cache.put(session_id, messages, metadata)
+            return messages, metadata
+        except Exception as e:
+            logger.error(f"Failed to get turn context: {e}")
+            return [], None
+
+    async def save_turn(self, session_id: str, user_text: str, bot_text: str, intent: str = None, entities: Dict = None, confidence: float = None, bot_intent: str = None, bot_confidence: float = None, topic: str = None) -> Dict:
+        try:
+            rows = Neo4jSessionManager._turn_rows(session_id, user_text, bot_text, intent, entities, confidence, bot_intent, bot_confidence)
+            async with self.driver.session() as session:
+                summary = await session.execute_write(self._write, Neo4jSessionManager.SAVE_TURN_QUERY, **Neo4jSessionManager._save_turn_params(rows, topic))
+            if Neo4jSessionManager._sessions_created(summary, 2):
+                self.analytics.record_session()
+            Neo4jSessionManager._record_written(self.context_cache, self.analytics, session_id, rows, {'session_id': session_id, 'intent': intent, 'topic': topic})
+            return Neo4jSessionManager._turn_result(rows, "added")
+        except Exception as e:
+            logger.error(f"Failed to save turn: {e}")
+            raise
+
+    async def add_feedback(self, message_id: str, feedback: str):
+        try:
+            async with self.driver.session() as session:
+                records = await session.execute_write(self._read, Neo4jSessionManager.FEEDBACK_QUERY, message_id=message_id, feedback=feedback)
+            if records:
+                self.analytics.record_feedback(feedback, records[0]["previous"])
+            logger.info(f"Feedback added for message {message_id}: {feedback}")
+        except Exception as e:
+            logger.error(f"Failed to add feedback: {e}")
+
+    async def get_analytics(self, exact: bool = False) -> Dict:
+        try:
+            if exact:
+                return Neo4jSessionManager._stats_to_dict(*Neo4jSessionManager._counts_to_stats(await self.compute_exact_analytics()), AnalyticsCounters._empty())
+            async with self.driver.session() as session:
+                records = await session.execute_read(self._read, Neo4jSessionManager.STATS_QUERY)
+            if not records or records[0]["st"] is None:
+                return await self.recompute_analytics()
+            return Neo4jSessionManager._stats_to_dict(records[0]["st"], records[0]["intents"], self.analytics.pending())
+        except Exception as e:
+            logger.error(f"Failed to get analytics: {e}")
+            return {}
+
+    async def compute_exact_analytics(self) -> Dict:
+        try:
+            names = list(Neo4jSessionManager.EXACT_ANALYTICS_QUERIES)
+            results = await asyncio.gather(*(self._run_aggregate(Neo4jSessionManager.EXACT_ANALYTICS_QUERIES[name], name in Neo4jSessionManager.GROUPED_EXACT_ANALYTICS) for name in names))
+            return Neo4jSessionManager._exact_to_counts(dict(zip(names, results)))
+        except Exception as e:
+            logger.error(f"Failed to compute exact analytics: {e}")
+            raise
+
+    async def _run_aggregate(self, query: str, grouped: bool):
+        async with self.driver.session(fetch_size=Config.ANALYTICS_FETCH_SIZE) as session:
+            return await session.execute_read(self._fold_aggregate, query, grouped)
+
+    @staticmethod
+    async def _fold_aggregate(tx, query: str, grouped: bool):
+        groups, total = {}, 0
+        result = await tx.run(query)
+        async for record in result:
+            if grouped:
+                groups[record['key']] = groups.get(record['key'], 0) + record['count']
+            else:
+                total += record['count']
+        return groups if grouped else total
+
+    async def recompute_analytics(self) -> Dict:
+        await self.flush_analytics()
+        counts = await self.compute_exact_analytics()
+        async with self.driver.session() as session:
+            await session.execute_write(self._recompute_stats, counts)
+        logger.info("Analytics counters recomputed from the graph")
+        return Neo4jSessionManager._stats_to_dict(*Neo4jSessionManager._counts_to_stats(counts), self.analytics.pending())
+
+    @staticmethod
+    async def _recompute_stats(tx, counts: Dict):
+        for query in Neo4jSessionManager.RECOMPUTE_STATS_QUERIES:
+            result = await tx.run(query, **counts)
+            await result.consume()
+
+    def record_latency(self, seconds: float):
+        self.analytics.record_latency(seconds)
+
+    async def get_timeseries(self, start: datetime, end: datetime, granularity: str) -> List[Dict]:
+        try:
+            async with self.driver.session() as session:
+                records = await session.execute_read(self._read, Neo4jSessionManager.ROLLUP_RANGE_QUERY, granularities=list(AnalyticsRollups.GRANULARITIES), start=start, end=end)
+            return Neo4jSessionManager._timeseries([record["b"] for record in records], self.analytics.pending(), start, end, granularity)
+        except Exception as e:
+            logger.error(f"Failed to get analytics timeseries: {e}")
+            raise
+
+    async def flush_analytics(self):
+        deltas = self.analytics.drain()
+        if deltas is None:
+            return
+        try:
+            async with self.driver.session() as session:
+                await session.execute_write(self._write_analytics, deltas)
+        except Exception as e:
+            self.analytics.restore(deltas)
+            logger.warning(f"Analytics counter flush failed: {e}")
+
+    @staticmethod
+    async def _write_analytics(tx, deltas: Dict):
+        for query, params in ((Neo4jSessionManager.STATS_FLUSH_QUERY, AnalyticsCounters.flush_params(deltas)), (Neo4jSessionManager.ROLLUP_FLUSH_QUERY, {'buckets': AnalyticsCounters.bucket_rows(deltas)})):
+            result = await tx.run(query, **params)
+            await result.consume()
+
+    async def _flush_analytics_loop(self):
+        while True:
+            await asyncio.sleep(Config.ANALYTICS_FLUSH_INTERVAL)
+            await self.flush_analytics()
+
+    async def close(self):
+        try:
+            if self._analytics_task:
+                self._analytics_task.cancel()
+            await self.flush_analytics()
+            await self.driver.close()
+            logger.info("Neo4j connection closed")
+        except Exception as e:
+            logger.error(f"Error closing Neo4j connection: {e}")
+
+# ==================== ASYNC DIALOGUE ENGINE ====================
+class AsyncDialogueEngine(DialogueEngine):
+    async def process_message(self, session_id: str, user_message: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        is_valid, error_msg, sanitized_message = self._validate(user_message)
+        if not is_valid:
+            return {'status': 'error', 'error': error_msg}
+        try:
+            with TURN_STAGE_SECONDS.time('classify'):
+                intent_result = self.classifier.classify_intent(sanitized_message)
+            with TURN_STAGE_SECONDS.time('context_fetch'):
+                context_history, session_metadata = await self.store.get_turn_context(session_id, num_messages=Config.CONTEXT_WINDOW_SIZE)
+            with TURN_STAGE_SECONDS.time('generate'):
+                result = self._compose_reply(session_id, sanitized_message, intent_result, context_history, session_metadata)
+            with TURN_STAGE_SECONDS.time('save_turn'):
+                await self.store.save_turn(**self._turn_record(sanitized_message, result))
+            self._record_turn(started)
+            return result
+        except Exception as e:
+            logger.error(f"Message processing error: {e}", exc_info=True)
+            return {'status': 'error', 'error': 'Failed to process message', 'session_id': session_id}
+
+    async def stream_message(self, session_id: str, user_message: str):
+        started = time.perf_counter()
+        is_valid, error_msg, sanitized_message = self._validate(user_message)
+        if not is_valid:
+            yield 'error', {'status': 'error', 'error': error_msg}
+            return
+        try:
+            with TURN_STAGE_SECONDS.time('classify'):
+                intent_result = self.classifier.classify_intent(sanitized_message)
+            yield 'classification', self._classification_event(session_id, intent_result)
+            with TURN_STAGE_SECONDS.time('context_fetch'):
+                context_history, session_metadata = await self.store.get_turn_context(session_id, num_messages=Config.CONTEXT_WINDOW_SIZE)
+            with TURN_STAGE_SECONDS.time('generate'):
+                result = self._compose_reply(session_id, sanitized_message, intent_result, context_history, session_metadata)
+            yield 'reply', result
+            with TURN_STAGE_SECONDS.time('save_turn'):
+                saved = await self.store.save_turn(**self._turn_record(sanitized_message, result))
+            self._record_turn(started)
+            yield 'done', dict(saved, session_id=session_id)
+        except Exception as e:
+            logger.error(f"Message streaming error: {e}", exc_info=True)
+            yield 'error', {'status': 'error', 'error': 'Failed to process message', 'session_id': session_id}
+
+# ==================== API ENDPOINTS ====================
+async def read_json(request: Request) -> Dict:
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+async def index(request: Request):
+    return JSONResponse({'message': 'Conversational Chatbot API v2.0', 'docs': '/apidocs/'})
+
+async def create_session(request: Request):
+    try:
+        data = await read_json(request)
+        session_id = await request.app.state.neo4j_manager.create_session(data.get('user_id'))
+        return JSONResponse({'session_id': session_id, 'status': 'created', 'timestamp': datetime.now().isoformat()}, status_code=201)
+    except Exception as e:
+        logger.error(f"Session creation error: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def bulk_create_sessions(request: Request):
+    try:
+        data = await read_json(request)
+        count = data.get('count')
+        if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= Config.MAX_BULK_SESSIONS:
+            return JSONResponse({'error': f"count must be an integer from 1 to {Config.MAX_BULK_SESSIONS}"}, status_code=400)
+        session_ids = await request.app.state.neo4j_manager.create_sessions(count, data.get('user_id'))
+        return JSONResponse({'session_ids': session_ids, 'count': len(session_ids), 'status': 'created', 'timestamp': datetime.now().isoformat()}, status_code=201)
+    except Exception as e:
+        logger.error(f"Bulk session creation error: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def send_message(request: Request):
+    try:
+        data = await read_json(request)
+        session_id = data.get('session_id')
+        user_message = (data.get('message') or '').strip()
+        if not user_message:
+            return JSONResponse({'error': 'Empty message'}, status_code=400)
+        if not session_id:
+            session_id = await request.app.state.neo4j_manager.create_session()
+        elif not SessionStore.valid_session_id(session_id):
+            return JSONResponse({'error': 'Invalid session_id'}, status_code=400)
+        result = await request.app.state.dialogue_engine.process_message(session_id, user_message)
+        return JSONResponse(result, status_code=400 if result.get('status') == 'error' else 200)
+    except Exception as e:
+        logger.error(f"Message processing error: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def stream_message(request: Request):
+    try:
+        data = await read_json(request)
+        session_id = data.get('session_id')
+        user_message = (data.get('message') or '').strip()
+        if not user_message:
+            return JSONResponse({'error': 'Empty message'}, status_code=400)
+        if not session_id:
+            session_id = await request.app.state.neo4j_manager.create_session()
+        elif not SessionStore.valid_session_id(session_id):
+            return JSONResponse({'error': 'Invalid session_id'}, status_code=400)
+    except Exception as e:
+        logger.error(f"Message streaming error: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+    async def body():
+        async for event, payload in request.app.state.dialogue_engine.stream_message(session_id, user_message):
+            yield sse_event(event, payload)
+    return StreamingResponse(body(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+async def get_history(request: Request):
+    session_id = request.path_params['session_id']
+    try:
+        limit = int(request.query_params.get('limit', 50))
+    except ValueError:
+        limit = 50
+    limit = max(1, min(limit, Config.MAX_HISTORY_PAGE_SIZE))
+    try:
+        history, next_cursor = await request.app.state.neo4j_manager.get_history_page(session_id, limit, request.query_params.get('cursor'))
+        return JSONResponse({'session_id': session_id, 'messages': history, 'count': len(history), 'next_cursor': next_cursor})
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        logger.error(f"History retrieval error: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def get_context(request: Request):
+    session_id = request.path_params['session_id']
+    try:
+        metadata = await request.app.state.neo4j_manager.get_session_metadata(session_id)
+        if metadata is None and SessionStore.issued_session_id(session_id):
+            # Issued ids are only stored by their first message; until then they read as a new, empty session
+            metadata = SessionStore._new_session_metadata(session_id)
+        if metadata is None:
+            return JSONResponse({'error': 'Session not found'}, status_code=404)
+        return JSONResponse({'session_id': session_id, 'metadata': metadata, 'timestamp': datetime.now().isoformat()})
+    except Exception as e:
+        logger.error(f"Context retrieval error: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def submit_feedback(request: Request):
+    try:
+        data = await read_json(request)
+        message_id = data.get('message_id')
+        feedback = data.get('feedback')
+        if feedback not in ['positive', 'negative']:
+            return JSONResponse({'error': 'Invalid feedback'}, status_code=400)
+        await request.app.state.neo4j_manager.add_feedback(message_id, feedback)
+        return JSONResponse({'status': 'success', 'message_id': message_id, 'feedback': feedback})
+    except Exception as e:
+        logger.error(f"Feedback error: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def get_analytics(request: Request):
+    try:
+        return JSONResponse(await request.app.state.neo4j_manager.get_analytics(exact=request.query_params.get('exact', 'false').lower() == 'true'))
+    except Exception as e:
+        logger.error(f"Analytics error: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def get_analytics_timeseries(request: Request):
+    try:
+        start, end, granularity = AnalyticsRollups.parse_range(request.query_params.get('from'), request.query_params.get('to'), request.query_params.get('granularity'))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    try:
+        points = await request.app.state.neo4j_manager.get_timeseries(start, end, granularity)
+        return JSONResponse({'from': start.isoformat(), 'to': end.isoformat(), 'granularity': granularity, 'points': points})
+    except Exception as e:
+        logger.error(f"Analytics timeseries error: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def export_conversation(request: Request):
+    session_id = request.path_params['session_id']
+    export_format = request.query_params.get('format', 'json')
+    if export_format not in ('json', 'ndjson'):
+        return JSONResponse({'error': "format must be 'json' or 'ndjson'"}, status_code=400)
+    messages = request.app.state.neo4j_manager.iter_history(session_id)
+    try:
+        # Read the first record before the 200 goes out, so connection and query errors still get a 500
+        first = await messages.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except Exception as e:
+        logger.error(f"Export error: {e}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+    media_type = 'application/x-ndjson' if export_format == 'ndjson' else 'application/json'
+    return StreamingResponse(export_chunks_async(session_id, first, messages, export_format), media_type=media_type, headers={'Content-Disposition': f'attachment; filename=conversation_{session_id}.{export_format}'})
+
+async def export_chunks_async(session_id: str, first: Optional[Dict], rest, export_format: str):
+    encoder = ExportEncoder(session_id, export_format)
+    try:
+        for chunk in encoder.opening():
+            yield chunk
+        if first is not None:
+            yield encoder.message(first)
+            async for message in rest:
+                yield encoder.message(message)
+        for chunk in encoder.closing():
+            yield chunk
+    except Exception as e:
+        yield encoder.error(e)
+
+async def health_check(request: Request):
+    return JSONResponse({'status': 'healthy', 'version': '2.0', 'server': 'asgi', 'components': {'neo4j': 'connected', 'classifier': 'loaded', 'generator': 'loaded'}, 'timestamp': datetime.now().isoformat()})
+
+async def prometheus_metrics(request: Request):
+    return PlainTextResponse(metrics_registry.render(), media_type='text/plain; version=0.0.4')
+
+async def not_found(request: Request, exc):
+    return JSONResponse({'error': 'Endpoint not found'}, status_code=404)
+
+async def server_error(request: Request, exc):
+    return JSONResponse({'error': 'Internal server error'}, status_code=500)
+
+# ==================== REQUEST TIMING ====================
+class RequestTimingMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware, which would buffer streamed responses; records time to the response headers
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            if message['type'] == 'http.response.start':
+                endpoint = scope.get('endpoint')
+                HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint.__name__ if endpoint else 'unmatched', scope['method'], str(message['status']))
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+# ==================== INITIALIZE ASGI APP ====================
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    neo4j_uri = os.getenv('NEO4J_URI')
+    neo4j_user = os.getenv('NEO4J_USER')
+    neo4j_password = os.getenv('NEO4J_PASSWORD')
+    if not neo4j_uri or not neo4j_user or not neo4j_password:
+        raise RuntimeError("Missing Neo4j environment variables!")
+    archive = SessionArchive(Config.SESSION_ARCHIVE_DIR) if Config.SESSION_ARCHIVE_DIR else None
+    neo4j_manager = AsyncNeo4jSessionManager(neo4j_uri, neo4j_user, neo4j_password, archive=archive)
+    await neo4j_manager.connect()
+    if Config.SESSION_LIFECYCLE_INTERVAL > 0:
+        # Each uvicorn worker would run its own pass (through a second, sync driver), so expiry is left to the cron script
+        logger.warning("SESSION_LIFECYCLE_INTERVAL is ignored by the ASGI app; run archive_sessions.py from cron to expire and archive sessions")
+    app.state.neo4j_manager = neo4j_manager
+    # Point the pool gauge at the async driver; the Flask components never connect in this process
+    metrics_registry.gauge('chatbot_neo4j_pool_connections', 'Neo4j driver pool connections by state (max is the configured pool size)', ('address', 'state'), lambda: Neo4jSessionManager.best_effort_pool_stats(neo4j_manager.driver))
+    app.state.dialogue_engine = AsyncDialogueEngine(neo4j_manager, build_intent_classifier(), EnhancedResponseGenerator())
+    logger.info("✓ All async components initialized successfully!")
+    yield
+    await neo4j_manager.close()
+
+routes = [
+    Route('/', index),
+    Route('/api/session/create', create_session, methods=['POST']),
+    Route('/api/session/bulk-create', bulk_create_sessions, methods=['POST']),
+    Route('/api/message/send', send_message, methods=['POST']),
+    Route('/api/message/stream', stream_message, methods=['POST']),
+    Route('/api/conversation/history/{session_id}', get_history, methods=['GET']),
+    Route('/api/session/context/{session_id}', get_context, methods=['GET']),
+    Route('/api/feedback', submit_feedback, methods=['POST']),
+    Route('/api/analytics/summary', get_analytics, methods=['GET']),
+    Route('/api/analytics/timeseries', get_analytics_timeseries, methods=['GET']),
+    Route('/api/conversation/export/{session_id}', export_conversation, methods=['GET']),
+    Route('/api/health', health_check, methods=['GET']),
+    Route('/metrics', prometheus_metrics, methods=['GET']),
+]
+
+app = Starlette(routes=routes, middleware=[Middleware(RequestTimingMiddleware), Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])], exception_handlers={404: not_found, 500: server_error}, lifespan=lifespan)
+
+if __name__ == '__main__':
+    import secrets
+    import uvicorn
+    workers = int(os.getenv('ASGI_WORKERS', '1'))
+    if workers > 1:
+        # As in gunicorn.conf.py: each worker process would cache context the others go on to change, and the
+        # workers must agree on the key that signs session ids. Workers import the app afresh, so Config sees both.
+        os.environ.setdefault('CONTEXT_CACHE_SIZE', '0')
+        os.environ.setdefault('SESSION_ID_SECRET', secrets.token_hex(32))
+    uvicorn.run('asgi_app:app', host='0.0.0.0', port=int(os.getenv('PORT', '5000')), workers=workers)
@@ -0,0 +1,53 @@
+"""
+Per-message cost of entity extraction as the number of entity types grows.
+
+Compares the old per-type re.finditer loop with the single-pass EntityExtractor.
+
+Usage: python benchmarks/bench_entity_extraction.py [--repeat 2000]
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nlu_engine import EntityExtractor
+
+BASE_PATTERNS = {'order_number': r'(?:order\s+|#|number\s+)(\d{4,})', 'product_name': r'\b(laptop|phone|tablet|headphones|keyboard|mouse|monitor|charger|camera|printer)\b', 'amount': r'\$(\d+(?:\.\d{2})?)', 'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', 'date': r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\b'}
+MESSAGE = "Hi, my order #123456 for a laptop ($1299.99) placed on 12/05/2024 never arrived, please email jane.doe@example.com"
+
+
+def make_patterns(count: int) -> dict:
+    patterns = dict(BASE_PATTERNS)
+    for i in range(count - len(patterns)):
+        patterns[f'custom_{i}'] = rf'\bref{i}-(\d+)\b'
+    return patterns
+
+
+def legacy_extract(patterns: dict, text: str) -> list:
+    entities = []
+    text_lower = text.lower()
+    for entity_type, pattern in patterns.items():
+        for match in re.finditer(pattern, text_lower, re.IGNORECASE):
+            entities.append({'entity': entity_type, 'value': match.group(1) if match.groups() else match.group(0), 'start': match.start(), 'end': match.end(), 'confidence': 0.9})
+    return entities
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+    print(f"{'types':>6} {'legacy us/msg':>14} {'single-pass us/msg':>19} {'speedup':>8}")
+    for count in (5, 20, 50, 100, 200, 500):
+        patterns = make_patterns(count)
+        extractor = EntityExtractor(patterns)
+        legacy = min(timeit.repeat(lambda: legacy_extract(patterns, MESSAGE), number=args.repeat, repeat=3)) / args.repeat * 1e6
+        single = min(timeit.repeat(lambda: extractor.extract(MESSAGE), number=args.repeat, repeat=3)) / args.repeat * 1e6
+        print(f"{count:>6} {legacy:>14.1f} {single:>19.1f} {legacy / single:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Microbenchmarks of the per-turn NLU and response hot paths, checked against a stored baseline.
+
+Times MessageValidator, classify_intent, _extract_entities,
+_is_followup_question and generate_response. Messages go up to
+Config.MAX_MESSAGE_LENGTH, context windows up to Config.CONTEXT_WINDOW_SIZE,
+and large keyword and entity tables are included. Each case reports the best
+of --rounds rounds, in microseconds per call.
+
+Timings are stored relative to a fixed pure-Python reference loop, timed
+next to each case, so a baseline recorded on one machine stays usable on a
+faster or slower one and CPU frequency drift during a run cancels out.
+With a baseline present, the run exits non-zero when any case is more than
+--threshold slower than it; a case over the threshold is re-measured
+(--confirm times) first, so one noisy sample does not fail the run. Record a new baseline with --save after an
+intended change (it stores the median of three measurements per case) and
+commit it alongside the change.
+
+Usage: python benchmarks/bench_hot_paths.py [--save] [--threshold 0.25] [--filter classify] [--baseline benchmarks/baselines/hot_paths.json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import timeit
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+logging.disable(logging.WARNING)
+
+from app import Config, EnhancedIntentClassifier, EnhancedResponseGenerator, MessageValidator
+from bench_entity_extraction import make_patterns
+from bench_intent_keywords import make_table
+from nlu_engine import load_keyword_table
+
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baselines', 'hot_paths.json')
+MESSAGE = "Hi, my order #123456 for a laptop placed on 12/05/2024 still has not shipped, the tracking page shows an error and I would like a refund to jane.doe@example.com if it cannot be delivered this week. "
+HISTORY_TEXTS = ["Where is my order 123456?", "Great! Order #123456 has been shipped and is on its way to you.", "It still has not arrived and the tracking page shows an error", "I'm sorry about that. Let me check the delivery status for you.", "Can I get a refund instead?", "Of course. Refunds are processed within 5-7 business days."]
+
+
+def message_of(length: int) -> str:
+    return (MESSAGE * (length // len(MESSAGE) + 1))[:length].rstrip() or 'hi'
+
+
+def history_of(size: int) -> List[Dict]:
+    return [{'sender': 'user' if i % 2 == 0 else 'bot', 'text': HISTORY_TEXTS[i % len(HISTORY_TEXTS)], 'intent': 'order_status'} for i in range(size)]
+
+
+def reference_loop():
+    # Fixed interpreter-bound work; every case is stored as a multiple of it
+    total = 0
+    for i in range(1000):
+        total += i * i % 7
+    return total
+
+
+def build_cases() -> Dict[str, Callable[[], object]]:
+    random.seed(7)
+    validator = MessageValidator()
+    classifier = EnhancedIntentClassifier()
+    large_keywords = EnhancedIntentClassifier(make_table(load_keyword_table(Config.NLU_DATA_PATH) or EnhancedIntentClassifier.DEFAULT_INTENT_KEYWORDS, 5000))
+    large_entities = EnhancedIntentClassifier()
+    for entity_type, pattern in make_patterns(200).items():
+        if entity_type not in large_entities.entity_patterns:
+            large_entities.register_entity_type(entity_type, pattern)
+    generator = EnhancedResponseGenerator()
+    metadata = {'user_intent': 'order_status', 'topic': 'order_status', 'interaction_count': 4}
+    entities = classifier._extract_entities(MESSAGE)
+
+    cases = {}
+    lengths = sorted({16, 128, 512, Config.MAX_MESSAGE_LENGTH})
+    for length in lengths:
+        text = message_of(length)
+        cases[f"validate_message[len={length}]"] = lambda text=text: validator.validate_message(text)
+        cases[f"sanitize_message[len={length}]"] = lambda text=text: validator.sanitize_message(text)
+        cases[f"classify_intent[len={length}]"] = lambda text=text: classifier.classify_intent(text)
+        cases[f"_extract_entities[len={length}]"] = lambda text=text: classifier._extract_entities(text)
+    long_text = message_of(Config.MAX_MESSAGE_LENGTH)
+    cases[f"classify_intent[len={Config.MAX_MESSAGE_LENGTH},keywords=5000]"] = lambda: large_keywords.classify_intent(long_text)
+    cases[f"_extract_entities[len={Config.MAX_MESSAGE_LENGTH},types=200]"] = lambda: large_entities._extract_entities(long_text)
+    for size in sorted({0, 1, 3, Config.CONTEXT_WINDOW_SIZE}):
+        history = history_of(size)
+        cases[f"_is_followup_question[context={size}]"] = lambda history=history: generator._is_followup_question(long_text, history, 'shipping', metadata)
+        cases[f"generate_response[context={size}]"] = lambda history=history: generator.generate_response(long_text, history, 'order_status', metadata, entities)
+    return cases
+
+
+def measure(fn: Callable[[], object], rounds: int, target_seconds: float = 0.02) -> float:
+    # Calibrate calls per round so short cases are not dominated by timer resolution
+    number, elapsed = 1, 0.0
+    while elapsed < target_seconds:
+        number *= 2
+        elapsed = timeit.timeit(fn, number=number)
+    return min(timeit.repeat(fn, number=number, repeat=rounds)) / number * 1e6
+
+
+def relative_cost(fn: Callable[[], object], rounds: int) -> float:
+    reference_us = measure(reference_loop, rounds)
+    us = measure(fn, rounds)
+    reference_us = min(reference_us, measure(reference_loop, rounds))
+    return us / reference_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='fail when a case is this much slower than baseline (0.25 = 25%%)')
+    parser.add_argument('--confirm', type=int, default=2, help='re-measurements before a case counts as regressed')
+    args = parser.parse_args()
+
+    cases = {name: fn for name, fn in build_cases().items() if args.filter in name}
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f).get('cases', {})
+
+    results, regressions = {}, []
+    print(f"{'case':<52} {'us/call':>10} {'baseline':>10} {'change':>8}")
+    for name, fn in cases.items():
+        # A baseline is the median of several measurements, so one unusually fast sample does not set the bar
+        cost = statistics.median(relative_cost(fn, args.rounds) for _ in range(3)) if args.save else relative_cost(fn, args.rounds)
+        expected = baseline.get(name)
+        for _ in range(args.confirm if expected else 0):
+            if cost / expected - 1 <= args.threshold:
+                break
+            cost = min(cost, relative_cost(fn, args.rounds))
+        results[name] = round(cost, 5)
+        reference_us = measure(reference_loop, args.rounds)
+        if expected:
+            change = cost / expected - 1
+            flag = '  REGRESSION' if change > args.threshold else ''
+            if flag:
+                regressions.append(name)
+            print(f"{name:<52} {cost * reference_us:>10.2f} {expected * reference_us:>10.2f} {change:>+7.0%}{flag}")
+        else:
+            print(f"{name:<52} {cost * reference_us:>10.2f} {'-':>10} {'-':>8}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'unit': 'multiples of the reference loop', 'python': platform.python_version(), 'cases': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+    elif not baseline:
+        print(f"No baseline at {args.baseline}; run with --save to record one")
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
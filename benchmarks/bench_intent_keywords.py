@@ -0,0 +1,61 @@
+"""
+Per-message cost of keyword intent scoring as the keyword table grows.
+
+Compares the old `kw in text` loop over every keyword with KeywordAutomaton.
+
+Usage: python benchmarks/bench_intent_keywords.py [--repeat 500]
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nlu_engine import KeywordAutomaton, load_keyword_table
+
+NLU_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'nlu.yml')
+MESSAGE = "Hi, I ordered a laptop last week and the tracking page still says it has not shipped, can you help me find where it is or cancel it?"
+
+
+def make_table(base: dict, total_keywords: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    table = {intent: list(keywords) for intent, keywords in base.items()}
+    intents = list(table)
+    count = sum(len(keywords) for keywords in table.values())
+    while count < total_keywords:
+        word = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 10)))
+        table[intents[count % len(intents)]].append(word)
+        count += 1
+    return table
+
+
+def legacy_scores(table: dict, text: str) -> dict:
+    text_lower = text.lower()
+    scores = {}
+    for intent, keywords in table.items():
+        score = sum(1 for kw in keywords if kw in text_lower)
+        if score > 0:
+            scores[intent] = score
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+    base = load_keyword_table(NLU_PATH)
+    print(f"{'keywords':>9} {'legacy us/msg':>14} {'automaton us/msg':>17} {'speedup':>8}")
+    for total in (sum(len(k) for k in base.values()), 500, 2000, 5000, 20000):
+        table = make_table(base, total)
+        automaton = KeywordAutomaton(table)
+        assert automaton.scores(MESSAGE) == legacy_scores(table, MESSAGE)
+        legacy = min(timeit.repeat(lambda: legacy_scores(table, MESSAGE), number=args.repeat, repeat=3)) / args.repeat * 1e6
+        fast = min(timeit.repeat(lambda: automaton.scores(MESSAGE), number=args.repeat, repeat=3)) / args.repeat * 1e6
+        print(f"{total:>9} {legacy:>14.1f} {fast:>17.1f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
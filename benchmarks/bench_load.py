@@ -0,0 +1,229 @@
+"""
+Load test for /api/message/send: replays multi-turn conversations and reports latency as JSON.
+
+Conversations come from stories.yml. Each story's intent steps become user
+turns, and each turn's text is an nlu.yml example of that intent (chosen
+with --seed, so runs are reproducible). Concurrent virtual users each open a
+session and send their conversation's turns in order.
+
+Backends:
+  --backend memory in-process Flask app on InMemorySessionStore (no database).
+                   --db-latency-ms adds a simulated round trip to each
+                   context read and turn write (creating a session is
+                   not a write).
+  --backend sqlite in-process Flask app on SQLiteSessionStore in a temporary
+                   file.
+  --backend neo4j  in-process Flask app on Neo4j from NEO4J_URI/USER/PASSWORD,
+                   e.g. the neo4j service of docker-compose.yml.
+  --url URL        a running server (python app.py, gunicorn or uvicorn)
+                   over HTTP; its rate limits apply.
+
+Rate limits are switched off in-process. Prints one JSON object with
+p50/p95/p99 latency (ms), throughput and error rate, and writes it to
+--output too. Exits non-zero when --max-p95-ms or --max-error-rate is
+exceeded.
+
+Usage: python benchmarks/bench_load.py [--backend memory|sqlite|neo4j | --url http://127.0.0.1:5000] [--conversations 200] [--concurrency 8] [--db-latency-ms 0] [--seed 7] [--output load.json]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from nlu_engine import load_training_examples
+
+
+# ==================== CONVERSATIONS ====================
+def load_conversations(stories_path: str, nlu_path: str, count: int, seed: int) -> List[List[str]]:
+    import yaml
+    examples: Dict[str, List[str]] = {}
+    for text, intent in load_training_examples(nlu_path):
+        examples.setdefault(intent, []).append(text)
+    with open(stories_path, encoding='utf-8') as f:
+        stories = (yaml.safe_load(f) or {}).get('stories') or []
+    flows = [[step['intent'] for step in story.get('steps') or [] if isinstance(step, dict) and step.get('intent') in examples] for story in stories]
+    flows = [flow for flow in flows if flow]
+    if not flows:
+        raise SystemExit(f"No story in {stories_path} has an intent with examples in {nlu_path}")
+    rng = random.Random(seed)
+    return [[rng.choice(examples[intent]) for intent in flows[i % len(flows)]] for i in range(count)]
+
+
+# ==================== SIMULATED ROUND TRIPS ====================
+def with_round_trips(store, db_latency_ms: float):
+    # Wraps the storage calls a turn makes in a sleep, to model a database on the network
+    delay = db_latency_ms / 1000.0
+    for name in ('get_turn_context', 'save_turn'):
+        method = getattr(store, name)
+
+        def delayed(*args, method=method, **kwargs):
+            time.sleep(delay)
+            return method(*args, **kwargs)
+        setattr(store, name, delayed)
+    return store
+
+
+# ==================== CLIENTS ====================
+class InProcessClient:
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def post(self, path: str, body: Dict) -> Tuple[int, Dict]:
+        response = self.client.post(path, json=body)
+        return response.status_code, response.get_json(silent=True) or {}
+
+
+class HTTPClient:
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def post(self, path: str, body: Dict) -> Tuple[int, Dict]:
+        try:
+            self.connection.request('POST', path, body=json.dumps(body), headers={'Content-Type': 'application/json'})
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # Reconnect so one dropped keep-alive connection does not fail the rest of the run
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            return 0, {}
+        try:
+            return response.status, json.loads(data)
+        except ValueError:
+            return response.status, {}
+
+
+# ==================== LOAD RUN ====================
+def percentile(samples: List[float], q: float) -> float:
+    # Nearest-rank percentile over sorted samples
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, max(0, int(round(q / 100.0 * len(samples) + 0.5)) - 1))]
+
+
+def virtual_user(make_client, conversations: List[List[str]], next_index, results: Dict, lock: threading.Lock):
+    client = make_client()
+    latencies, statuses = [], {}
+    while True:
+        index = next_index()
+        if index is None:
+            break
+        status, body = client.post('/api/session/create', {})
+        session_id = body.get('session_id')
+        if status != 201 or not session_id:
+            statuses[status] = statuses.get(status, 0) + 1
+            continue
+        for text in conversations[index]:
+            started = time.perf_counter()
+            status, _ = client.post('/api/message/send', {'session_id': session_id, 'message': text})
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+    with lock:
+        results['latencies'].extend(latencies)
+        for status, count in statuses.items():
+            results['statuses'][status] = results['statuses'].get(status, 0) + count
+
+
+def run(make_client, conversations: List[List[str]], concurrency: int) -> Dict:
+    remaining = iter(range(len(conversations)))
+    index_lock = threading.Lock()
+
+    def next_index() -> Optional[int]:
+        with index_lock:
+            return next(remaining, None)
+
+    results = {'latencies': [], 'statuses': {}}
+    lock = threading.Lock()
+    threads = [threading.Thread(target=virtual_user, args=(make_client, conversations, next_index, results, lock)) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(results['latencies'])
+    statuses = results['statuses']
+    requests = sum(statuses.values())
+    errors = sum(count for status, count in statuses.items() if not 200 <= status < 300)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'error_rate': round(errors / requests, 4) if requests else 0.0,
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {'p50': round(percentile(latencies, 50), 3), 'p95': round(percentile(latencies, 95), 3), 'p99': round(percentile(latencies, 99), 3),
+                       'mean': round(sum(latencies) / len(latencies), 3) if latencies else 0.0, 'max': round(latencies[-1], 3) if latencies else 0.0},
+        'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', choices=('memory', 'sqlite', 'neo4j'), default='memory')
+    parser.add_argument('--url', help='load a running server over HTTP instead of the in-process app')
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8, help='virtual users sending at once')
+    parser.add_argument('--db-latency-ms', type=float, default=0.0, help='simulated round trip per storage call (memory backend)')
+    parser.add_argument('--warmup', type=int, default=10, help='conversations replayed before measuring')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--stories', default=os.path.join(ROOT, 'stories.yml'))
+    parser.add_argument('--nlu', default=os.path.join(ROOT, 'nlu.yml'))
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--max-p95-ms', type=float, help='exit 1 when p95 latency is above this')
+    parser.add_argument('--max-error-rate', type=float, help='exit 1 when the error rate is above this (0..1)')
+    args = parser.parse_args()
+
+    conversations = load_conversations(args.stories, args.nlu, args.conversations + args.warmup, args.seed)
+    if args.url:
+        make_client = lambda: HTTPClient(args.url)
+        target = args.url
+    else:
+        os.environ['SESSION_STORE'] = args.backend
+        if args.backend == 'sqlite':
+            os.environ['SESSION_STORE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench-load-'), 'sessions.db')
+        import logging
+        logging.disable(logging.WARNING)
+        from app import InMemorySessionStore, app, components, limiter
+        limiter.enabled = False
+        if args.backend == 'memory' and args.db_latency_ms:
+            components.override('session_store', with_round_trips(InMemorySessionStore(), args.db_latency_ms))
+        make_client = lambda: InProcessClient(app)
+        target = f"in-process/{args.backend}"
+
+    try:
+        if args.warmup:
+            run(make_client, conversations[:args.warmup], min(args.concurrency, args.warmup))
+        report = run(make_client, conversations[args.warmup:], args.concurrency)
+    finally:
+        if not args.url:
+            components.close()
+    report = dict({'target': target, 'conversations': args.conversations, 'concurrency': args.concurrency, 'seed': args.seed,
+                   'db_latency_ms': args.db_latency_ms if not args.url and args.backend == 'memory' else None}, **report)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    failed = (args.max_p95_ms is not None and report['latency_ms']['p95'] > args.max_p95_ms) or (args.max_error_rate is not None and report['error_rate'] > args.max_error_rate)
+    if failed:
+        print("Load test is over its latency or error budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Latency of fetching a session's latest messages as the session grows (needs a live Neo4j).
+
+Seeds one session per size (10 .. 100k messages) and times the legacy
+relationship-expand-and-sort query against RECENT_MESSAGES_QUERY, which
+seeks the (session_id, timestamp) index from migration 3. Also reports
+database hits from PROFILE. Apply migrations first (python migrations.py).
+
+Usage: NEO4J_URI=... NEO4J_USER=... NEO4J_PASSWORD=... python benchmarks/bench_recent_messages.py [--sizes 10,100,1000,10000,100000] [--repeat 50] [--keep]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Config, Neo4jSessionManager, components
+
+LEGACY_QUERY = """MATCH (s:Session {session_id: $session_id})-[:HAS_MESSAGE]->(m:Message) RETURN m ORDER BY m.timestamp DESC LIMIT $limit"""
+SEED_SESSION_QUERY = """MERGE (s:Session {session_id: $session_id}) SET s.created_at = datetime(), s.interaction_count = $size, s.status = 'benchmark'"""
+SEED_MESSAGES_QUERY = """MATCH (s:Session {session_id: $session_id}) UNWIND range($first, $last) AS i
+    CREATE (m:Message {message_id: $session_id + '_' + toString(i), session_id: $session_id, sender: CASE i % 2 WHEN 0 THEN 'user' ELSE 'bot' END, text: 'message ' + toString(i), timestamp: datetime() - duration({seconds: $last - i})})
+    CREATE (s)-[:HAS_MESSAGE]->(m)"""
+CLEANUP_QUERY = """MATCH (s:Session {session_id: $session_id}) OPTIONAL MATCH (s)-[:HAS_MESSAGE]->(m) CALL { WITH m DETACH DELETE m } IN TRANSACTIONS OF 10000 ROWS"""
+
+
+def seed(driver, session_id: str, size: int, batch: int = 10000):
+    with driver.session() as session:
+        session.run(CLEANUP_QUERY, session_id=session_id).consume()
+        session.run("MATCH (s:Session {session_id: $session_id}) DETACH DELETE s", session_id=session_id).consume()
+        session.run(SEED_SESSION_QUERY, session_id=session_id, size=size).consume()
+        for first in range(0, size, batch):
+            session.run(SEED_MESSAGES_QUERY, session_id=session_id, first=first, last=min(first + batch, size) - 1).consume()
+
+
+def time_query(driver, query: str, session_id: str, repeat: int) -> float:
+    samples = []
+    with driver.session() as session:
+        session.run(query, session_id=session_id, limit=Config.CONTEXT_WINDOW_SIZE).consume()
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(session.run(query, session_id=session_id, limit=Config.CONTEXT_WINDOW_SIZE))
+            samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def db_hits(driver, query: str, session_id: str) -> int:
+    def total(plan):
+        return plan.get('dbHits', 0) + sum(total(child) for child in plan.get('children', []))
+    with driver.session() as session:
+        summary = session.run('PROFILE ' + query, session_id=session_id, limit=Config.CONTEXT_WINDOW_SIZE).consume()
+    return total(summary.profile or {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--keep', action='store_true', help='leave the seeded sessions in the database')
+    args = parser.parse_args()
+    driver = components.neo4j_manager.driver
+
+    print(f"{'messages':>9} | {'legacy ms':>9} {'db hits':>9} | {'indexed ms':>10} {'db hits':>9}")
+    try:
+        for size in (int(s) for s in args.sizes.split(',')):
+            session_id = f"bench_recent_{size}"
+            seed(driver, session_id, size)
+            legacy = time_query(driver, LEGACY_QUERY, session_id, args.repeat)
+            indexed = time_query(driver, Neo4jSessionManager.RECENT_MESSAGES_QUERY, session_id, args.repeat)
+            print(f"{size:>9} | {legacy:>9.2f} {db_hits(driver, LEGACY_QUERY, session_id):>9} | {indexed:>10.2f} {db_hits(driver, Neo4jSessionManager.RECENT_MESSAGES_QUERY, session_id):>9}")
+            if not args.keep:
+                with driver.session() as session:
+                    session.run(CLEANUP_QUERY, session_id=session_id).consume()
+                    session.run("MATCH (s:Session {session_id: $session_id}) DETACH DELETE s", session_id=session_id).consume()
+    finally:
+        components.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Per-turn latency of DialogueEngine.process_message on each session store backend.
+
+Drives the engine directly (no HTTP) with the same classifier, generator and
+messages for every backend. For each turn it records the total time and the
+time spent in storage (get_turn_context + save_turn). Neo4j is included
+when NEO4J_URI/USER/PASSWORD are set; its benchmark sessions are left in
+the database.
+
+Usage: python benchmarks/bench_session_stores.py [--backends memory,sqlite,neo4j] [--sessions 50] [--turns 10]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.disable(logging.WARNING)
+
+from app import DialogueEngine, EnhancedResponseGenerator, InMemorySessionStore, Neo4jSessionManager, SQLiteSessionStore, build_intent_classifier
+
+MESSAGES = ["Hi there", "Where is my order 123456?", "It still has not shipped", "Can I return it instead?", "How long does the refund take?", "My laptop screen is broken too", "Do you ship to Canada?", "What does express shipping cost?", "Thanks for the help", "Bye"]
+
+
+def open_store(backend: str, directory: str):
+    if backend == 'memory':
+        return InMemorySessionStore()
+    if backend == 'sqlite':
+        return SQLiteSessionStore(os.path.join(directory, 'sessions.db'))
+    return Neo4jSessionManager(os.environ['NEO4J_URI'], os.environ['NEO4J_USER'], os.environ['NEO4J_PASSWORD'])
+
+
+class TimedStore:
+    # Forwards to the store and adds up the time the engine spends waiting on it
+    def __init__(self, store):
+        self.store = store
+        self.elapsed = 0.0
+
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+        if name not in ('get_turn_context', 'save_turn'):
+            return method
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.elapsed += time.perf_counter() - started
+        return timed
+
+
+def run(backend: str, sessions: int, turns: int, classifier, generator, directory: str):
+    store = open_store(backend, directory)
+    timed = TimedStore(store)
+    engine = DialogueEngine(timed, classifier, generator)
+    totals, storage = [], []
+    try:
+        for _ in range(sessions):
+            session_id = store.create_session()
+            for turn in range(turns):
+                timed.elapsed = 0.0
+                started = time.perf_counter()
+                result = engine.process_message(session_id, MESSAGES[turn % len(MESSAGES)])
+                totals.append((time.perf_counter() - started) * 1000)
+                storage.append(timed.elapsed * 1000)
+                if result.get('status') == 'error':
+                    raise RuntimeError(f"{backend}: {result.get('error')}")
+    finally:
+        store.close()
+    return totals, storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    available = ['memory', 'sqlite'] + (['neo4j'] if os.getenv('NEO4J_URI') else [])
+    parser.add_argument('--backends', default=','.join(available))
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--turns', type=int, default=10, help='messages per session (the context window fills after a few)')
+    args = parser.parse_args()
+
+    classifier, generator = build_intent_classifier(), EnhancedResponseGenerator()
+    print(f"{args.sessions} sessions x {args.turns} turns")
+    print(f"{'backend':>8} | {'turn p50':>9} {'turn p95':>9} {'turn p99':>9} | {'storage p50':>11} {'storage share':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backends.split(','):
+            totals, storage = run(backend, args.sessions, args.turns, classifier, generator, directory)
+            quantiles = statistics.quantiles(totals, n=100)
+            print(f"{backend:>8} | {statistics.median(totals):>8.3f}ms {quantiles[94]:>7.3f}ms {quantiles[98]:>7.3f}ms | {statistics.median(storage):>9.3f}ms {sum(storage) / sum(totals):>12.0%}")
+
+
+if __name__ == '__main__':
+    main()
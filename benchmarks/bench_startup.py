@@ -0,0 +1,47 @@
+"""
+Process startup cost: time to import app.py and build the Flask app, in fresh interpreters.
+
+Nothing connects to Neo4j here, so no database is needed. Exits non-zero when
+the median import + create_app time is over --budget-ms, so it can gate CI.
+Pass --preload to include building the classifier and generator
+(PRELOAD_COMPONENTS=true).
+
+Usage: python benchmarks/bench_startup.py [--runs 10] [--budget-ms 1000] [--preload]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROBE = "import json, app; app.app; print(json.dumps(app.STARTUP_TIMINGS_MS))"
+
+
+def run_once(preload: bool) -> dict:
+    env = dict(os.environ, PRELOAD_COMPONENTS='true' if preload else 'false')
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=1000.0, help='fail when median import + create_app exceeds this')
+    parser.add_argument('--preload', action='store_true', help='also build the classifier and generator in create_app')
+    args = parser.parse_args()
+
+    samples = [run_once(args.preload) for _ in range(args.runs)]
+    imports = statistics.median(sample['import'] for sample in samples)
+    create = statistics.median(sample['create_app'] for sample in samples)
+    total = statistics.median(sample['import'] + sample['create_app'] for sample in samples)
+    print(f"import {imports:.1f}ms | create_app {create:.1f}ms | total {total:.1f}ms (median of {args.runs}, budget {args.budget_ms:.0f}ms)")
+    if total > args.budget_ms:
+        print("Startup is over budget")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Requests/sec of the gunicorn production profile as the worker count grows.
+
+For each worker count, starts `gunicorn -c gunicorn.conf.py app:app` on a
+local port. Client processes then send keep-alive requests for --duration
+seconds. The default path (/api/health) needs no database, so the numbers
+show the per-core scaling of the request path itself. Point --path at
+/api/message/send (with --body and NEO4J_* set) to include Neo4j. The
+clients share the machine with the server, so speedups flatten once workers
+plus clients oversubscribe the cores.
+
+Usage: python benchmarks/bench_workers.py [--workers 1,2,4,8] [--clients 16] [--duration 10] [--path /api/health] [--body '{"message": "hi"}']
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/api/health')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"gunicorn did not become ready on port {port}")
+
+
+def client(port: int, path: str, body: str, duration: float, results):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    method, headers = ('POST', {'Content-Type': 'application/json'}) if body else ('GET', {})
+    ok = errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status < 400:
+                ok += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    results.put((ok, errors))
+
+
+def run(workers: int, clients: int, duration: float, path: str, body: str):
+    port = free_port()
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_BIND=f"127.0.0.1:{port}")
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=client, args=(port, path, body, duration, results)) for _ in range(clients)]
+        for process in processes:
+            process.start()
+        totals = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(30)
+    return sum(ok for ok, _ in totals) / duration, sum(errors for _, errors in totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', default=','.join(str(n) for n in sorted({1, 2, 4, multiprocessing.cpu_count()})))
+    parser.add_argument('--clients', type=int, default=16, help='concurrent keep-alive client processes')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load per worker count')
+    parser.add_argument('--path', default='/api/health')
+    parser.add_argument('--body', default='', help='JSON body; sends POST instead of GET')
+    args = parser.parse_args()
+
+    print(f"{multiprocessing.cpu_count()} cores, {args.clients} clients, {args.path}")
+    print(f"{'workers':>7} | {'req/s':>9} {'speedup':>8} {'errors':>7}")
+    baseline = None
+    for workers in (int(n) for n in args.workers.split(',')):
+        rate, errors = run(workers, args.clients, args.duration, args.path, args.body)
+        baseline = baseline or rate
+        print(f"{workers:>7} | {rate:>9.0f} {rate / baseline:>7.2f}x {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -42,6 +42,30 @@ export default function ChatApp() {
     }
   };
 
+  // Minimal Server-Sent Events reader for a POST response body
+  const readEventStream = async (response, onEvent) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const chunk = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = "message";
+        let data = "";
+        chunk.split("\n").forEach((line) => {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        });
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
+  };
+
   const sendMessage = async (e) => {
     e.preventDefault();
     
@@ -61,7 +85,8 @@ export default function ChatApp() {
     setError("");
 
     try {
-      const response = await fetch(`${API_BASE}/message/send`, {
+      // Stream the reply: classification and bot text arrive before persistence finishes
+      const response = await fetch(`${API_BASE}/message/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -70,22 +95,28 @@ export default function ChatApp() {
         }),
       });
 
-      const data = await response.json();
-
       if (!response.ok) {
+        const data = await response.json().catch(() => ({}));
         throw new Error(data.error || "Failed to get response");
       }
 
-      const botMsg = {
-        id: Date.now() + 1,
-        sender: "bot",
-        text: data.bot_response,
-        timestamp: new Date(),
-        intent: data.intent,
-        confidence: data.confidence,
-      };
-
-      setMessages((prev) => [...prev, botMsg]);
+      await readEventStream(response, (event, data) => {
+        if (event === "error") {
+          throw new Error(data.error || "Failed to get response");
+        }
+        if (event === "reply") {
+          const botMsg = {
+            id: Date.now() + 1,
+            sender: "bot",
+            text: data.bot_response,
+            timestamp: new Date(),
+            intent: data.intent,
+            confidence: data.confidence,
+          };
+          setMessages((prev) => [...prev, botMsg]);
+          setLoading(false);
+        }
+      });
     } catch (err) {
       setError(err.message);
       const errorMsg = {
@@ -0,0 +1,29 @@
+"""
+Compact analytics rollup buckets: fold old minute buckets into hourly ones and old hourly buckets into daily ones.
+
+Retention comes from ROLLUP_MINUTE_RETENTION_HOURS (default 48) and
+ROLLUP_HOUR_RETENTION_DAYS (default 30). Each page is merged and deleted in
+one transaction, so an interrupted run can simply be started again. Run it
+from cron (e.g. hourly) on one host only.
+
+Usage: python compact_rollups.py [--page-size 1000]
+"""
+
+import argparse
+import json
+
+from app import components
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--page-size', type=int, default=1000, help='buckets merged per transaction')
+    args = parser.parse_args()
+    try:
+        print(json.dumps(components.neo4j_manager.compact_rollups(page_size=args.page_size)))
+    finally:
+        components.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+"""
+pytest setup: the suite runs on the in-memory and SQLite stores, so it needs no Neo4j.
+
+test_sandbox.py is a manual connection check against a remote sandbox (it connects
+on import), so it is not collected.
+"""
+
+import os
+
+collect_ignore = ['test_sandbox.py']
+
+os.environ.setdefault('SESSION_STORE', 'memory')
+os.environ.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+os.environ.setdefault('SESSION_LIFECYCLE_INTERVAL', '0')
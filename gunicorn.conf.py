@@ -0,0 +1,56 @@
+"""
+Gunicorn settings for the production profile: gunicorn app:app
+
+Gunicorn reads this file from the working directory. Every worker is a
+separate process that owns its Neo4j driver, analytics flusher and
+rate-limit counters. A worker builds them after fork, on its first request.
+The context cache is off by default with more than one worker. Reload code and settings gracefully with `kill -HUP <master pid>`:
+new workers start and old ones finish their in-flight requests first. With
+PRELOAD_COMPONENTS=true the master imports the app once so workers share the
+classifier, but HUP then restarts workers without reloading application code.
+"""
+
+import multiprocessing
+import os
+import secrets
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+# The context cache assumes one process sees all of a session's writes; with several workers and no sticky
+# routing it would serve stale context, so it is off unless CONTEXT_CACHE_SIZE is set explicitly.
+# This file runs before the app is imported, so Config picks it up.
+if workers > 1:
+    os.environ.setdefault('CONTEXT_CACHE_SIZE', '0')
+# Workers must agree on the key that signs session ids (Config.SESSION_ID_SECRET); HUP keeps the master's
+os.environ.setdefault('SESSION_ID_SECRET', secrets.token_hex(32))
+# Threads keep a worker serving while one of its requests streams SSE or waits on Neo4j
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+preload_app = os.getenv('PRELOAD_COMPONENTS', 'false').lower() == 'true'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+# Recycle workers after this many requests (0 disables); jitter keeps them from restarting together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def on_starting(server):
+    # Snapshots from a previous run would otherwise be merged into this run's /metrics
+    metrics_dir = os.getenv('METRICS_DIR')
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.endswith('.json'):
+                os.remove(os.path.join(metrics_dir, name))
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker {worker.pid} started; it connects to Neo4j on its first request")
+
+
+def worker_exit(server, worker):
+    # Flush this worker's queued writes and analytics deltas, then close its driver
+    from app import components
+    components.close()
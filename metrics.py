@@ -0,0 +1,274 @@
+"""
+In-process latency histograms and gauges, rendered in the Prometheus text format.
+
+Observing is lock-free. Each thread writes to its own shard of a histogram.
+Shards are only summed when /metrics is scraped, and the shards of finished
+threads are folded into one retired total then.
+
+Under gunicorn every worker is a separate process, and a scrape reaches just
+one of them. Set a shared `directory` (METRICS_DIR) and each process writes
+its totals there every few seconds and at exit. The scraping process then
+adds every other process's file to its own live numbers. Histograms of exited
+processes are kept, merged into one file, because Prometheus histograms
+never go down. Gauges are only summed over processes that are still alive.
+
+Kept free of Flask and Neo4j imports so it can be reused by asgi_app.py.
+"""
+
+import atexit
+import bisect
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RETIRED_FILE = 'retired.json'
+
+
+class Histogram:
+    """A labelled histogram. A row holds one count per bucket (plus +Inf), then the sum."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS, on_first_use: Callable[[], None] = None):
+        self.name = name
+        self.on_first_use = on_first_use
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, Dict]] = []
+        self._retired: Dict[Tuple[str, ...], List[float]] = {}
+
+    def _shard(self) -> Dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            if self.on_first_use:
+                self.on_first_use()
+        return shard
+
+    def observe(self, value: float, *labelvalues: str):
+        shard = self._shard()
+        row = shard.get(labelvalues)
+        if row is None:
+            row = shard[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        # bisect_left puts a value equal to a bound in that bound's bucket, matching Prometheus' `le`
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def time(self, *labelvalues: str) -> '_Timer':
+        return _Timer(self, labelvalues)
+
+    def collect(self) -> Dict[Tuple[str, ...], List[float]]:
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    # A finished thread never writes again, so its shard can be folded in for good
+                    _add_rows(self._retired, shard)
+            self._shards = live
+            total = {labels: list(row) for labels, row in self._retired.items()}
+        for _, shard in live:
+            _add_rows(total, shard)
+        return total
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labelvalues', 'started')
+
+    def __init__(self, histogram: Histogram, labelvalues: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+        return False
+
+
+def _add_rows(into: Dict, rows: Dict):
+    # list() copies in one step, so a writer adding a label set mid-scrape cannot break the iteration
+    for labels, row in list(rows.items()):
+        target = into.get(labels)
+        if target is None:
+            into[labels] = list(row)
+        else:
+            for i, value in enumerate(row):
+                target[i] += value
+
+
+class MetricsRegistry:
+    def __init__(self, directory: str = None, snapshot_interval: float = 5.0):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self._histograms: Dict[str, Histogram] = {}
+        self._gauges: Dict[str, Tuple[str, Tuple[str, ...], Callable[[], Dict[Tuple[str, ...], float]]]] = {}
+        self._writer_pid = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        if name not in self._histograms:
+            self._histograms[name] = Histogram(name, documentation, labelnames, buckets, on_first_use=self.ensure_writer)
+        return self._histograms[name]
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...], collect: Callable[[], Dict[Tuple[str, ...], float]]):
+        # Re-registering a name replaces its callback (asgi_app.py points the pool gauges at its own driver)
+        self._gauges[name] = (documentation, tuple(labelnames), collect)
+
+    def _after_fork(self):
+        # A forked worker starts from zero: what the parent observed is the parent's to report
+        for histogram in self._histograms.values():
+            histogram._lock = threading.Lock()
+            histogram._reset()
+        self._writer_pid = None
+
+    # ---- Snapshots shared between processes ----
+    def snapshot(self) -> Dict:
+        gauges = {}
+        for name, (_, _, collect) in self._gauges.items():
+            try:
+                gauges[name] = collect()
+            except Exception as e:
+                logger.warning(f"Gauge {name} failed: {e}")
+        return {'histograms': {name: histogram.collect() for name, histogram in self._histograms.items()}, 'gauges': gauges}
+
+    def ensure_writer(self):
+        if not self.directory or self._writer_pid == os.getpid():
+            return
+        self._writer_pid = os.getpid()
+        threading.Thread(target=self._write_loop, name='metrics-snapshot', daemon=True).start()
+        atexit.register(self.write_snapshot)
+
+    def _write_loop(self):
+        pid = os.getpid()
+        while self._writer_pid == pid:
+            time.sleep(self.snapshot_interval)
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        try:
+            _write_json(path, _encode(self.snapshot()))
+        except Exception as e:
+            logger.warning(f"Could not write metrics snapshot {path}: {e}")
+
+    def _merged(self) -> Dict:
+        merged = self.snapshot()
+        if not self.directory:
+            return merged
+        self.ensure_writer()
+        self._retire_exited()
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            name = os.path.basename(path)
+            if name == f"{os.getpid()}.json":
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    other = _decode(json.load(f))
+            except (OSError, ValueError):
+                continue
+            for metric, rows in other['histograms'].items():
+                _add_rows(merged['histograms'].setdefault(metric, {}), rows)
+            for metric, values in other['gauges'].items():
+                target = merged['gauges'].setdefault(metric, {})
+                for labels, value in values.items():
+                    target[labels] = target.get(labels, 0) + value
+        return merged
+
+    def _retire_exited(self):
+        # Fold the files of exited processes into retired.json, under a lock so two scrapers cannot count one twice
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited = [path for path in glob.glob(os.path.join(self.directory, '[0-9]*.json')) if not _pid_alive(int(os.path.basename(path)[:-5]))]
+            if not exited:
+                return
+            retired_path = os.path.join(self.directory, RETIRED_FILE)
+            retired = {'histograms': {}, 'gauges': {}}
+            for path in [retired_path] + exited:
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        data = _decode(json.load(f))
+                except (OSError, ValueError):
+                    continue
+                for metric, rows in data['histograms'].items():
+                    _add_rows(retired['histograms'].setdefault(metric, {}), rows)
+            _write_json(retired_path, _encode(retired))
+            for path in exited:
+                os.remove(path)
+
+    # ---- Prometheus text format ----
+    def render(self) -> str:
+        merged = self._merged()
+        lines = []
+        for name, histogram in self._histograms.items():
+            lines.append(f"# HELP {name} {histogram.documentation}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, row in sorted(merged['histograms'].get(name, {}).items()):
+                base = list(zip(histogram.labelnames, labels))
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), row[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(base + [('le', '+Inf' if bound == float('inf') else repr(bound))])} {int(cumulative)}")
+                lines.append(f"{name}_sum{_labels(base)} {row[-1]}")
+                lines.append(f"{name}_count{_labels(base)} {int(cumulative)}")
+        for name, (documentation, labelnames, _) in self._gauges.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted(merged['gauges'].get(name, {}).items()):
+                lines.append(f"{name}{_labels(list(zip(labelnames, labels)))} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _encode(snapshot: Dict) -> Dict:
+    # JSON objects need string keys; label tuples travel as JSON arrays
+    return {kind: {metric: [[list(labels), value] for labels, value in rows.items()] for metric, rows in snapshot[kind].items()} for kind in ('histograms', 'gauges')}
+
+
+def _decode(data: Dict) -> Dict:
+    return {kind: {metric: {tuple(labels): value for labels, value in rows} for metric, rows in data.get(kind, {}).items()} for kind in ('histograms', 'gauges')}
+
+
+def _write_json(path: str, data: Dict):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,196 @@
+"""
+Versioned Neo4j schema migrations.
+
+Every schema change the app depends on is listed in MIGRATIONS, in order.
+A migration has `schema` statements (constraints and indexes, all written
+IF NOT EXISTS) and optional `data` statements (backfills). Data statements
+run as auto-commit transactions so they can batch with
+CALL { ... } IN TRANSACTIONS. Each applied version is recorded as a
+(:SchemaMigration {version}) node. Runners take a lease on a
+(:SchemaLock {name: 'migrations'}) node, so only one process migrates at a
+time. App processes only read the recorded version at startup, and refuse
+to start while it is behind: their reads rely on what the migrations add
+(e.g. Message.session_id from migration 3).
+
+Usage: python migrations.py [--status]
+"""
+
+import argparse
+import logging
+import os
+import re
+import socket
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    schema: Tuple[str, ...] = ()
+    data: Tuple[str, ...] = ()
+
+
+MIGRATIONS = [
+    Migration(1, 'Unique session and message ids', schema=(
+        "CREATE CONSTRAINT session_id_unique IF NOT EXISTS FOR (s:Session) REQUIRE s.session_id IS UNIQUE",
+        "CREATE CONSTRAINT message_id_unique IF NOT EXISTS FOR (m:Message) REQUIRE m.message_id IS UNIQUE",
+    )),
+    Migration(2, 'Analytics counter and rollup nodes', schema=(
+        "CREATE CONSTRAINT stats_name_unique IF NOT EXISTS FOR (st:Stats) REQUIRE st.name IS UNIQUE",
+        "CREATE CONSTRAINT intent_stat_unique IF NOT EXISTS FOR (i:IntentStat) REQUIRE i.intent IS UNIQUE",
+        "CREATE CONSTRAINT analytics_bucket_unique IF NOT EXISTS FOR (b:AnalyticsBucket) REQUIRE (b.granularity, b.start) IS UNIQUE",
+    )),
+    # The latest N messages of a session become an index seek that reads N entries in timestamp order,
+    # instead of expanding every HAS_MESSAGE relationship and sorting
+    Migration(3, 'Session id on messages, indexed with the timestamp', schema=(
+        "CREATE RANGE INDEX message_session_timestamp IF NOT EXISTS FOR (m:Message) ON (m.session_id, m.timestamp)",
+    ), data=(
+        "MATCH (s:Session)-[:HAS_MESSAGE]->(m:Message) WHERE m.session_id IS NULL CALL { WITH s, m SET m.session_id = s.session_id } IN TRANSACTIONS OF 10000 ROWS",
+    )),
+    Migration(4, 'Indexes from setup.cypher', schema=(
+        "CREATE INDEX session_created IF NOT EXISTS FOR (s:Session) ON (s.created_at)",
+        "CREATE INDEX session_status IF NOT EXISTS FOR (s:Session) ON (s.status)",
+        "CREATE INDEX message_timestamp IF NOT EXISTS FOR (m:Message) ON (m.timestamp)",
+        "CREATE INDEX message_sender IF NOT EXISTS FOR (m:Message) ON (m.sender)",
+        "CREATE INDEX message_intent IF NOT EXISTS FOR (m:Message) ON (m.intent)",
+    )),
+    # The session lifecycle pass finds idle sessions by status and age with a range seek instead of a status scan
+    Migration(5, 'Session status with last interaction', schema=(
+        "CREATE RANGE INDEX session_status_last_interaction IF NOT EXISTS FOR (s:Session) ON (s.status, s.last_interaction)",
+    )),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+# The app's turn-context read uses a COLLECT {} subquery, which needs Neo4j 5.6 or later
+MIN_SERVER_VERSION = (5, 6)
+
+BOOTSTRAP_QUERIES = ["CREATE CONSTRAINT schema_migration_version_unique IF NOT EXISTS FOR (m:SchemaMigration) REQUIRE m.version IS UNIQUE", "CREATE CONSTRAINT schema_lock_name_unique IF NOT EXISTS FOR (l:SchemaLock) REQUIRE l.name IS UNIQUE"]
+VERSION_QUERY = """OPTIONAL MATCH (m:SchemaMigration) RETURN max(m.version) AS version"""
+RECORD_QUERY = """MERGE (m:SchemaMigration {version: $version}) SET m.description = $description, m.applied_at = datetime(), m.duration_ms = $duration_ms, m.applied_by = $holder"""
+# The first SET takes the node's write lock, so the holder check below reads the committed value
+ACQUIRE_LOCK_QUERY = """MERGE (l:SchemaLock {name: 'migrations'}) SET l.touched_at = datetime() WITH l WHERE l.holder IS NULL OR l.holder = $holder OR l.expires_at < datetime() SET l.holder = $holder, l.expires_at = datetime() + duration({seconds: $ttl}) RETURN l.holder AS holder"""
+RELEASE_LOCK_QUERY = """MATCH (l:SchemaLock {name: 'migrations', holder: $holder}) SET l.holder = null, l.expires_at = null"""
+LOCK_HOLDER_QUERY = """MATCH (l:SchemaLock {name: 'migrations'}) WHERE l.expires_at >= datetime() RETURN l.holder AS holder"""
+
+
+class SchemaOutdatedError(RuntimeError):
+    pass
+
+
+def read_version(driver) -> Tuple[int, Optional[str]]:
+    """The recorded schema version and the server agent (e.g. 'Neo4j/5.15.0'), from one read."""
+    def read(tx):
+        result = tx.run(VERSION_QUERY)
+        record = result.single()
+        return (record and record['version']) or 0, result.consume().server.agent
+    with driver.session() as session:
+        return session.execute_read(read)
+
+
+async def read_version_async(driver) -> Tuple[int, Optional[str]]:
+    async def read(tx):
+        result = await tx.run(VERSION_QUERY)
+        record = await result.single()
+        summary = await result.consume()
+        return (record and record['version']) or 0, summary.server.agent
+    async with driver.session() as session:
+        return await session.execute_read(read)
+
+
+def current_version(driver) -> int:
+    return read_version(driver)[0]
+
+
+def check_server_version(agent: Optional[str]):
+    """Raise if the server is older than MIN_SERVER_VERSION. Agents without a parsable version pass."""
+    match = re.match(r'Neo4j/(\d+)\.(\d+)', agent or '')
+    if match and (int(match.group(1)), int(match.group(2))) < MIN_SERVER_VERSION:
+        raise RuntimeError(f"{agent} is too old: the app needs Neo4j {'.'.join(map(str, MIN_SERVER_VERSION))} or later")
+
+
+def pending_migrations(version: int) -> List[Migration]:
+    return [migration for migration in MIGRATIONS if migration.version > version]
+
+
+def lock_holder() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def apply_migrations(driver, lock_ttl: int = 600) -> Optional[List[int]]:
+    """Apply pending migrations under the migration lock. Returns None if another process holds it."""
+    holder = lock_holder()
+    with driver.session() as session:
+        for query in BOOTSTRAP_QUERIES:
+            session.execute_write(lambda tx: tx.run(query).consume())
+        if not session.execute_write(lambda tx: tx.run(ACQUIRE_LOCK_QUERY, holder=holder, ttl=lock_ttl).single()):
+            record = session.execute_read(lambda tx: tx.run(LOCK_HOLDER_QUERY).single())
+            logger.info(f"Migrations are being applied by {record['holder'] if record else 'another process'}")
+            return None
+        applied = []
+        try:
+            # Re-read under the lock: another process may have finished while we waited
+            for migration in pending_migrations(current_version(driver)):
+                started = time.perf_counter()
+                for statement in migration.schema:
+                    session.execute_write(lambda tx: tx.run(statement).consume())
+                session.run("CALL db.awaitIndexes(300)").consume()
+                for statement in migration.data:
+                    session.run(statement).consume()
+                    session.execute_write(lambda tx: tx.run(ACQUIRE_LOCK_QUERY, holder=holder, ttl=lock_ttl).consume())
+                duration_ms = int((time.perf_counter() - started) * 1000)
+                session.execute_write(lambda tx: tx.run(RECORD_QUERY, version=migration.version, description=migration.description, duration_ms=duration_ms, holder=holder).consume())
+                logger.info(f"Applied migration {migration.version} ({migration.description}) in {duration_ms}ms")
+                applied.append(migration.version)
+        finally:
+            session.execute_write(lambda tx: tx.run(RELEASE_LOCK_QUERY, holder=holder).consume())
+    return applied
+
+
+def ensure_schema(driver, auto_migrate: bool = True) -> int:
+    """Startup check: one read of the recorded version (and the server version); migrate only when it is behind.
+
+    Raises SchemaOutdatedError when the schema is still behind afterwards (AUTO_MIGRATE off, another process
+    holding the lock, or a failed migration), since the app's reads would silently miss unmigrated data.
+    """
+    version, agent = read_version(driver)
+    check_server_version(agent)
+    if version >= LATEST_VERSION:
+        return version
+    if auto_migrate:
+        logger.info(f"Database schema is at version {version}, migrating to {LATEST_VERSION}")
+        try:
+            apply_migrations(driver)
+        except Exception as e:
+            logger.warning(f"Schema migration failed: {e}")
+        version = current_version(driver)
+    if version < LATEST_VERSION:
+        raise SchemaOutdatedError(f"Database schema is at version {version}, app expects {LATEST_VERSION}; run `python migrations.py`")
+    return version
+
+
+def main():
+    from dotenv import load_dotenv
+    from neo4j import GraphDatabase
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--status', action='store_true', help='print the recorded and pending versions without migrating')
+    parser.add_argument('--lock-ttl', type=int, default=600, help='seconds before an abandoned migration lock can be taken over')
+    args = parser.parse_args()
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    driver = GraphDatabase.driver(os.getenv('NEO4J_URI'), auth=(os.getenv('NEO4J_USER'), os.getenv('NEO4J_PASSWORD')))
+    try:
+        version = current_version(driver)
+        pending = pending_migrations(version)
+        print(f"Schema version {version}; pending: {', '.join(f'{m.version} ({m.description})' for m in pending) or 'none'}")
+        if not args.status and pending:
+            applied = apply_migrations(driver, lock_ttl=args.lock_ttl)
+            print("Another process holds the migration lock" if applied is None else f"Now at version {current_version(driver)}")
+    finally:
+        driver.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,407 @@
+"""
+NLU engines used by EnhancedIntentClassifier in app.py.
+
+Kept free of Flask and Neo4j imports so they can be benchmarked and reused
+by offline jobs without starting the API.
+"""
+
+import re
+import zlib
+import logging
+import threading
+from collections import deque
+from typing import List, Dict, Any, Optional, FrozenSet, Tuple
+
+import numpy as np
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+# ==================== ENTITY EXTRACTOR ====================
+def required_literals(pattern: str, flags: int = 0) -> Optional[FrozenSet[str]]:
+    """Return literals of which at least one appears in every match of pattern, or None if unknown."""
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except re.error:
+        return None
+    literals = _sequence_literals(list(parsed))
+    if literals is None or not all(literals):
+        return None
+    return frozenset(lit.lower() for lit in literals) if flags & re.IGNORECASE else frozenset(literals)
+
+
+def _sequence_literals(items: list) -> Optional[set]:
+    candidates, run = [], []
+    for op, av in items + [(None, None)]:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            candidates.append({''.join(run)})
+            run = []
+        if op is sre_parse.SUBPATTERN:
+            found = _sequence_literals(list(av[-1]))
+        elif op is sre_parse.BRANCH:
+            branches = [_sequence_literals(list(branch)) for branch in av[1]]
+            found = set().union(*branches) if all(b is not None for b in branches) else None
+        elif op is sre_parse.IN:
+            found = {chr(v) for o, v in av if o is sre_parse.LITERAL} if all(o is sre_parse.LITERAL for o, v in av) else None
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            found = _sequence_literals(list(av[2])) if av[0] >= 1 else None
+        else:
+            found = None
+        if found:
+            candidates.append(found)
+    # The most selective constraint is the one whose shortest alternative is longest
+    return max(candidates, key=lambda c: (min(len(lit) for lit in c), -len(c))) if candidates else None
+
+
+class EntityExtractor:
+    """Extracts all registered entity types from a message.
+
+    Each pattern is compiled once, and the literal text it cannot match without
+    (e.g. '@' for emails, '$' for amounts) is derived when it is registered.
+    Per message, the text is lowercased once, and only the patterns whose
+    literal appears in it are run, so the regex work stays proportional to
+    the entity types actually present rather than to the table size.
+    Results keep the original ordering: by registration order of the type,
+    then by position.
+    """
+
+    def __init__(self, patterns: Dict[str, str] = None, flags: int = re.IGNORECASE, confidence: float = 0.9, lowercase_values: bool = True):
+        self.flags = flags
+        self.confidence = confidence
+        self.lowercase_values = lowercase_values
+        self._lock = threading.Lock()
+        self._entries: Dict[str, tuple] = {}
+        for entity_type, pattern in (patterns or {}).items():
+            self._entries[entity_type] = self._compile(entity_type, pattern)
+
+    @property
+    def entity_types(self) -> List[str]:
+        return list(self._entries)
+
+    def _compile(self, entity_type: str, pattern: str) -> tuple:
+        try:
+            compiled = re.compile(pattern, self.flags)
+        except re.error as e:
+            raise ValueError(f"Invalid pattern for entity '{entity_type}': {e}")
+        return compiled, required_literals(pattern, self.flags)
+
+    def register(self, entity_type: str, pattern: str):
+        entry = self._compile(entity_type, pattern)
+        with self._lock:
+            entries = dict(self._entries)
+            entries[entity_type] = entry
+            self._entries = entries
+
+    def unregister(self, entity_type: str):
+        with self._lock:
+            self._entries = {t: e for t, e in self._entries.items() if t != entity_type}
+
+    def extract(self, text: str) -> List[Dict[str, Any]]:
+        haystack = text.lower() if self.flags & re.IGNORECASE else text
+        entities = []
+        for entity_type, (compiled, literals) in self._entries.items():
+            if literals is not None and not any(lit in haystack for lit in literals):
+                continue
+            for match in compiled.finditer(text):
+                value = match.group(1) if compiled.groups else match.group(0)
+                entities.append({'entity': entity_type, 'value': value.lower() if self.lowercase_values else value, 'start': match.start(), 'end': match.end(), 'confidence': self.confidence})
+        return entities
+
+# ==================== KEYWORD AUTOMATON ====================
+class KeywordAutomaton:
+    """Aho-Corasick automaton over a {label: [keywords]} table.
+
+    scores() walks the lowercased text once, whatever the number of keywords,
+    and counts for each label how many of its keywords occur as substrings,
+    the same result as summing `kw in text` over every keyword. Small tables
+    are still scanned with `in`, which beats a per-character Python loop.
+    """
+
+    LINEAR_SCAN_MAX_KEYWORDS = 128
+
+    def __init__(self, table: Dict[str, List[str]]):
+        self.labels = list(table)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[tuple] = [()]
+        self._keyword_labels: List[List[int]] = []
+        self._keywords: List[str] = []
+        keyword_ids: Dict[str, int] = {}
+        for label_index, label in enumerate(self.labels):
+            for keyword in table[label]:
+                keyword = keyword.lower()
+                if not keyword:
+                    continue
+                if keyword not in keyword_ids:
+                    keyword_ids[keyword] = len(self._keyword_labels)
+                    self._keyword_labels.append([])
+                    self._keywords.append(keyword)
+                    self._insert(keyword, keyword_ids[keyword])
+                self._keyword_labels[keyword_ids[keyword]].append(label_index)
+        self._fail = self._build_failure_links()
+
+    def __len__(self) -> int:
+        return len(self._keyword_labels)
+
+    def _insert(self, keyword: str, keyword_id: int):
+        state = 0
+        for ch in keyword:
+            if ch not in self._goto[state]:
+                self._goto.append({})
+                self._out.append(())
+                self._goto[state][ch] = len(self._goto) - 1
+            state = self._goto[state][ch]
+        self._out[state] = self._out[state] + (keyword_id,)
+
+    def _build_failure_links(self) -> List[int]:
+        fail = [0] * len(self._goto)
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, child in self._goto[state].items():
+                pending.append(child)
+                fallback = fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = fail[fallback]
+                fail[child] = self._goto[fallback].get(ch, 0) if self._goto[fallback].get(ch) != child else 0
+                self._out[child] = self._out[child] + self._out[fail[child]]
+        return fail
+
+    def matches(self, text: str) -> set:
+        if len(self._keywords) <= self.LINEAR_SCAN_MAX_KEYWORDS:
+            text_lower = text.lower()
+            return {keyword_id for keyword_id, keyword in enumerate(self._keywords) if keyword in text_lower}
+        goto, fail, out = self._goto, self._fail, self._out
+        state, found = 0, set()
+        for ch in text.lower():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+    def scores(self, text: str) -> Dict[str, int]:
+        counts = [0] * len(self.labels)
+        for keyword_id in self.matches(text):
+            for label_index in self._keyword_labels[keyword_id]:
+                counts[label_index] += 1
+        return {label: count for label, count in zip(self.labels, counts) if count}
+
+
+def load_keyword_table(path: str, prefix: str = 'keywords_') -> Dict[str, List[str]]:
+    """Read `lookup: <prefix><label>` tables from a Rasa nlu.yml into {label: [keywords]}."""
+    try:
+        import yaml
+        with open(path, encoding='utf-8') as f:
+            data = yaml.safe_load(f) or {}
+    except Exception as e:
+        logger.warning(f"Could not load keyword table from {path}: {e}")
+        return {}
+    table = {}
+    for item in data.get('nlu') or []:
+        name = item.get('lookup') if isinstance(item, dict) else None
+        if not name or not name.startswith(prefix):
+            continue
+        examples = item.get('examples') or ''
+        keywords = examples if isinstance(examples, list) else [line.strip()[1:].strip() for line in examples.splitlines() if line.strip().startswith('-')]
+        table[name[len(prefix):]] = [kw for kw in keywords if kw]
+    return table
+
+
+# ==================== LINEAR INTENT MODEL ====================
+ENTITY_ANNOTATION = re.compile(r'\[([^\]]+)\]\([^)]*\)')
+
+
+def load_training_examples(path: str) -> List[Tuple[str, str]]:
+    """Read (text, intent) pairs from a Rasa nlu.yml, with [value](entity) annotations stripped."""
+    import yaml
+    with open(path, encoding='utf-8') as f:
+        data = yaml.safe_load(f) or {}
+    examples = []
+    for item in data.get('nlu') or []:
+        if not isinstance(item, dict) or not item.get('intent'):
+            continue
+        for line in (item.get('examples') or '').splitlines():
+            line = line.strip()
+            if line.startswith('-'):
+                text = ENTITY_ANNOTATION.sub(r'\1', line[1:].strip())
+                if text:
+                    examples.append((text, item['intent']))
+    return examples
+
+
+class HashingCharVectorizer:
+    """Character n-grams within word boundaries (Rasa's char_wb analyzer), hashed into a fixed-size space."""
+
+    def __init__(self, n_features: int = 2 ** 16, min_n: int = 1, max_n: int = 4):
+        self.n_features = n_features
+        self.min_n = min_n
+        self.max_n = max_n
+
+    def counts(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        ids = []
+        for word in text.lower().split():
+            padded = f' {word} '
+            for n in range(self.min_n, self.max_n + 1):
+                for i in range(len(padded) - n + 1):
+                    # crc32 rather than hash(): feature ids must be stable across processes
+                    ids.append(zlib.crc32(padded[i:i + n].encode('utf-8')) % self.n_features)
+        return np.unique(np.array(ids, dtype=np.int64), return_counts=True)
+
+    def transform(self, text: str, idf: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        indices, counts = self.counts(text)
+        values = counts * idf[indices]
+        norm = np.sqrt(np.dot(values, values))
+        return indices, (values / norm if norm else values).astype(np.float32)
+
+
+class LinearIntentModel:
+    """Multinomial logistic regression over hashed TF-IDF char n-grams.
+
+    Inference is one sparse dot product: the weight rows of the n-grams present
+    in the message, summed and soft-maxed.
+    """
+
+    def __init__(self, labels: List[str], weights: np.ndarray, bias: np.ndarray, idf: np.ndarray, vectorizer: HashingCharVectorizer):
+        self.labels = list(labels)
+        self.weights = weights
+        self.bias = bias
+        self.idf = idf
+        self.vectorizer = vectorizer
+
+    @classmethod
+    def train(cls, examples: List[Tuple[str, str]], n_features: int = 2 ** 16, min_n: int = 1, max_n: int = 4, epochs: int = 300, learning_rate: float = 2.0, l2: float = 1e-4) -> 'LinearIntentModel':
+        vectorizer = HashingCharVectorizer(n_features, min_n, max_n)
+        labels = sorted({intent for _, intent in examples})
+        label_index = {label: i for i, label in enumerate(labels)}
+        rows = [vectorizer.counts(text) for text, _ in examples]
+        doc_freq = np.zeros(n_features)
+        for indices, _ in rows:
+            doc_freq[indices] += 1
+        idf = np.log((1 + len(rows)) / (1 + doc_freq)) + 1
+        # CSR layout: the sample matrix is never materialised densely
+        indices = np.concatenate([idx for idx, _ in rows])
+        lengths = np.array([len(idx) for idx, _ in rows])
+        sample_of = np.repeat(np.arange(len(rows)), lengths)
+        values = np.concatenate([c * idf[idx] for idx, c in rows])
+        norms = np.sqrt(np.bincount(sample_of, weights=values ** 2))
+        values = values / norms[sample_of]
+        targets = np.zeros((len(rows), len(labels)))
+        targets[np.arange(len(rows)), [label_index[intent] for _, intent in examples]] = 1.0
+        weights = np.zeros((n_features, len(labels)))
+        bias = np.zeros(len(labels))
+        for _ in range(epochs):
+            logits = np.add.reduceat(values[:, None] * weights[indices], np.concatenate(([0], np.cumsum(lengths)[:-1])), axis=0) + bias
+            probs = cls._softmax(logits)
+            error = (probs - targets) / len(rows)
+            gradient = np.stack([np.bincount(indices, weights=values * error[sample_of, c], minlength=n_features) for c in range(len(labels))], axis=1)
+            weights -= learning_rate * (gradient + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        return cls(labels, weights.astype(np.float32), bias.astype(np.float32), idf.astype(np.float32), vectorizer)
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        indices, values = self.vectorizer.transform(text, self.idf)
+        if not len(indices):
+            return None, 0.0
+        probs = self._softmax(values @ self.weights[indices] + self.bias)
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best])
+
+    def predict_batch(self, texts) -> Tuple[List[Optional[str]], np.ndarray]:
+        rows = [self.vectorizer.transform(str(text), self.idf) for text in texts]
+        probs = np.zeros((len(rows), len(self.labels)), dtype=np.float32)
+        if not rows:
+            return [], probs.max(axis=1)
+        lengths = np.array([len(idx) for idx, _ in rows])
+        indices = np.concatenate([idx for idx, _ in rows])
+        sample_of = np.repeat(np.arange(len(rows)), lengths)
+        contributions = np.concatenate([v for _, v in rows])[:, None] * self.weights[indices]
+        logits = np.stack([np.bincount(sample_of, weights=contributions[:, c], minlength=len(rows)) for c in range(len(self.labels))], axis=1) + self.bias
+        probs = self._softmax(logits)
+        best = probs.argmax(axis=1)
+        confidences = np.where(lengths > 0, probs[np.arange(len(rows)), best], 0.0)
+        return [self.labels[b] if n else None for b, n in zip(best, lengths)], confidences
+
+    def save(self, path: str):
+        # Only rows of n-grams seen in training are non-zero; store just those
+        rows = np.flatnonzero(np.any(self.weights != 0, axis=1))
+        np.savez_compressed(path, labels=np.array(self.labels), rows=rows.astype(np.int32), weights=self.weights[rows], bias=self.bias, idf=self.idf, config=np.array([self.vectorizer.n_features, self.vectorizer.min_n, self.vectorizer.max_n]))
+
+    @classmethod
+    def load(cls, path: str) -> 'LinearIntentModel':
+        with np.load(path, allow_pickle=False) as data:
+            n_features, min_n, max_n = (int(v) for v in data['config'])
+            weights = np.zeros((n_features, len(data['labels'])), dtype=np.float32)
+            weights[data['rows']] = data['weights']
+            return cls([str(label) for label in data['labels']], weights, data['bias'], data['idf'], HashingCharVectorizer(n_features, min_n, max_n))
+
+
+# ==================== RESPONSE TEMPLATES ====================
+SLOT_PATTERN = re.compile(r'\{(\w+)\}')
+
+
+class ResponseTemplate:
+    """A response with its {slot} placeholders located once, so rendering is a single join.
+
+    Slots with no value are rendered as the placeholder itself.
+    """
+
+    __slots__ = ('text', 'slots', '_parts', '_positions')
+
+    def __init__(self, text: str):
+        self.text = text
+        # re.split with a capture group alternates literal text and slot names: [lit, slot, lit, slot, lit]
+        self._parts = SLOT_PATTERN.split(text)
+        self._positions = tuple(range(1, len(self._parts), 2))
+        self.slots = tuple(self._parts[i] for i in self._positions)
+
+    def render(self, values: Dict[str, Any] = None, prefix: str = '') -> str:
+        if not self._positions:
+            return prefix + self.text
+        parts = list(self._parts)
+        values = values or {}
+        for i in self._positions:
+            value = values.get(parts[i])
+            parts[i] = '{' + parts[i] + '}' if value is None else str(value)
+        return prefix + ''.join(parts)
+
+    def __repr__(self):
+        return f"ResponseTemplate({self.text!r})"
+
+
+def load_domain_responses(path: str, variants: Tuple[str, ...], prefix: str = 'utter_') -> Dict[str, Dict[str, List[ResponseTemplate]]]:
+    """Compile a Rasa domain's `responses:` named utter_<intent>_<variant> into {intent: {variant: [templates]}}.
+
+    Responses that do not end in one of `variants` (e.g. utter_greet) are skipped.
+    Raises on a missing or malformed file.
+    """
+    import yaml
+    with open(path, encoding='utf-8') as f:
+        data = yaml.safe_load(f) or {}
+    table: Dict[str, Dict[str, List[ResponseTemplate]]] = {}
+    # Longest suffix first, so e.g. '_topic_shift' is not mistaken for a shorter variant name
+    suffixes = sorted(variants, key=len, reverse=True)
+    for name, entries in (data.get('responses') or {}).items():
+        if not name.startswith(prefix):
+            continue
+        variant = next((v for v in suffixes if name.endswith('_' + v)), None)
+        intent = name[len(prefix):-len(variant) - 1] if variant else ''
+        if not intent:
+            continue
+        texts = [entry.get('text') if isinstance(entry, dict) else entry for entry in entries or []]
+        templates = [ResponseTemplate(text) for text in texts if isinstance(text, str) and text]
+        if templates:
+            table.setdefault(intent, {})[variant] = templates
+    return table
@@ -0,0 +1,142 @@
+"""
+SQLite rate-limit storage for Flask-Limiter (the `limits` package), shared by every worker on a host.
+
+Importing this module registers the `sqlite://` scheme with `limits`, so
+RATELIMIT_STORAGE_URI=sqlite:////dev/shm/chatbot-ratelimits.db works like
+memory:// or redis://. All gunicorn workers on the host then count against
+the same counters. Put the file on tmpfs (/dev/shm) to keep it in shared
+memory. Use redis:// instead when several hosts must share limits.
+
+Supports the fixed-window, fixed-window-elastic-expiry and
+sliding-window-counter strategies. A sliding window check-and-increment runs
+in one IMMEDIATE transaction, so it is exact across processes. Expired counters are deleted as writes go by, so the table
+holds at most two rows per active key and limit.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Tuple
+
+from limits.storage import SlidingWindowCounterSupport, Storage
+from limits.storage.base import TimestampedSlidingWindow
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID"""
+INCR_QUERY = """INSERT INTO counters (key, count, expires_at) VALUES (?1, ?2, ?3 + ?4)
+    ON CONFLICT (key) DO UPDATE SET count = CASE WHEN expires_at <= ?3 THEN excluded.count ELSE count + excluded.count END,
+                                    expires_at = CASE WHEN expires_at <= ?3 OR ?5 THEN excluded.expires_at ELSE expires_at END
+    RETURNING count"""
+DECR_QUERY = """UPDATE counters SET count = max(count - ?2, 0) WHERE key = ?1 AND expires_at > ?3 RETURNING count"""
+GET_QUERY = """SELECT count, expires_at FROM counters WHERE key = ? AND expires_at > ?"""
+PURGE_QUERY = """DELETE FROM counters WHERE expires_at <= ?"""
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """Counters in a WAL-mode SQLite file; one connection per thread and process."""
+
+    STORAGE_SCHEME = ['sqlite']
+    PURGE_EVERY = 1000
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        # sqlite:///relative/path.db or sqlite:////absolute/path.db, as in SQLAlchemy URLs
+        self.path = uri.split(':///', 1)[1] if ':///' in uri else ''
+        if not self.path:
+            raise ValueError(f"Rate-limit storage URI needs a file path, e.g. sqlite:////dev/shm/ratelimits.db (got {uri})")
+        self.timeout = float(options.get('timeout', 5.0))
+        self._local = threading.local()
+        self._writes = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._connection().execute(SCHEMA)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections must not cross a fork, so they are keyed by pid as well as thread
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _maybe_purge(self, connection: sqlite3.Connection, now: float):
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            connection.execute(PURGE_QUERY, (now,))
+
+    def incr(self, key: str, expiry: float, elastic_expiry: bool = False, amount: int = 1) -> int:
+        # elastic_expiry (fixed-window-elastic-expiry) pushes the window's end back on every hit
+        connection = self._connection()
+        now = time.time()
+        count = connection.execute(INCR_QUERY, (key, amount, now, expiry, elastic_expiry)).fetchone()[0]
+        self._maybe_purge(connection, now)
+        return count
+
+    def decr(self, key: str, amount: int = 1) -> int:
+        row = self._connection().execute(DECR_QUERY, (key, amount, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get(self, key: str) -> int:
+        row = self._connection().execute(GET_QUERY, (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        row = self._connection().execute(GET_QUERY, (key, now)).fetchone()
+        return row[1] if row else now
+
+    def clear(self, key: str) -> None:
+        self._connection().execute('DELETE FROM counters WHERE key = ?', (key,))
+
+    def reset(self) -> int:
+        return self._connection().execute('DELETE FROM counters').rowcount
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        connection = self._connection()
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        # The write lock is taken up front, so the weighted count cannot change between the check and the increment
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            previous_count, previous_ttl, current_count, _ = self._window(connection, previous_key, current_key, expiry, now)
+            acquired = int(previous_count * previous_ttl / expiry + current_count) + amount <= limit
+            if acquired:
+                connection.execute(INCR_QUERY, (current_key, amount, now, 2 * expiry, False)).fetchone()
+                self._maybe_purge(connection, now)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return acquired
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        return self._window(self._connection(), previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        for window_key in self.sliding_window_keys(key, expiry, time.time()):
+            self.clear(window_key)
+
+    @staticmethod
+    def _window(connection: sqlite3.Connection, previous_key: str, current_key: str, expiry: int, now: float) -> Tuple[int, float, int, float]:
+        previous = connection.execute(GET_QUERY, (previous_key, now)).fetchone()
+        current = connection.execute(GET_QUERY, (current_key, now)).fetchone()
+        previous_count = previous[0] if previous else 0
+        # Same weighting as limits' MemoryStorage: the previous window counts for the part of it still inside the sliding window
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current[0] if current else 0, current_ttl
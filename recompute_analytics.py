@@ -0,0 +1,25 @@
+"""
+Recompute the pre-aggregated analytics counters (Stats / IntentStat nodes) exactly from the graph.
+
+/api/analytics/summary reads counters that the app maintains incrementally.
+Run this after bulk imports, deletes or relabelling, or on a schedule to
+correct any drift. Counter deltas that other app processes have not flushed
+yet (at most ANALYTICS_FLUSH_INTERVAL seconds' worth) are added on top.
+
+Usage: python recompute_analytics.py
+"""
+
+import json
+
+from app import components
+
+
+def main():
+    try:
+        print(json.dumps(components.neo4j_manager.recompute_analytics(), indent=2))
+    finally:
+        components.close()
+
+
+if __name__ == '__main__':
+    main()
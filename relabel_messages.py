@@ -0,0 +1,99 @@
+"""
+Re-run intent classification over every stored user Message and write back intent/confidence.
+
+Pages through Message nodes in message_id order (keyset pagination on the
+message_id_unique index), classifies chunks across a process pool with
+classify_batch, and writes each chunk back in one UNWIND transaction. Chunks
+are written in read order, so the logged checkpoint can be passed to --after
+to resume an interrupted run.
+
+Usage: python relabel_messages.py [--workers 4] [--page-size 10000] [--chunk-size 2000] [--after msg_xxx] [--dry-run]
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+
+from app import components, build_intent_classifier
+
+logger = logging.getLogger('relabel_messages')
+
+_classifier = None
+
+
+def _init_worker():
+    global _classifier
+    _classifier = build_intent_classifier()
+
+
+def _classify_chunk(texts):
+    return [(result['intent'], result['confidence']) for result in _classifier.classify_batch(texts)]
+
+
+def relabel(manager, workers: int, page_size: int, chunk_size: int, after: str = '', dry_run: bool = False) -> int:
+    pool = multiprocessing.Pool(workers, initializer=_init_worker) if workers > 0 else None
+    if pool is None:
+        _init_worker()
+    pending = deque()
+    processed = 0
+    started = time.perf_counter()
+
+    def write_oldest():
+        nonlocal processed
+        message_ids, labels = pending.popleft()
+        labels = labels.get() if pool else labels
+        rows = [{'message_id': message_id, 'intent': intent, 'confidence': confidence} for message_id, (intent, confidence) in zip(message_ids, labels)]
+        if not dry_run:
+            manager.write_message_labels(rows)
+        processed += len(rows)
+        rate = processed / max(time.perf_counter() - started, 1e-9)
+        logger.info(f"{processed} messages relabelled ({rate:.0f}/s), checkpoint {message_ids[-1]}")
+
+    try:
+        while True:
+            page = manager.fetch_user_messages_page(after, page_size)
+            if not page:
+                break
+            after = page[-1]['message_id']
+            for start in range(0, len(page), chunk_size):
+                chunk = page[start:start + chunk_size]
+                texts = [row['text'] for row in chunk]
+                labels = pool.apply_async(_classify_chunk, (texts,)) if pool else _classify_chunk(texts)
+                pending.append(([row['message_id'] for row in chunk], labels))
+                # Bound the work in flight so memory stays flat however many messages there are
+                while len(pending) > max(workers, 1) * 2:
+                    write_oldest()
+        while pending:
+            write_oldest()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='classifier processes (0 classifies in this process)')
+    parser.add_argument('--page-size', type=int, default=10000, help='messages read per Neo4j query')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='messages per classify task and per UNWIND write')
+    parser.add_argument('--after', default='', help='resume after this message_id (a logged checkpoint)')
+    parser.add_argument('--dry-run', action='store_true', help='classify without writing back')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        total = relabel(components.neo4j_manager, args.workers, args.page_size, args.chunk_size, args.after, args.dry_run)
+        if not args.dry_run:
+            # Intents changed in place, so the incrementally maintained IntentStat counts are stale
+            components.neo4j_manager.recompute_analytics()
+    finally:
+        components.close()
+    logger.info(f"Done: {total} messages in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+// Schema objects are applied by migrations.py (migrations 1 and 4); prefer `python migrations.py`.
 // Create unique constraints
 CREATE CONSTRAINT session_id_unique IF NOT EXISTS 
 FOR (s:Session) REQUIRE s.session_id IS UNIQUE;
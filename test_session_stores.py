@@ -0,0 +1,197 @@
+"""
+The SessionStore contract, run against the in-memory and SQLite backends:
+session ids, turns, history paging and cursors, expiry and the archive.
+
+Run with: python -m pytest -q
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import Config, InMemorySessionStore, SessionArchive, SessionLifecycleManager, SessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    store = InMemorySessionStore() if request.param == 'memory' else SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def archive(store, tmp_path):
+    store.archive = SessionArchive(str(tmp_path / 'archive'), 'gzip')
+    return store.archive
+
+
+def later():
+    # Past SESSION_TIMEOUT_HOURS for everything written during the test
+    return datetime.now(timezone.utc) + timedelta(hours=Config.SESSION_TIMEOUT_HOURS + 1)
+
+
+def save_turns(store, session_id, count, start=0):
+    for i in range(start, start + count):
+        store.save_turn(session_id, f"where is order {i}", f"reply {i}", intent='order_status', bot_intent='response_to_order_status', topic='order_status')
+
+
+def all_pages(store, session_id, limit):
+    pages, cursor = [], None
+    while True:
+        messages, cursor = store.get_history_page(session_id, limit, cursor)
+        pages.insert(0, messages)
+        if cursor is None:
+            return [message for page in pages for message in page]
+
+
+def texts(messages):
+    return [message['text'] for message in messages]
+
+
+def test_issued_ids_are_signed_and_not_stored(store):
+    session_ids = store.create_sessions(3)
+    assert len(set(session_ids)) == 3
+    assert all(SessionStore.valid_session_id(sid) and SessionStore.issued_session_id(sid) for sid in session_ids)
+    assert all(store.get_session_metadata(sid) is None for sid in session_ids)
+    assert not SessionStore.issued_session_id('session_0123456789abcdef0123456789abcdef')
+    assert SessionStore.valid_session_id('session_0123456789abcdef')
+
+
+def test_sessions_with_a_user_are_stored_up_front(store):
+    session_id = store.create_session(user_id='u1')
+    metadata = store.get_session_metadata(session_id)
+    assert metadata['session_id'] == session_id
+    assert metadata['interaction_count'] == 0 and metadata['status'] == 'active'
+    assert store.get_analytics()['total_sessions'] == 1
+
+
+def test_save_turn_stores_both_messages_in_order(store):
+    session_id = store.create_session()
+    saved = store.save_turn(session_id, 'where is my order 1234', 'It shipped', intent='order_status', entities={'order_number': '1234'}, confidence=0.9, bot_intent='response_to_order_status', bot_confidence=0.95, topic='order_status')
+    assert saved['status'] == 'added'
+    messages, metadata = store.get_turn_context(session_id, 5)
+    assert [(m['message_id'], m['sender']) for m in messages] == [(saved['user_message_id'], 'user'), (saved['bot_message_id'], 'bot')]
+    assert messages[0]['entities'] == {'order_number': '1234'}
+    assert messages[0]['timestamp'] < messages[1]['timestamp']
+    assert metadata['interaction_count'] == 2
+    assert metadata['user_intent'] == 'order_status' and metadata['topics_discussed'] == ['order_status']
+    assert store.get_analytics()['total_messages'] == 2
+
+
+def test_turn_context_is_the_latest_window(store):
+    session_id = store.create_session()
+    save_turns(store, session_id, 4)
+    messages, _ = store.get_turn_context(session_id, 3)
+    assert texts(messages) == ['reply 2', 'where is order 3', 'reply 3']
+
+
+def test_history_pages_walk_back_to_the_first_message(store):
+    session_id = store.create_session()
+    save_turns(store, session_id, 7)
+    first, cursor = store.get_history_page(session_id, 4)
+    assert texts(first) == ['where is order 5', 'reply 5', 'where is order 6', 'reply 6']
+    assert cursor is not None
+    assert texts(all_pages(store, session_id, 4)) == texts(store.iter_session_messages(session_id))
+    assert len(all_pages(store, session_id, 4)) == 14
+
+
+def test_cursor_timestamps_compare_as_instants(store):
+    session_id = store.create_session()
+    save_turns(store, session_id, 3)
+    messages, _ = store.get_history_page(session_id, 2)
+    expected, _ = store.get_history_page(session_id, 2, SessionStore.encode_cursor(messages[0]))
+    # The same position as Neo4j DateTime text (nanoseconds, Z) must page the same way
+    moment = SessionStore._parse_timestamp(messages[0]['timestamp'])
+    neo4j_text = moment.strftime('%Y-%m-%dT%H:%M:%S.%f') + '000Z'
+    page, _ = store.get_history_page(session_id, 2, SessionStore.encode_cursor({'timestamp': neo4j_text, 'message_id': messages[0]['message_id']}))
+    assert texts(page) == texts(expected)
+
+
+def test_bad_cursors_are_rejected(store):
+    session_id = store.create_session()
+    for cursor in ('garbage', SessionStore.encode_cursor({'timestamp': 'yesterday', 'message_id': 'm'})):
+        with pytest.raises(ValueError):
+            store.get_history_page(session_id, 5, cursor)
+
+
+def test_idle_sessions_expire_and_a_new_turn_reactivates_them(store):
+    session_id = store.create_session()
+    save_turns(store, session_id, 1)
+    assert store.expire_sessions(datetime.now(timezone.utc) - timedelta(hours=1), 10) == 0
+    assert store.expire_sessions(later(), 10) == 1
+    assert store.get_session_metadata(session_id)['status'] == 'expired'
+    assert [m['session_id'] for m in store.expired_sessions(later(), 10)] == [session_id]
+    save_turns(store, session_id, 1, start=1)
+    assert store.get_session_metadata(session_id)['status'] == 'active'
+    assert store.expired_sessions(later(), 10) == []
+
+
+def test_archived_sessions_read_back_through_history(store, archive):
+    session_id = store.create_session()
+    save_turns(store, session_id, 3)
+    before = texts(store.iter_history(session_id))
+    counts = SessionLifecycleManager(store, archive).run_once(later())
+    assert counts == {'expired': 1, 'archived': 1, 'messages': 6}
+    assert store.get_session_metadata(session_id)['status'] == 'archived'
+    assert store.get_message_page(session_id, 10) == ([], None)
+    assert texts(store.iter_history(session_id)) == before
+    assert texts(all_pages(store, session_id, 4)) == before
+
+
+def test_a_returning_user_continues_after_the_archive(store, archive):
+    session_id = store.create_session()
+    save_turns(store, session_id, 2)
+    SessionLifecycleManager(store, archive).run_once(later())
+    save_turns(store, session_id, 2, start=2)
+    expected = [text for i in range(4) for text in (f"where is order {i}", f"reply {i}")]
+    assert texts(store.iter_history(session_id)) == expected
+    assert texts(all_pages(store, session_id, 3)) == expected
+    # Archived again: the file keeps the first archival's messages
+    SessionLifecycleManager(store, archive).run_once(later())
+    assert texts(store.iter_history(session_id)) == expected
+
+
+def test_a_session_reactivated_mid_archival_keeps_its_messages(store, archive):
+    session_id = store.create_session()
+    save_turns(store, session_id, 2)
+    archive_session = store.archive_session
+
+    def reactivated_first(sid, before):
+        save_turns(store, sid, 1, start=2)
+        return archive_session(sid, before)
+
+    store.archive_session = reactivated_first
+    assert SessionLifecycleManager(store, archive).run_once(later())['archived'] == 0
+    assert archive.read(session_id, store.get_session_metadata(session_id)['created_at']) == []
+    assert len(list(store.iter_history(session_id))) == 6
+
+
+def test_overlapping_passes_do_not_lose_history(store, archive):
+    # Pass B starts once pass A has read the (still empty) archive file. B must wait for A rather than archive
+    # underneath it, after which A would find no hot messages and remove the file.
+    session_id = store.create_session()
+    save_turns(store, session_id, 3)
+    first, second = SessionLifecycleManager(store, archive), SessionLifecycleManager(store, archive)
+    read = archive.read
+    overlapping = {}
+
+    def read_while_b_starts(*args):
+        messages = read(*args)
+        if 'b' not in overlapping:
+            overlapping['b'] = threading.Thread(target=lambda: overlapping.setdefault('counts', second.run_once(later())))
+            overlapping['b'].start()
+            time.sleep(0.2)
+            overlapping['waited'] = overlapping['b'].is_alive()
+        return messages
+
+    archive.read = read_while_b_starts
+    assert first.run_once(later())['messages'] == 6
+    overlapping['b'].join(5.0)
+    archive.read = read
+    assert overlapping['waited']
+    assert overlapping['counts']['messages'] == 0
+    history, cursor = store.get_history_page(session_id, 50)
+    assert len(history) == 6 and cursor is None
+    assert len(list(store.iter_history(session_id))) == 6
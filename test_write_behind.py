@@ -0,0 +1,155 @@
+"""
+WriteBehindQueue: the reader/commit gate, the pending overlay and dropped batches.
+
+Run with: python -m pytest -q
+"""
+
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app import AnalyticsCounters, Config, Neo4jSessionManager, SessionContextCache, SessionStore, WriteBehindQueue
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def row(session_id, text='hi', intent='greet'):
+    return SessionStore._message_row(session_id, f"msg_{uuid.uuid4().hex[:12]}", 'user', text, intent, None, 0.9, datetime.now(timezone.utc))
+
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def make(flush_fn, **kwargs):
+        queues.append(WriteBehindQueue(flush_fn, flush_interval=0.02, **kwargs))
+        return queues[-1]
+
+    yield make
+    for q in queues:
+        q.close(timeout=2.0)
+
+
+def manager_with(write_behind):
+    # The write-behind paths of the Neo4j manager never reach the driver, so it is built without one
+    manager = Neo4jSessionManager.__new__(Neo4jSessionManager)
+    manager.write_behind = write_behind
+    manager.context_cache = SessionContextCache()
+    manager.analytics = AnalyticsCounters()
+    return manager
+
+
+def test_commit_waits_for_open_readers(make_queue):
+    flushed = []
+    q = make_queue(lambda messages, updates: flushed.append(messages))
+    with q.reading():
+        q.submit('s1', [row('s1')])
+        time.sleep(0.2)
+        assert flushed == []
+        assert len(q.pending('s1')) == 1
+    assert wait_until(lambda: flushed)
+    assert wait_until(lambda: not q.pending('s1'))
+
+
+def test_readers_wait_for_a_commit_and_then_see_the_batch_gone(make_queue):
+    entered, release = threading.Event(), threading.Event()
+
+    def flush(messages, updates):
+        entered.set()
+        release.wait(5.0)
+
+    q = make_queue(flush)
+    q.submit('s1', [row('s1')])
+    assert entered.wait(5.0)
+    seen = []
+
+    def reader():
+        with q.reading():
+            seen.append(q.pending('s1'))
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    time.sleep(0.2)
+    assert seen == []
+    release.set()
+    thread.join(5.0)
+    assert seen == [[]]
+
+
+def test_pending_overlay_skips_rows_already_in_neo4j(make_queue):
+    release = threading.Event()
+    q = make_queue(lambda messages, updates: release.wait(5.0))
+    manager = manager_with(q)
+    first, second = row('s1', 'one'), row('s1', 'two')
+    q.submit('s1', [first, second], {'session_id': 's1', 'intent': 'greet', 'topic': 'greet'})
+    # Mid-flush, the first row is already in Neo4j and still in pending()
+    stored = [SessionStore._row_to_message(first)]
+    metadata = dict(SessionStore._new_session_metadata('s1'), interaction_count=1)
+    messages, merged = manager._apply_pending_writes('s1', stored, metadata, num_messages=10)
+    release.set()
+    assert [m['message_id'] for m in messages] == [first['message_id'], second['message_id']]
+    assert merged['interaction_count'] == 2
+    assert merged['user_intent'] == 'greet' and merged['topics_discussed'] == ['greet']
+
+
+def test_pending_overlay_stands_in_for_an_unwritten_session(make_queue):
+    release = threading.Event()
+    q = make_queue(lambda messages, updates: release.wait(5.0))
+    manager = manager_with(q)
+    queued = row('s1')
+    q.submit('s1', [queued])
+    _, metadata = manager._apply_pending_writes('s1', None, None)
+    release.set()
+    assert metadata['interaction_count'] == 1
+    assert metadata['created_at'] == queued['timestamp'].isoformat()
+
+
+def test_failed_flushes_drop_the_batch(make_queue, monkeypatch):
+    monkeypatch.setattr(Config, 'WRITE_BEHIND_MAX_RETRIES', 2)
+    attempts, dropped = [], []
+
+    def flush(messages, updates):
+        attempts.append(len(messages))
+        raise RuntimeError('neo4j down')
+
+    q = make_queue(flush, on_drop=dropped.append)
+    q.submit('s1', [row('s1'), row('s1')])
+    assert wait_until(lambda: dropped)
+    assert attempts == [2, 2]
+    assert q.dropped_messages == 2
+    assert q.pending('s1') == []
+    assert [item['session_id'] for item in dropped[0]] == ['s1']
+
+
+def test_dropped_messages_come_out_of_the_analytics_and_the_cache(make_queue, monkeypatch):
+    monkeypatch.setattr(Config, 'WRITE_BEHIND_MAX_RETRIES', 1)
+    fail = threading.Event()
+
+    def flush(messages, updates):
+        fail.wait(5.0)
+        raise RuntimeError('neo4j down')
+
+    manager = manager_with(None)
+    manager.write_behind = make_queue(flush, on_drop=manager._forget_dropped_writes)
+    manager.context_cache.put('s1', [], SessionStore._new_session_metadata('s1'))
+    manager.save_turn('s1', 'where is my order', 'it shipped', intent='order_status', bot_intent='response_to_order_status', topic='order_status')
+    counted = manager.analytics.pending()
+    assert counted['messages'] == 2
+    assert manager.context_cache.get_messages('s1', 2) is not None
+    fail.set()
+    assert wait_until(lambda: manager.write_behind.dropped_messages == 2)
+    assert wait_until(lambda: manager.analytics.pending()['messages'] == 0)
+    left = manager.analytics.pending()
+    assert left['intents'] == {}
+    assert sum(bucket['messages'] for bucket in left['buckets'].values()) == 0
+    assert manager.context_cache.get_messages('s1', 2) is None
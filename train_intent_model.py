@@ -0,0 +1,51 @@
+"""
+Train the linear intent model from nlu.yml and save it as a compressed .npz artifact.
+
+The Flask/ASGI apps load it at startup when INTENT_CLASSIFIER=linear.
+
+Usage: python train_intent_model.py [--data nlu.yml] [--output models/intent_model.npz] [--holdout 0.2]
+"""
+
+import argparse
+import os
+import random
+import time
+
+from nlu_engine import LinearIntentModel, load_training_examples
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def accuracy(model: LinearIntentModel, examples) -> float:
+    return sum(1 for text, intent in examples if model.predict(text)[0] == intent) / max(len(examples), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data', default=os.path.join(BASE_DIR, 'nlu.yml'))
+    parser.add_argument('--output', default=os.getenv('INTENT_MODEL_PATH', os.path.join(BASE_DIR, 'models', 'intent_model.npz')))
+    parser.add_argument('--features', type=int, default=2 ** 16, help='hashed feature space size')
+    parser.add_argument('--max-ngram', type=int, default=4)
+    parser.add_argument('--epochs', type=int, default=300)
+    parser.add_argument('--holdout', type=float, default=0.0, help='fraction of examples held out to report accuracy (the saved model uses all of them)')
+    args = parser.parse_args()
+
+    examples = load_training_examples(args.data)
+    print(f"{len(examples)} examples, {len({intent for _, intent in examples})} intents from {args.data}")
+    if args.holdout:
+        shuffled = list(examples)
+        random.Random(13).shuffle(shuffled)
+        split = int(len(shuffled) * (1 - args.holdout))
+        model = LinearIntentModel.train(shuffled[:split], n_features=args.features, max_n=args.max_ngram, epochs=args.epochs)
+        print(f"holdout accuracy: {accuracy(model, shuffled[split:]):.3f} on {len(shuffled) - split} examples")
+
+    started = time.perf_counter()
+    model = LinearIntentModel.train(examples, n_features=args.features, max_n=args.max_ngram, epochs=args.epochs)
+    print(f"trained in {time.perf_counter() - started:.1f}s, training accuracy {accuracy(model, examples):.3f}")
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    model.save(args.output)
+    print(f"saved {args.output} ({os.path.getsize(args.output) / 1024:.0f} KiB)")
+
+
+if __name__ == '__main__':
+    main()